@@ -1,5 +1,23 @@
 """AI services for budget processing"""
-from .pdf_extractor import PDFExtractor
-from .budget_enhancer import BudgetEnhancer
+import importlib
 
-__all__ = ['PDFExtractor', 'BudgetEnhancer']
+# Imported on first access: the extractor and enhancer pull in pdfplumber and numpy,
+# which routes needing only usage accounting should not pay for at startup
+_EXPORTS = {
+    'AIGateway': '.gateway', 'AIGatewayError': '.gateway', 'get_gateway': '.gateway',
+    'PDFExtractor': '.pdf_extractor',
+    'BudgetEnhancer': '.budget_enhancer',
+    'AIScheduler': '.scheduler', 'RateLimiter': '.scheduler', 'ai_priority': '.scheduler',
+    'get_scheduler': '.scheduler',
+    'AIUsage': '.usage', 'get_usage_metrics': '.usage',
+}
+
+__all__ = ['AIGateway', 'AIGatewayError', 'get_gateway', 'PDFExtractor', 'BudgetEnhancer',
+           'AIScheduler', 'RateLimiter', 'ai_priority', 'get_scheduler',
+           'AIUsage', 'get_usage_metrics']
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
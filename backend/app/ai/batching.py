@@ -0,0 +1,60 @@
+"""
+Request Batching
+Packs budget items into LLM requests sized to a token budget
+"""
+from typing import Callable, List, Sequence, TypeVar
+
+T = TypeVar('T')
+
+# Rough characters-per-token ratio for Spanish technical text (kept conservative)
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def plan_batches(entries: Sequence[T], input_cost: Callable[[T], int],
+                 output_cost: Callable[[T], int], max_input_tokens: int,
+                 max_output_tokens: int) -> List[List[T]]:
+    """
+    Pack entries, in order, into as few batches as the token budgets allow
+
+    A batch is closed when adding the next entry would exceed either the
+    input or the expected output budget, so large groups of entries are split
+    across batches while small ones share a request. An entry that exceeds a
+    budget on its own still gets a batch of its own.
+
+    Args:
+        entries: Entries to pack
+        input_cost: Estimated prompt tokens of an entry
+        output_cost: Estimated completion tokens of an entry
+        max_input_tokens: Prompt budget per batch, excluding the fixed prompt
+        max_output_tokens: Completion budget per batch
+
+    Returns:
+        List of batches
+    """
+    batches: List[List[T]] = []
+    current: List[T] = []
+    input_total = output_total = 0
+
+    for entry in entries:
+        entry_input = input_cost(entry)
+        entry_output = output_cost(entry)
+
+        if current and (input_total + entry_input > max_input_tokens
+                        or output_total + entry_output > max_output_tokens):
+            batches.append(current)
+            current = []
+            input_total = output_total = 0
+
+        current.append(entry)
+        input_total += entry_input
+        output_total += entry_output
+
+    if current:
+        batches.append(current)
+
+    return batches
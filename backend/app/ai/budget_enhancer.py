@@ -2,30 +2,78 @@
 AI Budget Enhancer
 Uses AI to improve, validate and enrich budget data
 """
-import os
+import asyncio
 import json
-from typing import Optional, List, Dict, Any
-from anthropic import Anthropic
+import logging
+import os
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator, Tuple
 from ..models.budget import Budget, BudgetChapter, BudgetItem
+from ..metrics import record_cache_lookups, stage
+from ..cache.description_memo import DescriptionMemo
+from ..cache.lru import LRUCache
+from ..validation.engine import Finding, ValidationEngine, ValidationReport
+from ..validation.incremental import IncrementalValidator
+from ..validation.merkle import hash_budget
+from .batching import estimate_tokens, plan_batches
+from .gateway import AIGateway, get_gateway
+from .summary import BudgetSummarizer
+from .usage import record_cache_hits
+from .versions import ENHANCEMENT_MODEL, ENHANCEMENT_PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
 
 
 class BudgetEnhancer:
     """Enhance budget data using AI"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    MODEL = ENHANCEMENT_MODEL
+
+    # Bumped in .versions whenever the enhancement prompt changes so memoized descriptions are invalidated
+    PROMPT_VERSION = ENHANCEMENT_PROMPT_VERSION
+
+    def __init__(self, api_key: Optional[str] = None, gateway: Optional[AIGateway] = None,
+                 concurrency: Optional[int] = None, batch_input_tokens: Optional[int] = None,
+                 batch_output_tokens: Optional[int] = None, memo: Optional[DescriptionMemo] = None,
+                 validation_engine: Optional[ValidationEngine] = None, review_limit: Optional[int] = None,
+                 summarizer: Optional[BudgetSummarizer] = None,
+                 validator: Optional[IncrementalValidator] = None, review_cache_entries: Optional[int] = None):
         """
         Initialize budget enhancer
 
         Args:
-            api_key: Anthropic API key (if None, reads from env)
+            api_key: Anthropic API key (if None, uses the shared gateway)
+            gateway: AI gateway (if None, uses the shared gateway)
+            concurrency: Requests in flight at the same time per budget
+                (if None, reads AI_ENHANCE_CONCURRENCY from env)
+            batch_input_tokens: Estimated item tokens sent per request
+                (if None, reads AI_BATCH_INPUT_TOKENS from env)
+            batch_output_tokens: Completion budget per request
+                (if None, reads AI_BATCH_OUTPUT_TOKENS from env)
+            memo: Memo of enhanced descriptions (if None, a default memo is created)
+            validation_engine: Deterministic validation engine (if None, a default one is created)
+            review_limit: Flagged items sent to AI for review
+                (if None, reads AI_VALIDATION_REVIEW_LIMIT from env)
+            summarizer: Budget digest builder for review prompts (if None, a default one is created)
+            validator: Incremental validator remembering results between calls
+                (if None, one is created around validation_engine)
+            review_cache_entries: AI verdicts on flagged items remembered
+                (if None, reads AI_REVIEW_CACHE_ENTRIES from env)
         """
-        self.api_key = api_key or os.getenv('ANTHROPIC_API_KEY')
-        if self.api_key:
-            self.client = Anthropic(api_key=self.api_key)
-        else:
-            self.client = None
-
-    def enhance_descriptions(self, budget: Budget) -> Budget:
+        if gateway is None:
+            gateway = AIGateway(api_key=api_key) if api_key else get_gateway()
+        self.gateway = gateway
+        self.concurrency = concurrency or int(os.getenv('AI_ENHANCE_CONCURRENCY', 8))
+        self.batch_input_tokens = batch_input_tokens or int(os.getenv('AI_BATCH_INPUT_TOKENS', 6000))
+        self.batch_output_tokens = batch_output_tokens or int(os.getenv('AI_BATCH_OUTPUT_TOKENS', 4096))
+        self.memo = memo or DescriptionMemo()
+        self.validator = validator or IncrementalValidator(validation_engine)
+        self.review_limit = review_limit or int(os.getenv('AI_VALIDATION_REVIEW_LIMIT', 40))
+        self.summarizer = summarizer or BudgetSummarizer()
+        # Verdicts by (item hash, finding message): an unchanged item flagged
+        # for the same reason is not sent for review again
+        self.reviews = LRUCache(review_cache_entries or int(os.getenv('AI_REVIEW_CACHE_ENTRIES', 10000)))
+
+    async def enhance_descriptions(self, budget: Budget) -> Budget:
         """
         Improve item descriptions using AI
 
@@ -35,38 +83,145 @@ class BudgetEnhancer:
         Returns:
             Enhanced budget with improved descriptions
         """
-        if not self.client:
-            return budget
-
-        for chapter in budget.chapters:
-            self._enhance_chapter_descriptions(chapter)
+        with stage('enhance'):
+            async for _ in self.iter_enhancements(budget):
+                pass
 
         return budget
 
-    def _enhance_chapter_descriptions(self, chapter: BudgetChapter):
-        """Enhance descriptions in a chapter"""
-        if not chapter.items:
+    async def iter_enhancements(self, budget: Budget) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Improve item descriptions using AI, yielding results as they arrive
+
+        Descriptions already enhanced before are taken from the memo. The
+        remaining items from every chapter and subchapter are packed into
+        requests sized to the token budget, sent concurrently and mapped back
+        by their number within the request, since codes may repeat across
+        chapters. A failed request keeps its items' original descriptions
+        without affecting the others. The budget is updated in place.
+
+        Args:
+            budget: Budget object to enhance
+
+        Yields:
+            'items' events with the enhanced {code, description} pairs of a
+            request (or of the memo), 'progress' events and a final 'summary',
+            whose 'not_enhanced' counts items left as they were because their
+            request failed or the reply left them out
+        """
+        # Items with the same normalized description and unit share one enhancement
+        items_by_key: Dict[str, List[BudgetItem]] = {}
+        for chapter in _walk_chapters(budget.chapters):
+            for item in chapter.items:
+                key = self.memo.make_key(item.description, item.unit, self.MODEL, self.PROMPT_VERSION)
+                items_by_key.setdefault(key, []).append(item)
+
+        summary = {'items': sum(len(items) for items in items_by_key.values()),
+                   'enhanced': 0, 'from_memo': 0, 'requests': 0, 'failed_requests': 0, 'not_enhanced': 0}
+
+        if not self.gateway.enabled or not items_by_key:
+            yield {'event': 'summary', 'data': summary}
             return
 
-        # Prepare items for enhancement
-        items_data = []
-        for item in chapter.items:
-            items_data.append({
-                'code': item.code,
-                'description': item.description,
-                'unit': item.unit
-            })
+        known = await self._memo_get(list(items_by_key))
+        record_cache_hits('description_memo', len(known))
+        record_cache_lookups('description_memo', hits=len(known), misses=len(items_by_key) - len(known))
+        if known:
+            updated = self._apply_enhancements(items_by_key, known)
+            summary['enhanced'] += len(updated)
+            summary['from_memo'] += len(updated)
+            yield {'event': 'items', 'data': {'source': 'memo', 'items': updated}}
+
+        # Only memo misses go to the model, one representative per key
+        batches = plan_batches(
+            [key for key in items_by_key if key not in known],
+            input_cost=lambda key: self._item_input_tokens(items_by_key[key][0]),
+            output_cost=lambda key: self._item_output_tokens(items_by_key[key][0]),
+            max_input_tokens=self.batch_input_tokens,
+            max_output_tokens=self.batch_output_tokens
+        )
+        summary['requests'] = len(batches)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def enhance(batch: List[str]) -> Tuple[List[str], Any]:
+            try:
+                async with semaphore:
+                    return batch, await self._enhance_batch([items_by_key[key][0] for key in batch])
+            except Exception as e:
+                return batch, e
+
+        tasks = [asyncio.ensure_future(enhance(batch)) for batch in batches]
+        done = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                batch, result = await next_result
+                done += 1
+
+                if isinstance(result, Exception):
+                    logger.warning("Error enhancing %s descriptions: %s", len(batch), result)
+                    summary['failed_requests'] += 1
+                    summary['not_enhanced'] += sum(len(items_by_key[key]) for key in batch)
+                else:
+                    learned = {batch[position]: description for position, description in result.items()}
+                    missing = [key for key in batch if key not in learned]
+                    if missing:
+                        logger.warning("AI reply left out %s of %s descriptions", len(missing), len(batch))
+                        summary['not_enhanced'] += sum(len(items_by_key[key]) for key in missing)
+                    updated = self._apply_enhancements(items_by_key, learned)
+                    summary['enhanced'] += len(updated)
+                    await self._memo_set(learned)
+                    yield {'event': 'items', 'data': {'source': 'ai', 'items': updated}}
+
+                yield {'event': 'progress', 'data': {
+                    'done': done,
+                    'total': len(batches),
+                    'percent': round(100 * done / len(batches), 1)
+                }}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        yield {'event': 'summary', 'data': summary}
+
+    def _apply_enhancements(self, items_by_key: Dict[str, List[BudgetItem]],
+                            descriptions: Dict[str, str]) -> List[Dict[str, str]]:
+        """Set enhanced descriptions on every item of each key and list the changes"""
+        updated = []
+        for key, description in descriptions.items():
+            for item in items_by_key[key]:
+                item.description = description
+                updated.append({'code': item.code, 'description': description})
+        return updated
+
+    async def _enhance_batch(self, items: List[BudgetItem]) -> Dict[str, str]:
+        """
+        Ask the AI for improved descriptions of a batch of items
+
+        A reply that cannot be parsed (usually one cut off at max_tokens) is
+        retried as two smaller batches.
+
+        Returns:
+            Mapping of position in items to enhanced description
+        """
+        # Prepare items for enhancement, one compact object per line, numbered
+        # since codes may repeat across chapters
+        items_json = "[\n" + ",\n".join(
+            json.dumps({'id': number, **self._item_data(item)}, ensure_ascii=False)
+            for number, item in enumerate(items, start=1)
+        ) + "\n]"
 
         # Ask AI to improve descriptions
         prompt = f"""Mejora las siguientes descripciones de partidas de presupuesto de construcción.
 Hazlas más claras, profesionales y detalladas, pero mantén la información técnica esencial.
 
 Partidas:
-{json.dumps(items_data, indent=2, ensure_ascii=False)}
+{items_json}
 
-Responde SOLO con un JSON array con el mismo formato, incluyendo las descripciones mejoradas:
+Responde SOLO con un JSON array con el mismo formato y el mismo "id" de cada partida,
+incluyendo las descripciones mejoradas:
 [
   {{
+    "id": 1,
     "code": "código",
     "description": "descripción mejorada",
     "unit": "unidad"
@@ -74,155 +229,201 @@ Responde SOLO con un JSON array con el mismo formato, incluyendo las descripcion
 ]
 """
 
+        # Bulk rewriting yields to interactive calls under the shared rate limits
+        response_text = await self.gateway.complete(
+            prompt, max_tokens=self.batch_output_tokens, model=self.MODEL, priority='batch'
+        )
+
+        # Extract JSON
         try:
-            response = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=2048,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }]
+            enhanced_items = json.loads(self._extract_json(response_text))
+        except ValueError:
+            if len(items) == 1:
+                raise
+            middle = len(items) // 2
+            first, second = await asyncio.gather(
+                self._enhance_batch(items[:middle]),
+                self._enhance_batch(items[middle:])
             )
+            return {**first, **{middle + position: description for position, description in second.items()}}
+
+        enhanced = {}
+        for entry in enhanced_items:
+            try:
+                position = int(entry.get('id')) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= position < len(items) and entry.get('description'):
+                enhanced[position] = entry['description']
+        return enhanced
+
+    async def _memo_get(self, keys: List[str]) -> Dict[str, str]:
+        """Bulk memo lookup, treating memo errors as misses"""
+        try:
+            return await asyncio.to_thread(self.memo.get_many, keys)
+        except Exception as e:
+            logger.warning("Description memo read failed: %s", e)
+            return {}
 
-            response_text = response.content[0].text
-
-            # Extract JSON
-            if "```json" in response_text:
-                start = response_text.index("```json") + 7
-                end = response_text.index("```", start)
-                json_text = response_text[start:end].strip()
-            elif "```" in response_text:
-                start = response_text.index("```") + 3
-                end = response_text.index("```", start)
-                json_text = response_text[start:end].strip()
-            else:
-                json_text = response_text.strip()
+    async def _memo_set(self, entries: Dict[str, str]):
+        """Store enhanced descriptions, ignoring memo errors"""
+        try:
+            await asyncio.to_thread(self.memo.set_many, entries)
+        except Exception as e:
+            logger.warning("Description memo write failed: %s", e)
 
-            enhanced_items = json.loads(json_text)
+    def _item_data(self, item: BudgetItem) -> Dict[str, str]:
+        """Fields of an item sent for enhancement"""
+        return {
+            'code': item.code,
+            'description': item.description,
+            'unit': item.unit
+        }
 
-            # Update descriptions
-            for i, enhanced in enumerate(enhanced_items):
-                if i < len(chapter.items):
-                    chapter.items[i].description = enhanced['description']
+    def _item_input_tokens(self, item: BudgetItem) -> int:
+        """Estimated prompt tokens for an item"""
+        return estimate_tokens(json.dumps(self._item_data(item), ensure_ascii=False))
 
-        except Exception as e:
-            print(f"Error enhancing descriptions: {e}")
+    def _item_output_tokens(self, item: BudgetItem) -> int:
+        """Estimated completion tokens for an item (enhanced texts run about twice as long)"""
+        return estimate_tokens(item.code + item.unit) + 2 * estimate_tokens(item.description) + 15
 
-        # Recursively enhance subchapters
-        for subchapter in chapter.subchapters:
-            self._enhance_chapter_descriptions(subchapter)
-
-    def validate_budget(self, budget: Budget) -> Dict[str, Any]:
+    async def validate_budget(self, budget: Budget, check_duplicates: Optional[bool] = None) -> Dict[str, Any]:
         """
         Validate budget and find potential issues
 
+        Every item is checked by the deterministic validation engine. When AI
+        is available, only the items it flags are sent for review, together
+        with a bounded-size statistical digest of the budget for context.
+
+        Items and chapters are hashed so that revalidating an edited budget
+        only redoes the work for what changed: an identical budget reuses its
+        report, unchanged chapters reuse their duplicate-check signatures and
+        AI verdicts are reused for unchanged items flagged for the same reason.
+
         Args:
             budget: Budget to validate
+            check_duplicates: Whether to look for near-duplicate items
+                (if None, the validation engine's setting applies)
 
         Returns:
             Dictionary with validation results
         """
-        if not self.client:
-            return self._basic_validation(budget)
+        # Hashing and the engine are CPU-bound on large budgets: keep them off the event loop
+        hashes = await asyncio.to_thread(hash_budget, budget)
+        report = await asyncio.to_thread(self.validator.validate, budget, hashes, check_duplicates)
+        result = report.to_dict()
+
+        flagged = report.flagged(self.review_limit)
+        if not self.gateway.enabled or not flagged:
+            return result
+
+        wanted = {(finding.chapter, finding.code) for finding in flagged}
+        items = {}
+        for chapter in hashes.chapters:
+            for item, digest in zip(chapter.chapter.items, chapter.items):
+                if (chapter.chapter.code, item.code) in wanted:
+                    items[(chapter.chapter.code, item.code)] = (item, digest)
+
+        flagged_items = [items[(finding.chapter, finding.code)] for finding in flagged]
+        keys = [(digest, finding.message) for finding, (_, digest) in zip(flagged, flagged_items)]
+        verdicts = [self.reviews.get(key) for key in keys]
+        pending = [position for position, verdict in enumerate(verdicts) if verdict is None]
+        record_cache_hits('validation_review', len(flagged) - len(pending))
+
+        if pending:
+            try:
+                reviewed = await self._review_findings(
+                    budget, report, [(flagged[position], flagged_items[position][0]) for position in pending]
+                )
+            except Exception as e:
+                logger.warning("Error reviewing validation findings: %s", e)
+                reviewed = {}
+            for number, position in enumerate(pending, start=1):
+                if number in reviewed:
+                    verdicts[position] = reviewed[number]
+                    self.reviews.set(keys[position], reviewed[number])
+
+        for finding, verdict in zip(flagged, verdicts):
+            if verdict is None:
+                continue
+            if verdict["error"]:
+                result["errors"].append(f"{finding.code}: {verdict['reason']}")
+            if verdict["suggestion"]:
+                result["suggestions"].append(f"{finding.code}: {verdict['suggestion']}")
+        result["is_valid"] = len(result["errors"]) == 0
+        return result
+
+    async def _review_findings(self, budget: Budget, report: ValidationReport,
+                               findings: List[Tuple[Finding, BudgetItem]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Ask AI whether flagged items are real errors
+
+        Args:
+            budget: Budget the findings belong to
+            report: Validation report, used for the budget digest
+            findings: Findings to review with their items, numbered from 1 in order
 
-        # Prepare budget summary for AI
-        summary = self._budget_to_summary(budget)
+        Returns:
+            Verdict ({"error", "reason", "suggestion"}) by finding number
+        """
+        lines = []
+        for number, (finding, item) in enumerate(findings, start=1):
+            lines.append(
+                f"[{number}] {finding.message}\n"
+                f"    {item.code}: {item.description} | "
+                f"{float(item.quantity)} {item.unit} x {float(item.price)} = {float(item.total)}"
+            )
+        findings_text = "\n".join(lines)
+        summary = await asyncio.to_thread(self.summarizer.summarize, budget, report)
 
-        prompt = f"""Analiza este presupuesto y detecta posibles problemas o inconsistencias:
+        prompt = f"""Revisa estas partidas que la validación automática ha marcado en un presupuesto:
 
 {summary}
 
-Busca:
-1. Precios inusuales o sospechosos (muy altos o muy bajos)
-2. Descripciones incompletas o poco claras
-3. Unidades incorrectas o inconsistentes
-4. Partidas duplicadas
-5. Errores de cálculo
-6. Falta de información importante
+Partidas marcadas:
+{findings_text}
+
+Para cada partida, decide si es un error real (precio, cantidad o unidad incorrectos,
+descripción incompleta) o si es razonable para ese concepto.
 
-Responde en JSON con este formato:
+Responde en JSON con este formato, con una entrada por número de partida:
 {{
-  "is_valid": true/false,
-  "warnings": ["lista de advertencias"],
-  "errors": ["lista de errores"],
-  "suggestions": ["lista de sugerencias de mejora"]
+  "findings": [
+    {{"id": 1, "error": true, "reason": "motivo", "suggestion": "corrección o mejora concreta, o vacío"}}
+  ]
 }}
 """
 
-        try:
-            response = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=2048,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }]
-            )
-
-            response_text = response.content[0].text
-
-            # Extract JSON
-            if "```json" in response_text:
-                start = response_text.index("```json") + 7
-                end = response_text.index("```", start)
-                json_text = response_text[start:end].strip()
-            elif "```" in response_text:
-                start = response_text.index("```") + 3
-                end = response_text.index("```", start)
-                json_text = response_text[start:end].strip()
-            else:
-                json_text = response_text.strip()
-
-            return json.loads(json_text)
-
-        except Exception as e:
-            print(f"Error validating budget: {e}")
-            return self._basic_validation(budget)
-
-    def _budget_to_summary(self, budget: Budget) -> str:
-        """Convert budget to text summary for AI analysis"""
-        lines = []
-        lines.append(f"Título: {budget.metadata.title}")
-        lines.append(f"Total: {float(budget.total):.2f} {budget.metadata.currency}")
-        lines.append(f"Partidas: {budget.total_items}")
-        lines.append("\nCapítulos:")
-
-        for chapter in budget.chapters:
-            lines.append(f"\n{chapter.code} - {chapter.title} (Total: {float(chapter.total):.2f})")
-            for item in chapter.items[:10]:  # Limit to first 10 items per chapter
-                lines.append(
-                    f"  {item.code}: {item.description} | "
-                    f"{float(item.quantity)} {item.unit} x {float(item.price)} = {float(item.total)}"
-                )
-            if len(chapter.items) > 10:
-                lines.append(f"  ... y {len(chapter.items) - 10} partidas más")
-
-        return "\n".join(lines)
-
-    def _basic_validation(self, budget: Budget) -> Dict[str, Any]:
-        """Basic validation without AI"""
-        warnings = []
-        errors = []
-
-        # Check for empty budget
-        if not budget.chapters:
-            errors.append("El presupuesto no tiene capítulos")
-
-        # Check for chapters without items
-        for chapter in budget.chapters:
-            if not chapter.items and not chapter.subchapters:
-                warnings.append(f"Capítulo '{chapter.title}' está vacío")
-
-            # Check for zero prices
-            for item in chapter.items:
-                if item.price == 0:
-                    warnings.append(f"Partida '{item.code}' tiene precio 0")
-                if item.quantity == 0:
-                    warnings.append(f"Partida '{item.code}' tiene cantidad 0")
-
-        return {
-            "is_valid": len(errors) == 0,
-            "warnings": warnings,
-            "errors": errors,
-            "suggestions": []
-        }
+        response_text = await self.gateway.complete(prompt, max_tokens=2048)
+        review = json.loads(self._extract_json(response_text))
+
+        verdicts = {}
+        for entry in review.get("findings", []):
+            number = entry.get("id")
+            if isinstance(number, int) and 1 <= number <= len(findings):
+                verdicts[number] = {
+                    "error": bool(entry.get("error")),
+                    "reason": str(entry.get("reason") or ""),
+                    "suggestion": str(entry.get("suggestion") or ""),
+                }
+        return verdicts
+
+    def _extract_json(self, response_text: str) -> str:
+        """Extract the JSON text from a reply that may wrap it in a code block"""
+        if "```json" in response_text:
+            start = response_text.index("```json") + 7
+            end = response_text.index("```", start)
+            return response_text[start:end].strip()
+        if "```" in response_text:
+            start = response_text.index("```") + 3
+            end = response_text.index("```", start)
+            return response_text[start:end].strip()
+        return response_text.strip()
+
+
+def _walk_chapters(chapters: List[BudgetChapter]) -> Iterator[BudgetChapter]:
+    """Yield chapters and all their subchapters, depth first"""
+    for chapter in chapters:
+        yield chapter
+        yield from _walk_chapters(chapter.subchapters)
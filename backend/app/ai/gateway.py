@@ -0,0 +1,252 @@
+"""
+AI Gateway
+Shared asynchronous client for every LLM call made by the application
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import TYPE_CHECKING, Optional, Set
+from .batching import estimate_tokens
+from .scheduler import AIScheduler, get_scheduler
+from .usage import record_call
+from ..metrics.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# The client library is imported when the first client is created, to keep API startup fast
+if TYPE_CHECKING:
+    import httpx
+    from anthropic import AsyncAnthropic
+
+
+class AIGatewayError(Exception):
+    """Raised when an AI call fails after all retries"""
+
+
+class AIGateway:
+    """Pooled, concurrency-limited AI client with retries and timeouts"""
+
+    DEFAULT_MODEL = "claude-3-5-sonnet-20241022"
+
+    # HTTP statuses worth retrying: rate limits, overload and server errors
+    RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None, max_connections: Optional[int] = None,
+                 http_client: Optional['httpx.AsyncClient'] = None,
+                 scheduler: Optional[AIScheduler] = None):
+        """
+        Initialize AI gateway
+
+        Args:
+            api_key: Anthropic API key (if None, reads from env; not needed when
+                AI_STANDIN answers calls locally, except to record them)
+            base_url: API base URL, e.g. a local fake server (if None, reads AI_BASE_URL from env)
+            max_concurrency: Maximum in-flight calls (if None, reads AI_MAX_CONCURRENCY from env)
+            timeout: Seconds allowed per attempt (if None, reads AI_TIMEOUT from env)
+            max_retries: Retries on 429/5xx/network errors (if None, reads AI_MAX_RETRIES from env)
+            max_connections: Size of the HTTP connection pool (if None, reads AI_MAX_CONNECTIONS from env)
+            http_client: Preconfigured httpx client (mainly for tests)
+            scheduler: Rate-limit scheduler (if None, uses the shared scheduler)
+        """
+        self.standin = os.getenv('AI_STANDIN') or None
+        self.api_key = api_key or os.getenv('ANTHROPIC_API_KEY') or (
+            'standin' if self.standin in ('synthesize', 'replay') else None
+        )
+        self.base_url = base_url or os.getenv('AI_BASE_URL') or None
+        self.max_concurrency = max_concurrency or int(os.getenv('AI_MAX_CONCURRENCY', 8))
+        self.timeout = timeout or float(os.getenv('AI_TIMEOUT', 60))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('AI_MAX_RETRIES', 4))
+        self.max_connections = max_connections or int(os.getenv('AI_MAX_CONNECTIONS', 20))
+        self.backoff_base = 0.5
+        self.backoff_cap = 20.0
+
+        self._http_client = http_client
+        self.scheduler = scheduler or get_scheduler()
+        self._client: Optional['AsyncAnthropic'] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Closing of clients left behind by a previous event loop
+        self._closing: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether AI calls can be made"""
+        return bool(self.api_key)
+
+    def preload(self):
+        """Import the client library now, so the first call does not wait for it"""
+        if self.enabled:
+            self._client_classes()
+
+    async def complete(self, prompt: str, max_tokens: int, model: Optional[str] = None,
+                       priority: Optional[str] = None) -> str:
+        """
+        Send a single-turn prompt and return the text of the reply
+
+        Every attempt first waits for the shared rate limits. Every call is
+        accounted (tokens, latency, retries, queue wait) to the request being
+        served and to the usage metrics.
+
+        Args:
+            prompt: User message
+            max_tokens: Maximum tokens to generate
+            model: Model name (if None, uses DEFAULT_MODEL)
+            priority: 'interactive' or 'batch' (if None, uses the current context's)
+
+        Returns:
+            Text of the first content block
+
+        Raises:
+            AIGatewayError: If the gateway is disabled or every attempt failed
+        """
+        if not self.enabled:
+            raise AIGatewayError("AI is not configured")
+
+        client, semaphore = self._ensure_client()
+        APIConnectionError, APIStatusError, APITimeoutError = self._error_classes()
+        model = model or self.DEFAULT_MODEL
+        # Reserve the whole completion budget; what is not used is returned afterwards
+        reserved = estimate_tokens(prompt) + max_tokens
+        attempt = 0
+        queue_wait = 0.0
+        started = time.monotonic()
+
+        with span('ai_call'):
+            while True:
+                queue_wait += await self.scheduler.acquire(reserved, priority)
+                try:
+                    used = 0
+                    try:
+                        async with semaphore:
+                            response = await asyncio.wait_for(
+                                client.messages.create(
+                                    model=model,
+                                    max_tokens=max_tokens,
+                                    messages=[{
+                                        "role": "user",
+                                        "content": prompt
+                                    }]
+                                ),
+                                timeout=self.timeout
+                            )
+                        used = response.usage.input_tokens + response.usage.output_tokens
+                    finally:
+                        # A failed or cancelled attempt gives back its whole reservation
+                        await self.scheduler.settle(reserved, used)
+                    record_call(model, response.usage.input_tokens, response.usage.output_tokens,
+                                time.monotonic() - started, attempt, queue_wait=queue_wait)
+                    return response.content[0].text
+
+                except (APIStatusError, APIConnectionError, APITimeoutError, asyncio.TimeoutError) as e:
+                    if isinstance(e, APIStatusError) and e.status_code == 429:
+                        await self.scheduler.throttle()
+                    if not self._is_retryable(e) or attempt >= self.max_retries:
+                        record_call(model, 0, 0, time.monotonic() - started, attempt, ok=False,
+                                    queue_wait=queue_wait)
+                        raise AIGatewayError(f"AI call failed after {attempt + 1} attempt(s): {e}") from e
+
+                    await asyncio.sleep(self._backoff(attempt, e))
+                    attempt += 1
+
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def _ensure_client(self):
+        """Create the client and semaphore for the running event loop"""
+        loop = asyncio.get_running_loop()
+
+        if self._client is None or self._loop is not loop:
+            if self._client is not None and self._http_client is None:
+                self._close_stale(self._client, self._loop)
+
+            httpx, AsyncAnthropic, standin_transport = self._client_classes()
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            )
+            http_client = self._http_client or httpx.AsyncClient(
+                limits=limits,
+                timeout=self.timeout,
+                # Calls are answered locally when AI_STANDIN is set
+                transport=standin_transport(limits)
+            )
+            self._client = AsyncAnthropic(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client,
+                max_retries=0,
+                timeout=self.timeout
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+
+        return self._client, self._semaphore
+
+    def _close_stale(self, client: 'AsyncAnthropic', loop: Optional[asyncio.AbstractEventLoop]):
+        """Close a client made for another event loop, on that loop while it still runs"""
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+            return
+
+        async def close():
+            try:
+                await client.close()
+            except Exception as e:
+                # Connections of a closed loop cannot shut down cleanly; their sockets go with them
+                logger.debug("Closing a stale AI client failed: %s", e)
+
+        task = asyncio.get_running_loop().create_task(close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    def _client_classes():
+        """httpx, the API client class and the stand-in transport factory"""
+        import httpx
+        from anthropic import AsyncAnthropic
+        from .standin import standin_transport
+        return httpx, AsyncAnthropic, standin_transport
+
+    @staticmethod
+    def _error_classes():
+        """Client errors worth handling: connection, status and timeout"""
+        from anthropic import APIConnectionError, APIStatusError, APITimeoutError
+        return APIConnectionError, APIStatusError, APITimeoutError
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """Whether an error is transient"""
+        _, APIStatusError, _ = self._error_classes()
+        if isinstance(error, APIStatusError):
+            return error.status_code in self.RETRYABLE_STATUSES
+        return True
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait before the next attempt (full jitter, honours Retry-After)"""
+        _, APIStatusError, _ = self._error_classes()
+        if isinstance(error, APIStatusError):
+            retry_after = error.response.headers.get('retry-after')
+            try:
+                if retry_after is not None:
+                    return min(float(retry_after), self.backoff_cap)
+            except ValueError:
+                pass
+
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+
+_gateway: Optional[AIGateway] = None
+
+
+def get_gateway() -> AIGateway:
+    """Return the process-wide AI gateway"""
+    global _gateway
+    if _gateway is None:
+        _gateway = AIGateway()
+    return _gateway
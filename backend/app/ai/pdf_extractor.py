@@ -2,77 +2,308 @@
 AI-Powered PDF Extractor
 Uses AI to extract budget information from PDF files
 """
-import pdfplumber
+import asyncio
 import base64
-from typing import Optional, Dict, Any, List
+import hashlib
+from typing import Optional, Dict, Any, AsyncIterator, BinaryIO, Iterator, List, Tuple, Union
 from pathlib import Path
 import json
+import logging
 import os
-from anthropic import Anthropic
+import time
+from .gateway import AIGateway, get_gateway
+from .usage import record_cache_hits
+from .versions import EXTRACTION_MODEL, EXTRACTION_PROMPT_VERSION
 from ..models.budget import Budget, BudgetChapter, BudgetItem, BudgetMetadata
+from ..metrics import observe_budget, observe_stage, record_cache_lookups
+from ..cache.extraction_cache import ExtractionCache
+from ..parsers.pdf_table_parser import PDFTableParser, PageExtraction, merge_chapters, next_chapter_code
+from ..parsers.pdf_rule_parser import PDFRuleParser
 from decimal import Decimal
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Bytes of the PDF read at a time while hashing it for the cache
+HASH_CHUNK_SIZE = 64 * 1024
+
 
 class PDFExtractor:
     """Extract budget data from PDF using AI"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    MODEL = EXTRACTION_MODEL
+
+    # Bumped in .versions whenever the extraction prompt or rules change so cached results are invalidated
+    PROMPT_VERSION = EXTRACTION_PROMPT_VERSION
+
+    def __init__(self, api_key: Optional[str] = None, cache: Optional[ExtractionCache] = None,
+                 confidence_threshold: Optional[float] = None, gateway: Optional[AIGateway] = None,
+                 ai_pages: Optional[int] = None):
         """
         Initialize PDF extractor with AI client
 
         Args:
-            api_key: Anthropic API key (if None, reads from env)
+            api_key: Anthropic API key (if None, uses the shared gateway)
+            cache: Extraction cache (if None, a default cache is created)
+            confidence_threshold: Minimum table confidence for a page to skip the AI
+                (if None, reads PDF_TABLE_CONFIDENCE from env)
+            gateway: AI gateway (if None, uses the shared gateway)
+            ai_pages: Most pages sent to the AI in one call
+                (if None, reads PDF_AI_PAGES from env)
         """
-        self.api_key = api_key or os.getenv('ANTHROPIC_API_KEY')
-        if self.api_key:
-            self.client = Anthropic(api_key=self.api_key)
-        else:
-            self.client = None
+        if gateway is None:
+            gateway = AIGateway(api_key=api_key) if api_key else get_gateway()
+        self.gateway = gateway
+
+        self.cache = cache or ExtractionCache()
+        self.table_parser = PDFTableParser()
+        self.rule_parser = PDFRuleParser(number_format=self.table_parser.number_format)
+        self.confidence_threshold = confidence_threshold if confidence_threshold is not None else float(
+            os.getenv('PDF_TABLE_CONFIDENCE', 0.9)
+        )
+        self.ai_pages = max(ai_pages or int(os.getenv('PDF_AI_PAGES', 10)), 1)
 
-    def extract_from_file(self, file_path: str) -> Budget:
+    async def extract_from_file(self, file_path: Union[str, BinaryIO], use_ai: bool = True,
+                          refresh_cache: bool = False) -> Budget:
         """
         Extract budget data from a PDF file
 
         Args:
-            file_path: Path to PDF file
+            file_path: Path to PDF file, or a binary file object holding it
+            use_ai: Whether to use AI for extraction when available
+            refresh_cache: Ignore any cached result and extract again
 
         Returns:
             Budget object with extracted data
         """
-        # Extract text from PDF
-        text_content = self._extract_text(file_path)
-
-        # Try AI extraction if available
-        if self.client:
-            try:
-                return self._extract_with_ai(file_path, text_content)
-            except Exception as e:
-                print(f"AI extraction failed: {e}")
-                # Fallback to rule-based extraction
-                return self._extract_with_rules(text_content)
-        else:
-            # Use rule-based extraction
-            return self._extract_with_rules(text_content)
+        budget, _ = await self.extract_with_report(file_path, use_ai=use_ai, refresh_cache=refresh_cache)
+        return budget
 
-    def _extract_text(self, file_path: str) -> str:
-        """Extract text content from PDF"""
-        text_parts = []
+    async def extract_with_report(self, file_path: Union[str, BinaryIO], use_ai: bool = True,
+                                  refresh_cache: bool = False) -> Tuple[Budget, Dict[str, Any]]:
+        """
+        Extract budget data from a PDF file and describe how each page was read
+
+        Args:
+            file_path: Path to PDF file, or a binary file object holding it
+            use_ai: Whether to use AI for extraction when available
+            refresh_cache: Ignore any cached result and extract again
+
+        Returns:
+            Tuple of (budget, report) where report holds the overall confidence
+            and the method used for each page
+        """
+        async for event in self.iter_extraction(file_path, use_ai=use_ai, refresh_cache=refresh_cache):
+            if event['event'] == 'result':
+                return event['data']['budget'], event['data']['report']
+
+        raise RuntimeError("Extraction finished without a result")
+
+    async def iter_extraction(self, file_path: Union[str, BinaryIO], use_ai: bool = True,
+                              refresh_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Extract budget data from a PDF file, yielding results as pages are read
 
+        Pages whose tables are read with confidence at or above the threshold
+        are taken from the deterministic table parser. Only the remaining pages
+        are sent to the AI, up to ai_pages per call, or read by the rule-based
+        fallback as they arrive when AI is off.
+
+        Args:
+            file_path: Path to PDF file, or a binary file object holding it
+            use_ai: Whether to use AI for extraction when available
+            refresh_cache: Ignore any cached result and extract again
+
+        Yields:
+            'pages' events with the chapters read from one or more pages,
+            'progress' events, and a final 'result' event holding the budget
+            and the extraction report
+        """
+        started = time.perf_counter()
+        # Hashing and the SQLite cache block on disk: keep them off the event loop
+        content_hash = await asyncio.to_thread(_hash_pdf, file_path)
+
+        mode = 'ai' if use_ai and self.gateway.enabled else 'rules'
+        cache_key = self.cache.make_key(content_hash, mode, self.MODEL, self.PROMPT_VERSION)
+
+        if not refresh_cache:
+            cached = await asyncio.to_thread(self._cache_get, cache_key)
+            record_cache_lookups('extraction', hits=int(cached is not None), misses=int(cached is None))
+            if cached is not None:
+                record_cache_hits('extraction')
+                yield {'event': 'result', 'data': {
+                    'budget': cached,
+                    'report': {'source': 'cache', 'pages': []}
+                }}
+                return
+
+        budget = Budget()
+        metadata = None
+        report_pages = []
+        pending: List[PageExtraction] = []
+        ai_failed = False
+        # The document counts as tabular once one page is read confidently
+        tabular = False
+        candidates = verified = 0
+
+        async def flush() -> Dict[str, Any]:
+            nonlocal metadata, ai_failed
+            method = 'rules'
+            chapters: List[BudgetChapter] = []
+
+            # Pages without budget lines in a tabular document need no extraction
+            skipped = [page for page in pending if tabular and page.candidate_rows == 0]
+            extract = [page for page in pending if page not in skipped]
+            for page in skipped:
+                report_pages.append(self._page_report(page, 'table'))
+
+            if mode == 'ai' and any(page.text for page in extract):
+                text = "\n\n".join(page.text for page in extract if page.text)
+                try:
+                    extracted = await self._extract_with_ai(file_path, text)
+                    metadata = metadata or extracted.metadata
+                    chapters = [
+                        chapter for chapter in extracted.chapters if chapter.items or chapter.subchapters
+                    ]
+                    method = 'ai'
+                except Exception as e:
+                    logger.warning("AI extraction failed: %s", e)
+                    ai_failed = True
+
+            if method == 'rules':
+                # Lines are streamed page by page; items continue the current chapter
+                # and new chapters are numbered after the existing ones
+                partial = Budget(chapters=[
+                    BudgetChapter(code=chapter.code, title=chapter.title) for chapter in budget.chapters
+                ])
+                await asyncio.to_thread(self.rule_parser.parse, _iter_lines(extract), partial)
+                current = max(len(budget.chapters) - 1, 0)
+                chapters = [chapter for chapter in partial.chapters[current:] if chapter.items]
+
+            for page in extract:
+                report_pages.append(self._page_report(page, method))
+            pending.clear()
+            return self._pages_event(extract, method, chapters, budget)
+
+        # Imported here: pdfplumber takes a while to load and most routes never open a PDF
+        import pdfplumber
         with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
+            total = len(pdf.pages)
+            # Chapters without a printed code are numbered after those read so far by any method
+            pages = self.table_parser.parse_pages(pdf.pages, budget.chapters)
+
+            while True:
+                # PDF layout analysis is CPU-bound: keep it off the event loop
+                page = await asyncio.to_thread(next, pages, None)
+                if page is None:
+                    break
+
+                candidates += page.candidate_rows
+                verified += page.verified_rows
+                if page.item_count and page.confidence >= self.confidence_threshold:
+                    tabular = True
+
+                confident = tabular and page.confidence >= self.confidence_threshold
+                # Offline, a partial table reading still beats the line regexes
+                if not (confident or (mode == 'rules' and page.item_count)):
+                    pending.append(page)
+                    # The rules read a page at a time; the AI gets a few pages of context per call
+                    if mode == 'rules' or len(pending) >= self.ai_pages:
+                        yield await flush()
+                        yield self._progress_event(page.page_number, total)
+                    continue
+
+                if pending:
+                    yield await flush()
+                report_pages.append(self._page_report(page, 'table'))
+                yield self._pages_event([page], 'table', page.chapters, budget)
+                yield self._progress_event(page.page_number, total)
+
+            if pending:
+                yield await flush()
+
+        if metadata is not None:
+            budget.metadata = metadata
+
+        if not budget.chapters:
+            budget.chapters.append(BudgetChapter(
+                code="CAP01",
+                title="Presupuesto General"
+            ))
 
-        return "\n\n".join(text_parts)
+        # Results of a failed AI call are not cached under the AI key
+        if not ai_failed:
+            await asyncio.to_thread(self._cache_set, cache_key, budget)
+        observe_stage('extract', time.perf_counter() - started)
+        observe_budget(budget, 'pdf')
 
-    def _extract_with_ai(self, file_path: str, text_content: str) -> Budget:
+        report = {
+            'source': 'extraction',
+            'confidence': verified / candidates if candidates else 0.0,
+            'pages': sorted(report_pages, key=lambda page: page['page'])
+        }
+        yield self._progress_event(total, total)
+        yield {'event': 'result', 'data': {'budget': budget, 'report': report}}
+
+    def _pages_event(self, pages: List[PageExtraction], method: str,
+                     chapters: List[BudgetChapter], budget: Budget) -> Dict[str, Any]:
+        """Describe the chapters read from some pages, then merge them into the budget"""
+        # Only the first chapter may reuse a code, the last one's, which it continues:
+        # the AI numbers the chapters of each call from the start
+        used = {chapter.code for chapter in budget.chapters}
+        taken: List[str] = []
+        for position, chapter in enumerate(chapters):
+            continues = position == 0 and budget.chapters and chapter.code == budget.chapters[-1].code
+            if not continues and (chapter.code in used or chapter.code in taken):
+                chapter.code = next_chapter_code(budget.chapters, taken)
+            taken.append(chapter.code)
+
+        event = {'event': 'pages', 'data': {
+            'pages': [page.page_number for page in pages],
+            'method': method,
+            'chapters': [chapter.model_dump() for chapter in chapters]
+        }}
+        merge_chapters(budget.chapters, chapters)
+        return event
+
+    def _progress_event(self, done: int, total: int) -> Dict[str, Any]:
+        """Progress through the pages of the document"""
+        return {'event': 'progress', 'data': {
+            'done': done,
+            'total': total,
+            'percent': round(100 * done / total, 1) if total else 100.0
+        }}
+
+    def _page_report(self, page: PageExtraction, method: str) -> Dict[str, Any]:
+        """Describe how a page was extracted"""
+        return {
+            'page': page.page_number,
+            'method': method,
+            'confidence': round(page.confidence, 3),
+            'items': page.item_count
+        }
+
+    def _cache_get(self, key: str) -> Optional[Budget]:
+        """Read from the extraction cache, treating cache errors as misses"""
+        try:
+            return self.cache.get(key)
+        except Exception as e:
+            logger.warning("Extraction cache read failed: %s", e)
+            return None
+
+    def _cache_set(self, key: str, budget: Budget):
+        """Write to the extraction cache, ignoring cache errors"""
+        try:
+            self.cache.set(key, budget)
+        except Exception as e:
+            logger.warning("Extraction cache write failed: %s", e)
+
+    async def _extract_with_ai(self, file_path: Union[str, BinaryIO], text_content: str) -> Budget:
         """
         Use AI to extract structured budget data from PDF
 
         Args:
-            file_path: Path to PDF file
+            file_path: Path to PDF file, or a binary file object holding it
             text_content: Extracted text content
 
         Returns:
@@ -112,17 +343,7 @@ Contenido del presupuesto:
 """ + text_content
 
         # Call Claude API
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=4096,
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }]
-        )
-
-        # Parse the response
-        response_text = response.content[0].text
+        response_text = await self.gateway.complete(prompt, max_tokens=4096, model=self.MODEL)
 
         # Extract JSON from response
         json_data = self._extract_json_from_text(response_text)
@@ -194,7 +415,7 @@ Contenido del presupuesto:
                 subchapters=subchapters
             )
         except Exception as e:
-            print(f"Error parsing chapter: {e}")
+            logger.warning("Error parsing chapter: %s", e)
             return None
 
     def _parse_date(self, date_str: Optional[str]) -> datetime:
@@ -213,63 +434,23 @@ Contenido del presupuesto:
         except:
             return datetime.now()
 
-    def _extract_with_rules(self, text_content: str) -> Budget:
-        """
-        Fallback: Extract budget using rule-based approach
-
-        Args:
-            text_content: Text extracted from PDF
-
-        Returns:
-            Budget object with basic extraction
-        """
-        import re
-
-        budget = Budget()
-        current_chapter = None
-
-        lines = text_content.split('\n')
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            # Try to detect chapter (usually uppercase or specific format)
-            if re.match(r'^[A-Z\s]{10,}$', line) or re.match(r'^\d+\.\s+[A-Z]', line):
-                # New chapter
-                code = f"CAP{len(budget.chapters) + 1:02d}"
-                current_chapter = BudgetChapter(code=code, title=line)
-                budget.chapters.append(current_chapter)
-
-            # Try to detect budget items (code, description, quantities, prices)
-            # Pattern: code description quantity unit price total
-            item_match = re.match(
-                r'^([A-Z0-9\.]+)\s+(.+?)\s+(\d+(?:,\d+)?)\s+([a-zA-Z]+)\s+(\d+(?:,\d+)?)\s+(\d+(?:,\d+)?)',
-                line
-            )
-
-            if item_match and current_chapter:
-                code = item_match.group(1)
-                description = item_match.group(2).strip()
-                quantity = item_match.group(3).replace(',', '.')
-                unit = item_match.group(4)
-                price = item_match.group(5).replace(',', '.')
-
-                item = BudgetItem(
-                    code=code,
-                    description=description,
-                    quantity=Decimal(quantity),
-                    unit=unit,
-                    price=Decimal(price)
-                )
-                current_chapter.items.append(item)
-
-        # If no chapters were detected, create a default one
-        if not budget.chapters:
-            budget.chapters.append(BudgetChapter(
-                code="CAP01",
-                title="Presupuesto General"
-            ))
 
-        return budget
+def _iter_lines(pages: List[PageExtraction]) -> Iterator[str]:
+    """Yield the text lines of pages in order"""
+    for page in pages:
+        yield from page.text.splitlines()
+
+
+def _hash_pdf(file_path: Union[str, BinaryIO]) -> str:
+    """SHA-256 hex digest of a PDF path or file object, leaving a file object rewound for parsing"""
+    sha = hashlib.sha256()
+    if isinstance(file_path, (str, Path)):
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                sha.update(chunk)
+        return sha.hexdigest()
+    file_path.seek(0)
+    while chunk := file_path.read(HASH_CHUNK_SIZE):
+        sha.update(chunk)
+    file_path.seek(0)
+    return sha.hexdigest()
@@ -0,0 +1,238 @@
+"""
+AI Scheduler
+Rate limits shared by every worker, with interactive calls served before batch ones
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from ..cache.sqlite_store import SQLiteStore
+
+# Lower values are served first
+PRIORITIES = {'interactive': 0, 'batch': 1}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar('ai_priority', default='interactive')
+
+
+@contextmanager
+def ai_priority(priority: str) -> Iterator[None]:
+    """
+    Run the AI calls made within the block (and tasks started from it) at a priority
+
+    Args:
+        priority: 'interactive' or 'batch'
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown AI priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """Priority of the AI calls made in the current context"""
+    return _priority.get()
+
+
+class RateLimiter(SQLiteStore):
+    """Request and token buckets kept in SQLite, so all workers of a host draw from the same limits"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS buckets ("
+        "name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)",
+    )
+
+    def __init__(self, path: Optional[str] = None, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        """
+        Initialize rate limiter
+
+        Args:
+            path: SQLite database path (if None, uses CACHE_DIR from env)
+            requests_per_minute: Calls allowed per minute, 0 for no limit
+                (if None, reads AI_RATE_RPM from env)
+            tokens_per_minute: Prompt plus completion tokens allowed per minute,
+                0 for no limit (if None, reads AI_RATE_TPM from env)
+        """
+        cache_dir = os.getenv('CACHE_DIR', 'cache')
+        super().__init__(path or os.path.join(cache_dir, 'ratelimit.sqlite3'))
+        if requests_per_minute is None:
+            requests_per_minute = int(os.getenv('AI_RATE_RPM', 0))
+        if tokens_per_minute is None:
+            tokens_per_minute = int(os.getenv('AI_RATE_TPM', 0))
+        # Bucket name and capacity; each bucket refills completely in a minute
+        self.capacities: Dict[str, float] = {
+            name: float(capacity)
+            for name, capacity in (('requests', requests_per_minute), ('tokens', tokens_per_minute))
+            if capacity > 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any limit is set"""
+        return bool(self.capacities)
+
+    def try_acquire(self, tokens: int, reserve: float = 0.0) -> float:
+        """
+        Take one request and some tokens from the buckets if they are available
+
+        Args:
+            tokens: Tokens the call is expected to use
+            reserve: Fraction of each bucket that must remain afterwards, so
+                that lower priority calls leave room for higher priority ones
+
+        Returns:
+            0 if taken, otherwise the seconds until enough will have refilled
+        """
+        wanted = {'requests': 1.0, 'tokens': float(tokens)}
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            levels = self._levels(conn, now)
+
+            wait = 0.0
+            for name, capacity in self.capacities.items():
+                # A call larger than the bucket goes through once the bucket is full
+                needed = min(wanted[name], capacity * (1 - reserve)) + capacity * reserve
+                if levels[name] < needed:
+                    wait = max(wait, (needed - levels[name]) * 60 / capacity)
+
+            if wait == 0:
+                for name in self.capacities:
+                    levels[name] -= wanted[name]
+            self._store(conn, levels, now)
+
+        return wait
+
+    def adjust(self, tokens: int):
+        """Return tokens taken in excess (or take more if negative) once a call's usage is known"""
+        if 'tokens' not in self.capacities or tokens == 0:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            levels = self._levels(conn, now)
+            levels['tokens'] += tokens
+            self._store(conn, levels, now)
+
+    def drain(self):
+        """Empty every bucket, e.g. after the provider answered 429, so all workers back off"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._store(conn, {name: 0.0 for name in self.capacities}, now)
+
+    def _levels(self, conn, now: float) -> Dict[str, float]:
+        """Current bucket levels, refilled for the time elapsed since they were stored"""
+        stored = dict(
+            (name, (level, updated_at))
+            for name, level, updated_at in conn.execute("SELECT name, level, updated_at FROM buckets")
+        )
+        levels = {}
+        for name, capacity in self.capacities.items():
+            if name not in stored:
+                levels[name] = capacity
+                continue
+            level, updated_at = stored[name]
+            levels[name] = min(capacity, level + max(now - updated_at, 0) * capacity / 60)
+        return levels
+
+    def _store(self, conn, levels: Dict[str, float], now: float):
+        """Save bucket levels"""
+        conn.executemany(
+            "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+            [(name, level, now) for name, level in levels.items()]
+        )
+
+
+class AIScheduler:
+    """Queue AI calls of a worker by priority and release them as the shared rate limits allow"""
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, batch_reserve: Optional[float] = None,
+                 max_poll_interval: float = 1.0):
+        """
+        Initialize AI scheduler
+
+        Args:
+            limiter: Shared rate limiter (if None, one is created from env)
+            batch_reserve: Fraction of the limits batch calls leave for
+                interactive ones (if None, reads AI_BATCH_RESERVE from env)
+            max_poll_interval: Longest sleep between checks of the shared
+                buckets, which other workers also draw from
+        """
+        self.limiter = limiter or RateLimiter()
+        self.batch_reserve = batch_reserve if batch_reserve is not None else float(
+            os.getenv('AI_BATCH_RESERVE', 0.2)
+        )
+        self.max_poll_interval = max_poll_interval
+        self._queue: List[Tuple[int, int, asyncio.Event]] = []
+        self._counter = itertools.count()
+
+    async def acquire(self, tokens: int, priority: Optional[str] = None) -> float:
+        """
+        Wait until a call may be sent
+
+        Calls are released in priority order, then in arrival order.
+
+        Args:
+            tokens: Tokens the call is expected to use
+            priority: 'interactive' or 'batch' (if None, uses the current context's)
+
+        Returns:
+            Seconds spent waiting
+        """
+        if not self.limiter.enabled:
+            return 0.0
+
+        rank = PRIORITIES[priority or current_priority()]
+        reserve = self.batch_reserve if rank > 0 else 0.0
+        entry = (rank, next(self._counter), asyncio.Event())
+        heapq.heappush(self._queue, entry)
+        started = time.monotonic()
+
+        try:
+            while True:
+                if self._queue[0] is not entry:
+                    entry[2].clear()
+                    await entry[2].wait()
+                    continue
+
+                wait = await asyncio.to_thread(self.limiter.try_acquire, tokens, reserve)
+                if wait <= 0:
+                    return time.monotonic() - started
+                await asyncio.sleep(min(wait, self.max_poll_interval))
+        finally:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            if self._queue:
+                self._queue[0][2].set()
+
+    async def settle(self, reserved: int, used: int):
+        """Return the tokens a call reserved but did not use"""
+        if self.limiter.enabled:
+            await asyncio.to_thread(self.limiter.adjust, reserved - used)
+
+    async def throttle(self):
+        """Make every worker back off after the provider rate-limited a call"""
+        if self.limiter.enabled:
+            await asyncio.to_thread(self.limiter.drain)
+
+
+_scheduler: Optional[AIScheduler] = None
+
+
+def get_scheduler() -> AIScheduler:
+    """Return the process-wide AI scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = AIScheduler()
+    return _scheduler
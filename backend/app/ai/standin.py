@@ -0,0 +1,253 @@
+"""
+AI Stand-in
+Local replacement for the messages API, for offline benchmarks and load tests
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+from pathlib import Path
+from typing import Any, Dict, Optional
+import httpx
+from ..parsers.pdf_rule_parser import PDFRuleParser
+from .batching import CHARS_PER_TOKEN
+
+MODES = ('synthesize', 'replay', 'record')
+
+# Markers of the prompts the application sends, used to synthesize a fitting reply
+ENHANCE_MARKER = "Partidas:\n"
+REVIEW_MARKER = "Revisa estas partidas"
+EXTRACT_MARKER = "Contenido del presupuesto:\n"
+
+_FINDING_NUMBER = re.compile(r'^\[(\d+)\]', re.MULTILINE)
+
+ERROR_TYPES = {
+    429: 'rate_limit_error',
+    500: 'api_error',
+    529: 'overloaded_error',
+}
+
+
+class StandInTransport(httpx.AsyncBaseTransport):
+    """httpx transport answering messages API calls locally"""
+
+    def __init__(self, mode: Optional[str] = None, directory: Optional[str] = None,
+                 latency: Optional[float] = None, token_latency: Optional[float] = None,
+                 error_rate: Optional[float] = None, error_status: Optional[int] = None,
+                 chars_per_token: Optional[float] = None, expansion: Optional[float] = None,
+                 seed: Optional[int] = None, upstream: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Initialize stand-in transport
+
+        Args:
+            mode: 'synthesize' builds a valid reply for each prompt, 'replay'
+                returns recorded replies (synthesizing those not recorded) and
+                'record' forwards calls to the real API, saving the replies
+                (if None, reads AI_STANDIN from env)
+            directory: Where replies are recorded, one file per prompt hash
+                (if None, reads AI_STANDIN_DIR from env)
+            latency: Seconds before every reply (if None, reads AI_STANDIN_LATENCY from env)
+            token_latency: Extra seconds per completion token
+                (if None, reads AI_STANDIN_TOKEN_LATENCY from env)
+            error_rate: Fraction of calls that fail (if None, reads AI_STANDIN_ERROR_RATE from env)
+            error_status: HTTP status of failed calls, with a Retry-After header
+                for 429 (if None, reads AI_STANDIN_ERROR_STATUS from env)
+            chars_per_token: Characters counted as one token in reported usage
+                (if None, reads AI_STANDIN_CHARS_PER_TOKEN from env)
+            expansion: Length of synthesized enhanced descriptions relative to
+                the originals (if None, reads AI_STANDIN_EXPANSION from env)
+            seed: Seed of latency jitter and error injection (if None, reads AI_STANDIN_SEED from env)
+            upstream: Transport to the real API in 'record' mode
+        """
+        self.mode = mode or os.getenv('AI_STANDIN') or 'synthesize'
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown AI stand-in mode: {self.mode}")
+        self.directory = Path(directory or os.getenv('AI_STANDIN_DIR', 'standin'))
+        self.latency = latency if latency is not None else float(os.getenv('AI_STANDIN_LATENCY', 0.5))
+        self.token_latency = token_latency if token_latency is not None else float(
+            os.getenv('AI_STANDIN_TOKEN_LATENCY', 0.01)
+        )
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv('AI_STANDIN_ERROR_RATE', 0))
+        self.error_status = error_status or int(os.getenv('AI_STANDIN_ERROR_STATUS', 429))
+        self.chars_per_token = chars_per_token or float(os.getenv('AI_STANDIN_CHARS_PER_TOKEN', CHARS_PER_TOKEN))
+        self.expansion = expansion or float(os.getenv('AI_STANDIN_EXPANSION', 2.0))
+        self._random = random.Random(seed if seed is not None else int(os.getenv('AI_STANDIN_SEED', 0)))
+        self._upstream = upstream or (httpx.AsyncHTTPTransport() if self.mode == 'record' else None)
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        """Hex digest identifying a recorded reply"""
+        return hashlib.sha256(f"{model}\n{prompt}".encode('utf-8')).hexdigest()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Answer one request"""
+        if request.method != 'POST' or not request.url.path.endswith('/messages'):
+            return _error(404, 'not_found_error', f"Stand-in does not serve {request.url.path}")
+
+        body = json.loads(await request.aread())
+        model = body.get('model', '')
+        prompt = _prompt_text(body.get('messages', []))
+        key = self.make_key(model, prompt)
+
+        if self.mode == 'record':
+            return await self._record(request, key)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            await asyncio.sleep(self.latency)
+            error_type = ERROR_TYPES.get(self.error_status, 'api_error')
+            headers = {'retry-after': '1'} if self.error_status == 429 else {}
+            return _error(self.error_status, error_type, "Injected by the AI stand-in", headers)
+
+        message = self._replay(key) if self.mode == 'replay' else None
+        if message is None:
+            message = self._synthesize(model, prompt, int(body.get('max_tokens', 1024)))
+
+        output_tokens = message.get('usage', {}).get('output_tokens', 0)
+        jitter = self._random.uniform(0.8, 1.2)
+        await asyncio.sleep((self.latency + self.token_latency * output_tokens) * jitter)
+        return httpx.Response(200, json=message)
+
+    async def aclose(self):
+        if self._upstream is not None:
+            await self._upstream.aclose()
+
+    def _replay(self, key: str) -> Optional[Dict[str, Any]]:
+        """Recorded reply of a prompt, if any"""
+        path = self.directory / f"{key}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding='utf-8'))
+
+    async def _record(self, request: httpx.Request, key: str) -> httpx.Response:
+        """Forward a call to the real API and save a successful reply"""
+        response = await self._upstream.handle_async_request(request)
+        content = await response.aread()
+        if response.status_code == 200:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / f"{key}.json").write_bytes(content)
+
+        # The body is already decoded, so encoding headers no longer apply
+        headers = [
+            (name, value) for name, value in response.headers.items()
+            if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')
+        ]
+        return httpx.Response(response.status_code, headers=headers, content=content)
+
+    def _synthesize(self, model: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """Build a reply in the format the prompt asks for"""
+        if REVIEW_MARKER in prompt:
+            text = self._review_reply(prompt)
+        elif EXTRACT_MARKER in prompt:
+            text = self._extraction_reply(prompt.split(EXTRACT_MARKER, 1)[1])
+        elif ENHANCE_MARKER in prompt:
+            text = self._enhancement_reply(prompt)
+        else:
+            text = "{}"
+
+        stop_reason = 'end_turn'
+        if self._tokens(text) > max_tokens:
+            # Cut off like a real reply that runs out of completion tokens
+            text = text[:int(max_tokens * self.chars_per_token)]
+            stop_reason = 'max_tokens'
+
+        return {
+            'id': f"msg_standin_{self.make_key(model, prompt)[:24]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': model,
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': stop_reason,
+            'stop_sequence': None,
+            'usage': {'input_tokens': self._tokens(prompt), 'output_tokens': self._tokens(text)},
+        }
+
+    def _enhancement_reply(self, prompt: str) -> str:
+        """Every item back with a longer description"""
+        listed = prompt.split(ENHANCE_MARKER, 1)[1]
+        items = json.loads(listed[:listed.index('\n]') + 2])
+        enhanced = []
+        for item in items:
+            description = item.get('description', '')
+            target = int(len(description) * self.expansion)
+            while len(description) < target:
+                description += ". " + item.get('description', '')
+            enhanced.append({**item, 'description': description[:max(target, 1)]})
+        return json.dumps(enhanced, ensure_ascii=False)
+
+    def _review_reply(self, prompt: str) -> str:
+        """A deterministic verdict for every numbered finding"""
+        findings = []
+        for number in _FINDING_NUMBER.findall(prompt):
+            digest = hashlib.sha256(f"{number}\n{prompt}".encode('utf-8')).digest()
+            error = digest[0] % 3 == 0
+            findings.append({
+                'id': int(number),
+                'error': error,
+                'reason': "Importe fuera de rango para este concepto" if error else "Razonable para este concepto",
+                'suggestion': "Revisar precio y cantidad" if error else "",
+            })
+        return json.dumps({'findings': findings}, ensure_ascii=False)
+
+    def _extraction_reply(self, text: str) -> str:
+        """The budget the rule parser reads from the text, in the format the prompt asks for"""
+        budget = PDFRuleParser().parse(text.splitlines())
+        chapters = []
+        stack = list(budget.chapters)
+        while stack:
+            chapter = stack.pop(0)
+            chapters.append({
+                'code': chapter.code,
+                'title': chapter.title,
+                'items': [
+                    {'code': item.code, 'unit': item.unit, 'description': item.description,
+                     'price': float(item.price), 'quantity': float(item.quantity)}
+                    for item in chapter.items
+                ],
+            })
+            stack[:0] = chapter.subchapters
+        return json.dumps({
+            'metadata': {'title': budget.metadata.title, 'owner': None, 'date': None, 'currency': 'EUR'},
+            'chapters': chapters,
+        }, ensure_ascii=False)
+
+    def _tokens(self, text: str) -> int:
+        """Tokens reported for a text"""
+        return int(len(text) / self.chars_per_token) + 1
+
+
+def standin_transport(limits: Optional[httpx.Limits] = None) -> Optional[StandInTransport]:
+    """
+    Stand-in transport configured from env, if AI_STANDIN is set
+
+    Args:
+        limits: Connection limits towards the real API in 'record' mode
+
+    Returns:
+        The transport, or None to use the real API
+    """
+    mode = os.getenv('AI_STANDIN')
+    if not mode:
+        return None
+    upstream = httpx.AsyncHTTPTransport(limits=limits) if mode == 'record' and limits else None
+    return StandInTransport(mode, upstream=upstream)
+
+
+def _prompt_text(messages) -> str:
+    """Text of the first user message"""
+    if not messages:
+        return ""
+    content = messages[0].get('content', '')
+    if isinstance(content, list):
+        return "".join(block.get('text', '') for block in content if isinstance(block, dict))
+    return content
+
+
+def _error(status: int, error_type: str, message: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """Error reply in the messages API format"""
+    return httpx.Response(
+        status,
+        headers=headers or {},
+        json={'type': 'error', 'error': {'type': error_type, 'message': message}}
+    )
@@ -0,0 +1,190 @@
+"""
+Budget Summary
+Bounded-size statistical digest of a budget for AI prompts
+"""
+import os
+from typing import List, Optional
+import numpy as np
+from ..models.budget import Budget
+from ..validation.engine import BudgetColumns, ValidationReport
+from .batching import estimate_tokens
+
+# Share of the token budget given to each section, in the order they are written;
+# tokens a section does not use carry over to the next one
+SECTION_SHARES = (
+    ('hierarchy', 0.4),
+    ('units', 0.2),
+    ('expensive', 0.2),
+    ('anomalies', 0.2),
+)
+
+QUANTILES = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+
+class BudgetSummarizer:
+    """Summarize a budget of any size into a digest under a token budget"""
+
+    def __init__(self, max_tokens: Optional[int] = None, top_k: Optional[int] = None):
+        """
+        Initialize budget summarizer
+
+        Args:
+            max_tokens: Estimated tokens of the whole summary
+                (if None, reads AI_SUMMARY_TOKENS from env)
+            top_k: Items listed as most expensive and as most anomalous
+                (if None, reads AI_SUMMARY_TOP_ITEMS from env)
+        """
+        self.max_tokens = max_tokens or int(os.getenv('AI_SUMMARY_TOKENS', 1500))
+        self.top_k = top_k or int(os.getenv('AI_SUMMARY_TOP_ITEMS', 10))
+
+    def summarize(self, budget: Budget, report: Optional[ValidationReport] = None) -> str:
+        """
+        Build the digest of a budget
+
+        It holds the chapter hierarchy with totals (condensed to the depth that
+        fits), price distributions per unit, the most expensive items and, if a
+        validation report is given, the most anomalous ones.
+
+        Args:
+            budget: Budget to summarize
+            report: Validation findings used to pick anomalous items
+
+        Returns:
+            Summary text
+        """
+        columns = BudgetColumns(budget)
+        totals = columns.price * columns.quantity
+
+        lines = [
+            f"Título: {budget.metadata.title}",
+            f"Total: {float(totals.sum()):.2f} {budget.metadata.currency}",
+            f"Capítulos: {len(columns.chapters)}",
+            f"Partidas: {len(columns.codes)}",
+        ]
+        allowance = self.max_tokens - _count_tokens(lines)
+
+        sections = {
+            'hierarchy': lambda tokens: self._hierarchy(columns, tokens),
+            'units': lambda tokens: self._units(columns, tokens),
+            'expensive': lambda tokens: self._expensive(columns, totals, tokens),
+            'anomalies': lambda tokens: self._anomalies(report, tokens),
+        }
+        spare = 0
+        for name, share in SECTION_SHARES:
+            tokens = int(allowance * share) + spare
+            section = sections[name](tokens)
+            spare = max(tokens - _count_tokens(section), 0)
+            if section:
+                lines.append("")
+                lines.extend(section)
+
+        return "\n".join(lines)
+
+    def _hierarchy(self, columns: BudgetColumns, tokens: int) -> List[str]:
+        """Chapter tree with totals, down to the deepest level that fits"""
+        if not columns.chapters:
+            return []
+
+        sums, counts = columns.chapter_totals()
+        grand_total = float(sums[[i for i, parent in enumerate(columns.parents) if parent < 0]].sum())
+
+        depths: List[int] = []
+        for parent in columns.parents:
+            depths.append(depths[parent] + 1 if parent >= 0 else 0)
+
+        def render(max_depth: int) -> List[str]:
+            lines = ["Capítulos (código título | partidas | total | % del total):"]
+            for index, chapter in enumerate(columns.chapters):
+                depth = depths[index]
+                if depth > max_depth:
+                    continue
+                share = 100 * sums[index] / grand_total if grand_total else 0.0
+                line = (f"{'  ' * (depth + 1)}{chapter.code} {chapter.title[:60]} | "
+                        f"{counts[index]} | {sums[index]:.2f} | {share:.1f}%")
+                if depth == max_depth and chapter.subchapters:
+                    line += f" | {len(chapter.subchapters)} subcapítulos"
+                lines.append(line)
+            return lines
+
+        for max_depth in range(max(depths), -1, -1):
+            lines = render(max_depth)
+            if _count_tokens(lines) <= tokens:
+                return lines
+
+        return _fit(lines, tokens)
+
+    def _units(self, columns: BudgetColumns, tokens: int) -> List[str]:
+        """Unit price distribution of the most used units"""
+        if not columns.codes:
+            return []
+
+        unit_names = list(columns.unit_index)
+        group_count = len(unit_names)
+        counts = np.bincount(columns.unit_ids, minlength=group_count)
+        quantiles = _grouped_quantiles(columns.price, columns.unit_ids, counts, QUANTILES)
+
+        lines = ["Precios por unidad (partidas | mín / p25 / mediana / p75 / máx):"]
+        for unit_id in np.argsort(-counts, kind='stable'):
+            values = " / ".join(f"{value:.2f}" for value in quantiles[unit_id])
+            lines.append(f"  {unit_names[unit_id]}: {counts[unit_id]} | {values}")
+        return _fit(lines, tokens)
+
+    def _expensive(self, columns: BudgetColumns, totals: np.ndarray, tokens: int) -> List[str]:
+        """Items with the largest totals"""
+        if not columns.codes:
+            return []
+
+        k = min(self.top_k, totals.size)
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top], kind='stable')]
+
+        lines = ["Partidas de mayor importe:"]
+        for index in top:
+            lines.append(
+                f"  {columns.codes[index]}: {columns.descriptions[index][:80]} | "
+                f"{columns.quantity[index]:g} {columns.units[index]} x {columns.price[index]:.2f} = "
+                f"{totals[index]:.2f}"
+            )
+        return _fit(lines, tokens)
+
+    def _anomalies(self, report: Optional[ValidationReport], tokens: int) -> List[str]:
+        """Items the validation engine found most anomalous"""
+        if report is None:
+            return []
+
+        flagged = report.flagged(self.top_k)
+        if not flagged:
+            return []
+
+        lines = ["Partidas más anómalas:"]
+        lines.extend(f"  {finding.message}" for finding in flagged)
+        return _fit(lines, tokens)
+
+
+def _grouped_quantiles(values: np.ndarray, groups: np.ndarray, counts: np.ndarray,
+                       quantiles) -> np.ndarray:
+    """Quantiles of values within each group (nearest rank), one row per group"""
+    ordered = values[np.lexsort((values, groups))]
+    starts = np.cumsum(counts) - counts
+    last = np.maximum(counts - 1, 0)
+    positions = starts[:, None] + np.floor(last[:, None] * np.array(quantiles)[None, :]).astype(np.intp)
+    return ordered[np.minimum(positions, max(ordered.size - 1, 0))]
+
+
+def _fit(lines: List[str], tokens: int) -> List[str]:
+    """Keep the title and as many lines as fit, noting how many were left out"""
+    kept = lines[:1]
+    used = _count_tokens(kept)
+    for position, line in enumerate(lines[1:], start=1):
+        cost = estimate_tokens(line)
+        if used + cost > tokens:
+            kept.append(f"  ... y {len(lines) - position} más")
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def _count_tokens(lines: List[str]) -> int:
+    """Estimated tokens of some lines"""
+    return sum(estimate_tokens(line) for line in lines)
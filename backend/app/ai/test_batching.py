@@ -0,0 +1,51 @@
+"""
+Tests for request batching
+"""
+from .batching import estimate_tokens, plan_batches
+
+
+def pack(costs, max_input_tokens, max_output_tokens):
+    """Plan batches of (input, output) cost pairs"""
+    return plan_batches(costs, lambda c: c[0], lambda c: c[1], max_input_tokens, max_output_tokens)
+
+
+def test_small_entries_share_a_batch():
+    costs = [(10, 5)] * 4
+
+    assert pack(costs, 100, 100) == [costs]
+
+
+def test_batches_close_at_the_input_budget():
+    costs = [(40, 1), (40, 1), (40, 1), (10, 1)]
+
+    assert pack(costs, 80, 100) == [costs[:2], costs[2:]]
+
+
+def test_batches_close_at_the_output_budget():
+    costs = [(1, 30), (1, 30), (1, 30), (1, 30)]
+
+    assert pack(costs, 100, 60) == [costs[:2], costs[2:]]
+
+
+def test_oversized_entries_get_a_batch_of_their_own():
+    costs = [(10, 1), (500, 1), (10, 1), (10, 900)]
+
+    assert pack(costs, 100, 100) == [[costs[0]], [costs[1]], [costs[2]], [costs[3]]]
+
+
+def test_entries_keep_their_order():
+    entries = list(range(10))
+
+    batches = plan_batches(entries, lambda e: e, lambda e: 0, 12, 10)
+
+    assert [e for batch in batches for e in batch] == entries
+    assert all(sum(batch) <= 12 for batch in batches if len(batch) > 1)
+
+
+def test_no_entries_no_batches():
+    assert pack([], 100, 100) == []
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 30) == 11
@@ -0,0 +1,146 @@
+"""
+Tests for description enhancement, against the local stand-in
+"""
+import asyncio
+from decimal import Decimal
+import httpx
+import pytest
+from ..cache.description_memo import DescriptionMemo
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from .budget_enhancer import BudgetEnhancer
+from .gateway import AIGateway
+from .scheduler import AIScheduler, RateLimiter
+from .standin import StandInTransport
+
+
+class Tracked(httpx.AsyncBaseTransport):
+    """Passes calls to the stand-in, counting them and those in flight at once"""
+
+    def __init__(self, fail_when=None):
+        self.standin = StandInTransport('synthesize', latency=0.02, token_latency=0)
+        self.fail_when = fail_when
+        self.calls = 0
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    async def handle_async_request(self, request):
+        self.calls += 1
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            body = (await request.aread()).decode('utf-8')
+            if self.fail_when and self.fail_when in body:
+                return httpx.Response(400, json={'type': 'error', 'error': {'type': 'invalid_request_error'}})
+            return await self.standin.handle_async_request(request)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def transport():
+    return Tracked()
+
+
+@pytest.fixture
+def enhancer(tmp_path, transport):
+    gateway = AIGateway(api_key='test', max_retries=0, http_client=httpx.AsyncClient(transport=transport),
+                        scheduler=AIScheduler(RateLimiter(str(tmp_path / 'ratelimit.sqlite3'), 0, 0)))
+    return BudgetEnhancer(gateway=gateway, concurrency=3, batch_input_tokens=60,
+                          memo=DescriptionMemo(str(tmp_path / 'descriptions.sqlite3')))
+
+
+def item(code, description, unit="m2"):
+    return BudgetItem(code=code, description=description, unit=unit, quantity=Decimal("1"), price=Decimal("1"))
+
+
+def budget(count=12):
+    return Budget(chapters=[
+        BudgetChapter(code=f"{chapter:02d}", title=f"Capítulo {chapter}", items=[
+            item(f"{chapter:02d}.{number:02d}", f"Partida {chapter}-{number} de obra")
+            for number in range(count)
+        ])
+        for chapter in (1, 2)
+    ])
+
+
+def events(enhancer, budget):
+    async def run():
+        return [event async for event in enhancer.iter_enhancements(budget)]
+    return asyncio.run(run())
+
+
+def enhanced(description):
+    """What the stand-in makes of a description"""
+    return (description + ". " + description)[:len(description) * 2]
+
+
+def test_requests_are_sent_concurrently_up_to_the_limit(enhancer, transport):
+    data = budget()
+    originals = {item.code: item.description for chapter in data.chapters for item in chapter.items}
+
+    summary = events(enhancer, data)[-1]['data']
+
+    assert summary['requests'] == transport.calls > 3
+    assert transport.most_in_flight == 3
+    assert summary['enhanced'] == summary['items'] == 24
+    assert all(item.description == enhanced(originals[item.code]) for chapter in data.chapters for item in chapter.items)
+
+
+def test_repeated_codes_get_their_own_descriptions(enhancer):
+    data = Budget(chapters=[
+        BudgetChapter(code="01", title="Cimentación", items=[item("E01", "Zapata de hormigón armado")]),
+        BudgetChapter(code="02", title="Estructura", items=[item("E01", "Pilar de acero laminado")]),
+    ])
+
+    events(enhancer, data)
+
+    assert [chapter.items[0].description for chapter in data.chapters] == [
+        enhanced("Zapata de hormigón armado"), enhanced("Pilar de acero laminado")
+    ]
+
+
+def test_a_failed_request_leaves_only_its_items_as_they_were(tmp_path):
+    transport = Tracked(fail_when="Partida 2-")
+    gateway = AIGateway(api_key='test', max_retries=0, http_client=httpx.AsyncClient(transport=transport),
+                        scheduler=AIScheduler(RateLimiter(str(tmp_path / 'ratelimit.sqlite3'), 0, 0)))
+    enhancer = BudgetEnhancer(gateway=gateway, concurrency=3, batch_input_tokens=60,
+                              memo=DescriptionMemo(str(tmp_path / 'descriptions.sqlite3')))
+    data = budget()
+    originals = {item.code: item.description for chapter in data.chapters for item in chapter.items}
+
+    summary = events(enhancer, data)[-1]['data']
+
+    kept = [item for chapter in data.chapters for item in chapter.items if item.description == originals[item.code]]
+    assert summary['failed_requests'] >= 1
+    assert len(kept) == summary['not_enhanced'] > 0
+    assert data.chapters[0].items[0].description == enhanced("Partida 1-0 de obra")
+
+
+def test_known_descriptions_come_from_the_memo(enhancer, transport):
+    first = budget()
+    events(enhancer, first)
+    calls = transport.calls
+
+    # Same descriptions in another case and spacing: nothing left for the model
+    second = budget()
+    for chapter in second.chapters:
+        for entry in chapter.items:
+            entry.description = "  " + entry.description.upper()
+    found = events(enhancer, second)
+
+    assert transport.calls == calls
+    assert found[0]['data']['source'] == 'memo'
+    assert found[-1]['data'] == {'items': 24, 'enhanced': 24, 'from_memo': 24, 'requests': 0,
+                                 'failed_requests': 0, 'not_enhanced': 0}
+    assert second.chapters[0].items[0].description == first.chapters[0].items[0].description
+
+
+def test_items_sharing_a_description_are_sent_once(enhancer, transport):
+    data = Budget(chapters=[BudgetChapter(code=f"0{number}", title="Capítulo", items=[
+        item(f"0{number}.01", "Solado de gres porcelánico")
+    ]) for number in range(1, 4)])
+
+    summary = events(enhancer, data)[-1]['data']
+
+    assert transport.calls == summary['requests'] == 1
+    assert {chapter.items[0].description for chapter in data.chapters} == {enhanced("Solado de gres porcelánico")}
@@ -0,0 +1,135 @@
+"""
+Tests for the AI gateway, against the local stand-in
+"""
+import asyncio
+import httpx
+import pytest
+from .batching import estimate_tokens
+from .gateway import AIGateway, AIGatewayError
+from .standin import StandInTransport
+from .usage import track_usage
+
+PROMPT = "Responde con un objeto JSON vacío"
+
+
+class RecordingScheduler:
+    """Scheduler without limits that records what calls reserve and give back"""
+
+    def __init__(self):
+        self.acquired = []
+        self.settled = []
+        self.throttled = 0
+
+    async def acquire(self, tokens, priority=None):
+        self.acquired.append(tokens)
+        return 0.0
+
+    async def settle(self, reserved, used):
+        self.settled.append((reserved, used))
+
+    async def throttle(self):
+        self.throttled += 1
+
+
+class Failing(httpx.AsyncBaseTransport):
+    """Answers the first calls with an error status, then passes calls to the stand-in"""
+
+    def __init__(self, failures, status, headers=None):
+        self.failures = failures
+        self.status = status
+        self.headers = headers or {}
+        self.calls = 0
+        self.standin = StandInTransport('synthesize', latency=0, token_latency=0)
+
+    async def handle_async_request(self, request):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return httpx.Response(self.status, headers=self.headers,
+                                  json={'type': 'error', 'error': {'type': 'api_error', 'message': 'down'}})
+        return await self.standin.handle_async_request(request)
+
+
+def gateway(transport, max_retries=3):
+    gateway = AIGateway(api_key='test', max_retries=max_retries,
+                        http_client=httpx.AsyncClient(transport=transport), scheduler=RecordingScheduler())
+    gateway.backoff_base = 0.001
+    return gateway
+
+
+def complete(gateway, max_tokens=100):
+    async def run():
+        with track_usage(lambda: '/test/gateway') as usage:
+            try:
+                return await gateway.complete(PROMPT, max_tokens=max_tokens), usage
+            except AIGatewayError as e:
+                return e, usage
+
+    return asyncio.run(run())
+
+
+def test_transient_errors_are_retried_until_a_reply():
+    transport = Failing(2, 503)
+    ai = gateway(transport)
+
+    reply, usage = complete(ai)
+
+    assert reply == "{}"
+    assert transport.calls == 3
+    assert (usage.calls, usage.failed_calls, usage.retries) == (1, 0, 2)
+    reserved = estimate_tokens(PROMPT) + 100
+    # Failed attempts give back their whole reservation, the last one what it did not use
+    assert ai.scheduler.settled == [(reserved, 0), (reserved, 0), (reserved, usage.input_tokens + usage.output_tokens)]
+
+
+def test_calls_fail_once_retries_run_out():
+    transport = Failing(10, 529)
+    ai = gateway(transport, max_retries=2)
+
+    error, usage = complete(ai)
+
+    assert isinstance(error, AIGatewayError)
+    assert transport.calls == 3
+    assert (usage.calls, usage.failed_calls, usage.retries) == (1, 1, 2)
+    assert all(used == 0 for _, used in ai.scheduler.settled) and len(ai.scheduler.settled) == 3
+
+
+def test_client_errors_are_not_retried():
+    transport = Failing(1, 400)
+    ai = gateway(transport)
+
+    error, _ = complete(ai)
+
+    assert isinstance(error, AIGatewayError)
+    assert transport.calls == 1
+
+
+def test_rate_limited_calls_make_every_worker_back_off():
+    ai = gateway(StandInTransport('synthesize', latency=0, error_rate=1, error_status=429), max_retries=0)
+
+    error, _ = complete(ai)
+
+    assert isinstance(error, AIGatewayError)
+    assert ai.scheduler.throttled == 1
+    assert ai.scheduler.settled == [(estimate_tokens(PROMPT) + 100, 0)]
+
+
+def test_backoff_honours_retry_after_up_to_the_cap():
+    ai = gateway(Failing(0, 200))
+    _, APIStatusError, _ = ai._error_classes()
+
+    def rate_limited(retry_after):
+        response = httpx.Response(429, headers={'retry-after': retry_after},
+                                  request=httpx.Request('POST', 'https://api.test/v1/messages'))
+        return APIStatusError("rate limited", response=response, body=None)
+
+    assert ai._backoff(0, rate_limited('3')) == 3
+    assert ai._backoff(0, rate_limited('3600')) == ai.backoff_cap
+    assert 0 <= ai._backoff(3, rate_limited('soon')) <= ai.backoff_base * 8
+
+
+def test_disabled_gateway_refuses_calls(monkeypatch):
+    monkeypatch.delenv('ANTHROPIC_API_KEY', raising=False)
+    monkeypatch.delenv('AI_STANDIN', raising=False)
+
+    with pytest.raises(AIGatewayError):
+        asyncio.run(AIGateway(scheduler=RecordingScheduler()).complete(PROMPT, max_tokens=10))
@@ -0,0 +1,74 @@
+"""
+Tests for the PDF extractor
+"""
+import asyncio
+import io
+import threading
+from decimal import Decimal
+import pytest
+from ..cache.extraction_cache import ExtractionCache
+from ..generators.pdf_generator import PDFGenerator
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from ..parsers.pdf_table_parser import PageExtraction
+from .pdf_extractor import PDFExtractor
+
+
+@pytest.fixture
+def pdf():
+    budget = Budget(chapters=[BudgetChapter(code="01", title="Demoliciones", items=[
+        BudgetItem(code="01.01", description="Demolición de tabique", unit="m2",
+                   quantity=Decimal("20"), price=Decimal("8.50")),
+    ])])
+    buffer = io.BytesIO()
+    PDFGenerator().generate_file(budget, buffer)
+    return buffer.getvalue()
+
+
+def extract(extractor, pdf, **options):
+    return asyncio.run(extractor.extract_with_report(io.BytesIO(pdf), use_ai=False, **options))
+
+
+def test_extractions_are_served_from_the_cache_off_the_event_loop(tmp_path, pdf):
+    cache = ExtractionCache(str(tmp_path / 'extraction.sqlite3'))
+    threads = []
+    get = cache.get
+
+    def tracked_get(key):
+        threads.append(threading.current_thread())
+        return get(key)
+
+    cache.get = tracked_get
+    extractor = PDFExtractor(cache=cache)
+
+    budget, report = extract(extractor, pdf)
+    assert report['source'] == 'extraction'
+    assert [item.code for item in budget.chapters[0].items] == ["01.01"]
+
+    cached, report = extract(extractor, pdf)
+    assert report['source'] == 'cache'
+    assert cached == budget
+    assert threading.main_thread() not in threads
+
+    _, report = extract(extractor, pdf, refresh_cache=True)
+    assert report['source'] == 'extraction'
+
+
+def test_rule_parsing_runs_off_the_event_loop(tmp_path, pdf):
+    extractor = PDFExtractor(cache=ExtractionCache(str(tmp_path / 'extraction.sqlite3')))
+    # Pages the table parser cannot read are left to the rules
+    extractor.table_parser.parse_pages = lambda pages, chapters: iter([
+        PageExtraction(page_number=1, text="DEMOLICIONES\nD01 Demolición de tabique 20,00 m2 8,50 170,00")
+    ])
+    threads = []
+    parse = extractor.rule_parser.parse
+
+    def tracked_parse(lines, budget=None):
+        threads.append(threading.current_thread())
+        return parse(lines, budget)
+
+    extractor.rule_parser.parse = tracked_parse
+
+    budget, _ = extract(extractor, pdf)
+
+    assert [item.code for item in budget.chapters[0].items] == ["D01"]
+    assert threads and threading.main_thread() not in threads
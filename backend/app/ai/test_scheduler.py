@@ -0,0 +1,139 @@
+"""
+Tests for the shared rate limits
+"""
+import asyncio
+import pytest
+from .scheduler import AIScheduler, RateLimiter, ai_priority, current_priority
+
+
+class Clock:
+    """Controllable replacement for time.time"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('time.time', clock)
+    return clock
+
+
+def limiter(tmp_path, rpm=3, tpm=600):
+    return RateLimiter(str(tmp_path / 'ratelimit.sqlite3'), requests_per_minute=rpm, tokens_per_minute=tpm)
+
+
+def test_calls_take_from_both_buckets_until_one_is_empty(tmp_path, clock):
+    rate = limiter(tmp_path)
+
+    assert [rate.try_acquire(100) for _ in range(3)] == [0, 0, 0]
+    # The request bucket is empty and refills at 3 per minute
+    assert rate.try_acquire(100) == pytest.approx(20)
+
+
+def test_waits_for_the_token_bucket(tmp_path, clock):
+    rate = limiter(tmp_path)
+
+    assert rate.try_acquire(500) == 0
+    # 100 tokens left, 300 more needed at 10 per second
+    assert rate.try_acquire(400) == pytest.approx(30)
+
+
+def test_buckets_refill_with_time(tmp_path, clock):
+    rate = limiter(tmp_path)
+    assert rate.try_acquire(600) == 0
+
+    clock.now += 30
+    assert rate.try_acquire(300) == 0
+    assert rate.try_acquire(1) > 0
+
+    # Buckets never refill past their capacity
+    clock.now += 3600
+    assert rate.try_acquire(600) == 0
+
+
+def test_calls_larger_than_the_bucket_wait_for_it_to_be_full(tmp_path, clock):
+    rate = limiter(tmp_path)
+    assert rate.try_acquire(100) == 0
+
+    assert rate.try_acquire(5000) == pytest.approx(10)
+    clock.now += 10
+    assert rate.try_acquire(5000) == 0
+
+
+def test_reserve_is_left_for_higher_priorities(tmp_path, clock):
+    rate = limiter(tmp_path, rpm=0)
+    assert rate.try_acquire(400) == 0
+
+    assert rate.try_acquire(100, reserve=0.2) > 0
+    assert rate.try_acquire(100) == 0
+
+
+def test_adjust_returns_unused_tokens(tmp_path, clock):
+    rate = limiter(tmp_path)
+    assert rate.try_acquire(600) == 0
+
+    rate.adjust(400)
+    assert rate.try_acquire(400) == 0
+    assert rate.try_acquire(1) > 0
+
+
+def test_limits_are_shared_through_the_database(tmp_path, clock):
+    first, second = limiter(tmp_path), limiter(tmp_path)
+
+    assert first.try_acquire(600) == 0
+    assert second.try_acquire(1) > 0
+
+
+def test_drain_empties_every_bucket(tmp_path, clock):
+    rate = limiter(tmp_path)
+
+    rate.drain()
+    assert rate.try_acquire(1) == pytest.approx(20)
+
+
+def test_no_limits_disable_the_limiter(tmp_path, clock):
+    rate = limiter(tmp_path, rpm=0, tpm=0)
+
+    assert not rate.enabled
+    assert all(rate.try_acquire(10 ** 9) == 0 for _ in range(5))
+
+
+def test_scheduler_serves_interactive_calls_first(tmp_path):
+    async def run():
+        scheduler = AIScheduler(limiter(tmp_path, rpm=1, tpm=0), batch_reserve=0, max_poll_interval=0.01)
+        await scheduler.acquire(1)
+        await scheduler.throttle()
+
+        order = []
+
+        async def call(name, priority):
+            await scheduler.acquire(1, priority)
+            order.append(name)
+
+        batch = asyncio.create_task(call('batch', 'batch'))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call('interactive', 'interactive'))
+        await asyncio.sleep(0.05)
+        # Both calls are queued behind the empty bucket; open the limits
+        scheduler.limiter = limiter(tmp_path / 'open', rpm=100, tpm=0)
+        await asyncio.gather(batch, interactive)
+        return order
+
+    (tmp_path / 'open').mkdir()
+    assert asyncio.run(run()) == ['interactive', 'batch']
+
+
+def test_ai_priority_sets_the_context():
+    assert current_priority() == 'interactive'
+    with ai_priority('batch'):
+        assert current_priority() == 'batch'
+    assert current_priority() == 'interactive'
+
+    with pytest.raises(ValueError):
+        with ai_priority('urgent'):
+            pass
@@ -0,0 +1,121 @@
+"""
+Tests for the local AI stand-in
+"""
+import asyncio
+import io
+import json
+import httpx
+import pytest
+from reportlab.pdfgen import canvas
+from ..cache.extraction_cache import ExtractionCache
+from ..parsers.pdf_table_parser import PageExtraction
+from .gateway import AIGateway
+from .pdf_extractor import PDFExtractor
+from .scheduler import AIScheduler, RateLimiter
+from .standin import ENHANCE_MARKER, REVIEW_MARKER, StandInTransport, standin_transport
+
+URL = 'https://api.anthropic.com/v1/messages'
+
+
+def call(transport, prompt, model='model', max_tokens=1024, url=URL):
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.post(url, json={
+                'model': model, 'max_tokens': max_tokens, 'messages': [{'role': 'user', 'content': prompt}]
+            })
+    return asyncio.run(run())
+
+
+def listed(items):
+    """Items as the enhancement prompt lists them, one per line"""
+    return "[\n" + ",\n".join(json.dumps(item) for item in items) + "\n]\n"
+
+
+def standin(mode='synthesize', **options):
+    return StandInTransport(mode, latency=0, token_latency=0, **options)
+
+
+def test_enhancement_prompts_get_every_item_back():
+    prompt = f"Mejora...\n\n{ENHANCE_MARKER}" + listed([
+        {'id': 1, 'code': "A", 'description': "Muro", 'unit': "m2"},
+        {'id': 2, 'code': "B", 'description': "Solera", 'unit': "m2"},
+    ])
+
+    reply = call(standin(), prompt).json()
+
+    items = json.loads(reply['content'][0]['text'])
+    assert [(item['id'], item['description']) for item in items] == [(1, "Muro. Mu"), (2, "Solera. Sole")]
+    assert reply['usage']['output_tokens'] > 0 and reply['stop_reason'] == 'end_turn'
+
+
+def test_review_verdicts_are_deterministic():
+    prompt = f"{REVIEW_MARKER}:\n[1] Precio alto\n[2] Cantidad baja\n"
+
+    first = json.loads(call(standin(), prompt).json()['content'][0]['text'])
+
+    assert [finding['id'] for finding in first['findings']] == [1, 2]
+    assert json.loads(call(standin(), prompt).json()['content'][0]['text']) == first
+
+
+def test_replies_past_max_tokens_are_cut_off():
+    prompt = ENHANCE_MARKER + listed([{'id': 1, 'description': "x" * 400}])
+
+    reply = call(standin(), prompt, max_tokens=10).json()
+
+    assert reply['stop_reason'] == 'max_tokens'
+    assert reply['usage']['output_tokens'] <= 11
+
+
+def test_errors_are_injected_at_the_given_rate():
+    always = call(standin(error_rate=1, error_status=429), "hola")
+    assert (always.status_code, always.headers['retry-after']) == (429, '1')
+    assert always.json()['error']['type'] == 'rate_limit_error'
+
+    transport = standin(error_rate=0.5, error_status=529, seed=7)
+    statuses = [call(transport, "hola").status_code for _ in range(40)]
+    assert 10 < statuses.count(529) < 30 and set(statuses) == {200, 529}
+    assert call(standin(), "hola", url='https://api.anthropic.com/v1/models').status_code == 404
+
+
+def test_recorded_replies_are_replayed(tmp_path):
+    recorded = {'id': 'msg_real', 'type': 'message', 'role': 'assistant', 'model': 'model',
+                'content': [{'type': 'text', 'text': "respuesta real"}], 'stop_reason': 'end_turn',
+                'stop_sequence': None, 'usage': {'input_tokens': 3, 'output_tokens': 2}}
+    upstream = httpx.MockTransport(lambda request: httpx.Response(200, json=recorded))
+
+    assert call(standin('record', directory=str(tmp_path), upstream=upstream), "hola").json() == recorded
+
+    replay = standin('replay', directory=str(tmp_path))
+    assert call(replay, "hola").json() == recorded
+    # Prompts never recorded are synthesized
+    assert call(replay, "adiós").json()['id'].startswith('msg_standin_')
+
+
+def test_transport_follows_the_environment(monkeypatch):
+    monkeypatch.delenv('AI_STANDIN', raising=False)
+    assert standin_transport() is None
+
+    monkeypatch.setenv('AI_STANDIN', 'replay')
+    assert standin_transport().mode == 'replay'
+
+    monkeypatch.setenv('AI_STANDIN', 'dream')
+    with pytest.raises(ValueError):
+        standin_transport()
+
+
+def test_ai_extraction_runs_offline_against_the_standin(tmp_path):
+    gateway = AIGateway(api_key='test', max_retries=0, http_client=httpx.AsyncClient(transport=standin()),
+                        scheduler=AIScheduler(RateLimiter(str(tmp_path / 'ratelimit.sqlite3'), 0, 0)))
+    extractor = PDFExtractor(cache=ExtractionCache(str(tmp_path / 'extraction.sqlite3')), gateway=gateway)
+    # A page without a readable table, so it goes to the AI
+    extractor.table_parser.parse_pages = lambda pages, chapters: iter([
+        PageExtraction(page_number=1, text="DEMOLICIONES\nD01 Demolición de tabique 20,00 m2 8,50 170,00")
+    ])
+
+    pdf = io.BytesIO()
+    canvas.Canvas(pdf).save()
+
+    budget, report = asyncio.run(extractor.extract_with_report(pdf, use_ai=True))
+
+    assert report['pages'][0]['method'] == 'ai'
+    assert [(item.code, item.unit) for chapter in budget.chapters for item in chapter.items] == [("D01", "m2")]
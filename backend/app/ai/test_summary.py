@@ -0,0 +1,91 @@
+"""
+Tests for budget summaries
+"""
+import random
+from decimal import Decimal
+import numpy as np
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from ..validation.engine import ValidationEngine
+from .batching import estimate_tokens
+from .summary import BudgetSummarizer, _grouped_quantiles
+
+
+def item(code, unit, quantity, price, description=None):
+    return BudgetItem(code=code, description=description or f"Partida {code}", unit=unit,
+                      quantity=Decimal(str(quantity)), price=Decimal(str(price)))
+
+
+def large_budget(chapters=30, subchapters=4, items=40, seed=0):
+    rng = random.Random(seed)
+    return Budget(chapters=[
+        BudgetChapter(code=f"{c:02d}", title=f"Capítulo {c}", subchapters=[
+            BudgetChapter(code=f"{c:02d}.{s}", title=f"Subcapítulo {c}.{s}", items=[
+                item(f"{c:02d}.{s}.{i:03d}", rng.choice(["m2", "m3", "ud", "kg"]),
+                     rng.randint(1, 100), round(rng.uniform(1, 500), 2))
+                for i in range(items)
+            ])
+            for s in range(subchapters)
+        ])
+        for c in range(chapters)
+    ])
+
+
+def test_small_budgets_are_summarized_whole():
+    budget = Budget(chapters=[
+        BudgetChapter(code="01", title="Cimentación", items=[
+            item("01.01", "m3", 10, 100), item("01.02", "m3", 2, 50),
+        ], subchapters=[
+            BudgetChapter(code="01.1", title="Zapatas", items=[item("01.1.01", "kg", 100, 1.5)]),
+        ]),
+        BudgetChapter(code="02", title="Estructura", items=[item("02.01", "m3", 5, 300)]),
+    ])
+
+    lines = BudgetSummarizer(max_tokens=1500, top_k=2).summarize(budget).split("\n")
+
+    assert lines[1:4] == ["Total: 2750.00 EUR", "Capítulos: 3", "Partidas: 4"]
+    assert "  01 Cimentación | 3 | 1250.00 | 45.5%" in lines
+    assert "    01.1 Zapatas | 1 | 150.00 | 5.5%" in lines
+    assert "  m3: 3 | 50.00 / 50.00 / 100.00 / 100.00 / 300.00" in lines
+    expensive = lines.index("Partidas de mayor importe:")
+    assert [line.split(":")[0].strip() for line in lines[expensive + 1:expensive + 3]] == ["02.01", "01.01"]
+
+
+def test_large_budgets_fit_the_token_budget():
+    budget = large_budget()
+    summarizer = BudgetSummarizer(max_tokens=800, top_k=10)
+
+    summary = summarizer.summarize(budget, ValidationEngine().validate(budget))
+    lines = summary.split("\n")
+
+    assert sum(estimate_tokens(line) for line in lines) <= 800 * 1.1
+    # Subchapters are dropped before chapters, and counted instead
+    assert "  00 Capítulo 0 | 160 | 1876661.92 | 3.1% | 4 subcapítulos" in lines
+    assert not any(line.startswith("    00.0 ") for line in lines)
+    assert "  ... y 16 más" in lines
+    assert "Partidas de mayor importe:" in lines
+
+
+def test_anomalous_items_come_from_the_validation_report():
+    budget = Budget(chapters=[BudgetChapter(code="01", title="Obra", items=[
+        item(f"01.{i:02d}", "m2", 10, price) for i, price in enumerate([10, 11, 12, 10, 11, 12, 950])
+    ])])
+
+    summary = BudgetSummarizer().summarize(budget, ValidationEngine().validate(budget))
+    anomalies = summary.split("Partidas más anómalas:\n", 1)[1].split("\n")
+
+    assert "01.06" in anomalies[0]
+    assert BudgetSummarizer().summarize(budget).count("Partidas más anómalas") == 0
+
+
+def test_grouped_quantiles_take_the_nearest_lower_rank():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 100, 200)
+    groups = rng.integers(0, 4, 200)
+    counts = np.bincount(groups, minlength=4)
+    quantiles = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+    result = _grouped_quantiles(values, groups, counts, quantiles)
+
+    for group in range(4):
+        expected = np.quantile(values[groups == group], quantiles, method='lower')
+        assert np.allclose(result[group], expected)
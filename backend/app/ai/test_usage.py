@@ -0,0 +1,86 @@
+"""
+Tests for AI usage accounting
+"""
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ..main import ai_usage_header
+from ..routes.sse import event_stream
+from .usage import UsageMetrics, current_usage, record_cache_hits, record_call, track_usage
+
+
+@pytest.fixture(autouse=True)
+def prices(monkeypatch):
+    monkeypatch.setenv('AI_PRICE_INPUT_PER_MTOK', '3')
+    monkeypatch.setenv('AI_PRICE_OUTPUT_PER_MTOK', '15')
+
+
+def test_calls_and_cache_hits_are_accounted_to_the_request():
+    with track_usage(lambda: '/test/usage') as usage:
+        record_call('model', 1000, 200, 1.5, retries=2, queue_wait=0.5)
+        record_call('model', 0, 0, 0.25, ok=False)
+        record_cache_hits('memo', 3)
+        record_cache_hits('memo', 0)
+
+    assert current_usage() is None
+    assert (usage.calls, usage.failed_calls, usage.retries) == (2, 1, 2)
+    assert (usage.input_tokens, usage.output_tokens, usage.model_tokens) == (1000, 200, {'model': 1200})
+    assert usage.cost == pytest.approx(0.006)
+    assert usage.cache_hits == {'memo': 3}
+    assert usage.header() == (
+        "calls=2; failed=1; retries=2; input_tokens=1000; output_tokens=200; "
+        "latency=1.750; queue_wait=0.500; cost=0.006000; cache_hits=memo:3"
+    )
+
+
+def test_tasks_started_by_a_request_account_to_it():
+    async def run():
+        with track_usage(lambda: '/test/tasks') as usage:
+            await asyncio.gather(*(
+                asyncio.create_task(asyncio.to_thread(record_call, 'model', 10, 1, 0.1)) for _ in range(3)
+            ))
+        return usage
+
+    assert asyncio.run(run()).calls == 3
+
+
+def test_route_metrics_count_requests_that_used_ai():
+    metrics = UsageMetrics()
+    metrics.add_request('/a')
+    metrics.add_call('/a', 'model', 10, 5, 0.5, 0, True, 0.001)
+    metrics.add_call('/b', 'model', 20, 0, 0.5, 1, False, 0.0)
+    metrics.add_cache_hits('/b', 'extraction', 1)
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot['routes']['/a']['requests'] == 1
+    assert snapshot['routes']['/b']['cache_hits'] == {'extraction': 1}
+    total = snapshot['total']
+    assert (total['requests'], total['calls'], total['failed_calls'], total['retries']) == (1, 2, 1, 1)
+    assert total['input_tokens'] == 30
+
+
+def test_usage_header_is_left_off_event_streams():
+    app = FastAPI()
+    app.middleware('http')(ai_usage_header)
+
+    @app.get('/plain')
+    async def plain():
+        record_call('model', 10, 2, 0.1)
+        return {}
+
+    @app.get('/stream')
+    async def stream():
+        async def events():
+            record_call('model', 10, 2, 0.1)
+            yield {'event': 'done', 'data': {}}
+        return event_stream(events())
+
+    client = TestClient(app)
+    plain = client.get('/plain')
+    streamed = client.get('/stream')
+
+    assert plain.headers['X-AI-Usage'].startswith("calls=1;")
+    assert 'X-AI-Usage' not in streamed.headers
+    assert 'event: usage\ndata: {"calls": 1,' in streamed.text
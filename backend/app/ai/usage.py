@@ -0,0 +1,224 @@
+"""
+AI Usage
+Token, latency, retry and cache accounting of AI work, per request and per route
+"""
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# Route label of AI work done outside any request
+BACKGROUND_ROUTE = 'background'
+
+
+@dataclass
+class AIUsage:
+    """AI work done on behalf of one request, or accumulated for a route"""
+    calls: int = 0
+    failed_calls: int = 0
+    retries: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Seconds spent in AI calls, retries and backoff included, summed over calls
+    latency: float = 0.0
+    # Part of the latency spent waiting for the shared rate limits
+    queue_wait: float = 0.0
+    # Estimated from AI_PRICE_INPUT_PER_MTOK and AI_PRICE_OUTPUT_PER_MTOK
+    cost: float = 0.0
+    # Results served from a cache instead of an AI call, by cache name
+    cache_hits: Dict[str, int] = field(default_factory=dict)
+    # Tokens (input plus output) by model
+    model_tokens: Dict[str, int] = field(default_factory=dict)
+
+    def add_call(self, model: str, input_tokens: int, output_tokens: int, latency: float,
+                 retries: int, ok: bool, cost: float, queue_wait: float = 0.0):
+        """Account for one AI call"""
+        self.calls += 1
+        self.failed_calls += 0 if ok else 1
+        self.retries += retries
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.latency += latency
+        self.queue_wait += queue_wait
+        self.cost += cost
+        self.model_tokens[model] = self.model_tokens.get(model, 0) + input_tokens + output_tokens
+
+    def add_cache_hits(self, cache: str, count: int):
+        """Account for results served from a cache"""
+        self.cache_hits[cache] = self.cache_hits.get(cache, 0) + count
+
+    def merge(self, other: 'AIUsage'):
+        """Add the usage of another request or route"""
+        self.calls += other.calls
+        self.failed_calls += other.failed_calls
+        self.retries += other.retries
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.latency += other.latency
+        self.queue_wait += other.queue_wait
+        self.cost += other.cost
+        for cache, count in other.cache_hits.items():
+            self.add_cache_hits(cache, count)
+        for model, tokens in other.model_tokens.items():
+            self.model_tokens[model] = self.model_tokens.get(model, 0) + tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Usage in the API response format"""
+        data = asdict(self)
+        data['latency'] = round(self.latency, 3)
+        data['queue_wait'] = round(self.queue_wait, 3)
+        data['cost'] = round(self.cost, 6)
+        return data
+
+    def header(self) -> str:
+        """Compact form for the X-AI-Usage response header"""
+        parts = [
+            f"calls={self.calls}",
+            f"failed={self.failed_calls}",
+            f"retries={self.retries}",
+            f"input_tokens={self.input_tokens}",
+            f"output_tokens={self.output_tokens}",
+            f"latency={self.latency:.3f}",
+            f"queue_wait={self.queue_wait:.3f}",
+            f"cost={self.cost:.6f}",
+        ]
+        if self.cache_hits:
+            parts.append("cache_hits=" + ",".join(f"{name}:{count}" for name, count in self.cache_hits.items()))
+        return "; ".join(parts)
+
+
+class UsageMetrics:
+    """Process-wide AI usage, accumulated by route"""
+
+    def __init__(self):
+        self._routes: Dict[str, AIUsage] = {}
+        self._requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_call(self, route: str, *args):
+        """Account for one AI call made for a route (arguments as AIUsage.add_call)"""
+        with self._lock:
+            self._routes.setdefault(route, AIUsage()).add_call(*args)
+
+    def add_cache_hits(self, route: str, cache: str, count: int):
+        """Account for cache hits of a route"""
+        with self._lock:
+            self._routes.setdefault(route, AIUsage()).add_cache_hits(cache, count)
+
+    def add_request(self, route: str):
+        """Count a request of a route that used AI or its caches"""
+        with self._lock:
+            self._requests[route] = self._requests.get(route, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Usage by route and in total"""
+        with self._lock:
+            total = AIUsage()
+            routes = {}
+            for route, usage in sorted(self._routes.items()):
+                routes[route] = {'requests': self._requests.get(route, 0), **usage.to_dict()}
+                total.merge(usage)
+            return {'routes': routes, 'total': {'requests': sum(self._requests.values()), **total.to_dict()}}
+
+
+class _Scope:
+    """Usage of the request being served, labelled by route once it is known"""
+
+    def __init__(self, route: Callable[[], str]):
+        self.usage = AIUsage()
+        self.route = route
+        self.counted = False
+
+    def label(self) -> str:
+        """Route label, counting the request in the metrics the first time it uses AI"""
+        route = self.route()
+        if not self.counted:
+            self.counted = True
+            _metrics.add_request(route)
+        return route
+
+
+_metrics = UsageMetrics()
+_current: contextvars.ContextVar[Optional[_Scope]] = contextvars.ContextVar('ai_usage', default=None)
+
+
+@contextmanager
+def track_usage(route: Callable[[], str]) -> Iterator[AIUsage]:
+    """
+    Account AI work done within the block (and tasks started from it) to a request
+
+    Args:
+        route: Returns the route label; called when work is recorded, so it
+            may resolve the matched route after routing
+
+    Yields:
+        Usage of the request, updated as work is recorded
+    """
+    scope = _Scope(route)
+    token = _current.set(scope)
+    try:
+        yield scope.usage
+    finally:
+        _current.reset(token)
+
+
+def current_usage() -> Optional[AIUsage]:
+    """Usage of the request being served, if any"""
+    scope = _current.get()
+    return scope.usage if scope is not None else None
+
+
+def record_call(model: str, input_tokens: int, output_tokens: int, latency: float,
+                retries: int = 0, ok: bool = True, queue_wait: float = 0.0):
+    """
+    Account for one AI call
+
+    Args:
+        model: Model called
+        input_tokens: Prompt tokens reported by the API (0 if the call failed)
+        output_tokens: Completion tokens reported by the API
+        latency: Seconds from the first attempt to the result
+        retries: Attempts beyond the first
+        ok: Whether the call returned a result
+        queue_wait: Seconds of the latency spent waiting for the rate limits
+    """
+    # USD per million tokens
+    input_price = float(os.getenv('AI_PRICE_INPUT_PER_MTOK', 3.0))
+    output_price = float(os.getenv('AI_PRICE_OUTPUT_PER_MTOK', 15.0))
+    cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+    args = (model, input_tokens, output_tokens, latency, retries, ok, cost, queue_wait)
+    scope = _current.get()
+    if scope is not None:
+        scope.usage.add_call(*args)
+    _metrics.add_call(scope.label() if scope is not None else BACKGROUND_ROUTE, *args)
+
+
+def record_cache_hits(cache: str, count: int = 1):
+    """
+    Account for AI results served from a cache
+
+    Args:
+        cache: Cache name
+        count: Results served
+    """
+    if count <= 0:
+        return
+    scope = _current.get()
+    if scope is not None:
+        scope.usage.add_cache_hits(cache, count)
+    _metrics.add_cache_hits(scope.label() if scope is not None else BACKGROUND_ROUTE, cache, count)
+
+
+def with_usage(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the usage of the current request to a JSON response body as 'ai_usage'"""
+    usage = current_usage()
+    if usage is not None:
+        payload['ai_usage'] = usage.to_dict()
+    return payload
+
+
+def get_usage_metrics() -> UsageMetrics:
+    """Return the process-wide usage metrics"""
+    return _metrics
@@ -0,0 +1,12 @@
+"""
+AI Versions
+Models and prompt versions of the AI services, readable without loading them
+"""
+from .gateway import AIGateway
+
+# Bump a prompt version whenever its prompt or rules change so cached results are invalidated
+EXTRACTION_MODEL = "claude-3-5-sonnet-20241022"
+EXTRACTION_PROMPT_VERSION = "2"
+
+ENHANCEMENT_MODEL = AIGateway.DEFAULT_MODEL
+ENHANCEMENT_PROMPT_VERSION = "2"
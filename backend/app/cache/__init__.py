@@ -0,0 +1,9 @@
+"""Caches for expensive budget processing"""
+from .extraction_cache import ExtractionCache
+from .description_memo import DescriptionMemo
+from .lru import LRUCache
+from .result_cache import CachedResult, ResultCache
+from .single_flight import FlightLocks, SingleFlight, get_single_flight
+
+__all__ = ['ExtractionCache', 'DescriptionMemo', 'LRUCache', 'CachedResult', 'ResultCache',
+           'FlightLocks', 'SingleFlight', 'get_single_flight']
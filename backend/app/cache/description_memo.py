@@ -0,0 +1,120 @@
+"""
+Description Memo
+Persistent memo of AI-enhanced item descriptions
+"""
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, Iterable, Optional
+from .sqlite_store import SQLiteStore
+
+_WHITESPACE = re.compile(r'\s+')
+
+# SQLite limits the number of bound parameters per statement
+_CHUNK_SIZE = 500
+
+
+class DescriptionMemo(SQLiteStore):
+    """Map normalized (description, unit, model, prompt version) to enhanced text"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS descriptions ("
+        "key TEXT PRIMARY KEY, enhanced TEXT NOT NULL, accessed_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS descriptions_accessed ON descriptions (accessed_at)",
+    )
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        """
+        Initialize description memo
+
+        Args:
+            path: SQLite database path (if None, uses CACHE_DIR from env)
+            max_entries: Entries kept before least recently used ones are evicted
+                (if None, reads DESCRIPTION_MEMO_MAX_ENTRIES from env)
+        """
+        cache_dir = os.getenv('CACHE_DIR', 'cache')
+        super().__init__(path or os.path.join(cache_dir, 'descriptions.sqlite3'))
+        self.max_entries = max_entries or int(os.getenv('DESCRIPTION_MEMO_MAX_ENTRIES', 200000))
+
+    @staticmethod
+    def make_key(description: str, unit: str, model: str, prompt_version: str) -> str:
+        """
+        Build the memo key for a description
+
+        Descriptions are compared case-insensitively, ignoring Unicode
+        normalization form and runs of whitespace.
+
+        Args:
+            description: Original item description
+            unit: Item unit
+            model: Model name used for enhancement
+            prompt_version: Version of the enhancement prompt template
+
+        Returns:
+            Hex digest identifying the description
+        """
+        normalized = _normalize(description)
+        return hashlib.sha256(
+            f"{normalized}|{_normalize(unit)}|{model}|{prompt_version}".encode('utf-8')
+        ).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """
+        Look up many keys at once
+
+        Args:
+            keys: Memo keys
+
+        Returns:
+            Mapping of the keys found to their enhanced text
+        """
+        keys = list(keys)
+        found: Dict[str, str] = {}
+        now = time.time()
+
+        with self._connect() as conn:
+            for start in range(0, len(keys), _CHUNK_SIZE):
+                chunk = keys[start:start + _CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, enhanced FROM descriptions WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+
+            hits = list(found)
+            for start in range(0, len(hits), _CHUNK_SIZE):
+                chunk = hits[start:start + _CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                conn.execute(
+                    f"UPDATE descriptions SET accessed_at = ? WHERE key IN ({placeholders})",
+                    [now, *chunk]
+                )
+
+        return found
+
+    def set_many(self, entries: Dict[str, str]):
+        """Store enhanced texts and evict least recently used entries if needed"""
+        if not entries:
+            return
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO descriptions (key, enhanced, accessed_at) VALUES (?, ?, ?)",
+                [(key, enhanced, now) for key, enhanced in entries.items()]
+            )
+
+            count = conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM descriptions WHERE key IN ("
+                    "SELECT key FROM descriptions ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+
+def _normalize(text: str) -> str:
+    """Canonical form of a description for memo lookups"""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip().casefold()
@@ -0,0 +1,111 @@
+"""
+Extraction Cache
+Persistent SQLite store for budgets extracted from PDF files
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Optional
+from ..models.budget import Budget
+from .sqlite_store import SQLiteStore
+
+
+class ExtractionCache(SQLiteStore):
+    """Cache extracted budgets keyed by PDF content and extraction settings"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS extractions ("
+        "key TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, "
+        "created_at REAL NOT NULL, accessed_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed_at)",
+    )
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Initialize extraction cache
+
+        Args:
+            path: SQLite database path (if None, uses CACHE_DIR from env)
+            ttl: Seconds an entry stays valid (if None, reads from env)
+            max_bytes: Maximum total size of stored budgets (if None, reads from env)
+        """
+        cache_dir = os.getenv('CACHE_DIR', 'cache')
+        super().__init__(path or os.path.join(cache_dir, 'extraction.sqlite3'))
+        self.ttl = ttl if ttl is not None else int(os.getenv('EXTRACTION_CACHE_TTL', 30 * 24 * 3600))
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv('EXTRACTION_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        )
+
+    @staticmethod
+    def make_key(content_hash: str, mode: str, model: str, prompt_version: str) -> str:
+        """
+        Build the cache key for a PDF and extraction settings
+
+        Args:
+            content_hash: SHA-256 hex digest of the PDF
+            mode: Extraction mode ('ai' or 'rules')
+            model: Model name used for extraction
+            prompt_version: Version of the extraction prompt template
+
+        Returns:
+            Hex digest identifying the extraction
+        """
+        return hashlib.sha256(
+            f"{content_hash}|{mode}|{model}|{prompt_version}".encode('utf-8')
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[Budget]:
+        """Return the cached budget for a key, or None if missing or expired"""
+        now = time.time()
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data, created_at FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            data, created_at = row
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+
+        return Budget.model_validate_json(data)
+
+    def set(self, key: str, budget: Budget):
+        """Store a budget under a key and evict old entries if needed"""
+        data = budget.model_dump_json()
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, data, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict(conn, now)
+
+    def delete(self, key: str):
+        """Remove a cached entry"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        conn.execute("DELETE FROM extractions WHERE created_at < ?", (now - self.ttl,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in conn.execute(
+            "SELECT key, size FROM extractions ORDER BY accessed_at ASC"
+        ).fetchall():
+            conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
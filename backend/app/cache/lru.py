@@ -0,0 +1,46 @@
+"""
+LRU Cache
+Bounded in-memory cache for results reused between requests of a worker
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entries"""
+
+    def __init__(self, max_size: int):
+        """
+        Initialize LRU cache
+
+        Args:
+            max_size: Total size of the entries kept before the least recently
+                used ones are evicted (each entry has size 1 unless told otherwise)
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Value stored for a key, marking it as recently used"""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def set(self, key: Hashable, value: Any, size: int = 1):
+        """Store a value and evict the least recently used entries if needed"""
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            # The newest entry is kept even if it alone exceeds the limit
+            while self.size > self.max_size and len(self._entries) > 1:
+                self.size -= self._entries.popitem(last=False)[1][1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
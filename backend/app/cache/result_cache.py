@@ -0,0 +1,171 @@
+"""
+Result Cache
+Converted files kept on local disk, keyed by input content and conversion settings
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Optional
+from .sqlite_store import SQLiteStore
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class CachedResult:
+    """A converted file on disk and how to serve it"""
+    path: str
+    etag: str
+    media_type: str
+    filename: Optional[str] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Open handle on the file, set by ResultCache.get; it stays readable even if
+    # the entry is evicted (and the file unlinked) meanwhile. The caller closes it.
+    file: Optional[BinaryIO] = None
+
+
+class ResultCache(SQLiteStore):
+    """Cache conversion outputs as files, evicting the least recently used past max_bytes"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS results ("
+        "key TEXT PRIMARY KEY, etag TEXT NOT NULL, media_type TEXT NOT NULL, filename TEXT, "
+        "headers TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)",
+    )
+
+    def __init__(self, path: Optional[str] = None, directory: Optional[str] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Initialize result cache
+
+        Args:
+            path: SQLite index path (if None, uses CACHE_DIR from env)
+            directory: Where files are stored (if None, a folder in CACHE_DIR)
+            max_bytes: Maximum total size of stored files, 0 to disable the
+                cache (if None, reads RESULT_CACHE_MAX_BYTES from env)
+        """
+        cache_dir = os.getenv('CACHE_DIR', 'cache')
+        super().__init__(path or os.path.join(cache_dir, 'results.sqlite3'))
+        self.directory = directory or os.path.join(cache_dir, 'results')
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv('RESULT_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Whether results are cached at all"""
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(content_hash: str, endpoint: str, options: Dict[str, Any], version: str) -> str:
+        """
+        Build the cache key of a conversion
+
+        Args:
+            content_hash: SHA-256 hex digest of the input
+            endpoint: Conversion route
+            options: Options that change the output
+            version: Version of the code producing the output
+
+        Returns:
+            Hex digest identifying the output
+        """
+        settings = json.dumps(options, sort_keys=True)
+        return hashlib.sha256(f"{content_hash}|{endpoint}|{settings}|{version}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """
+        Return the cached output for a key, or None if missing
+
+        The output's file is opened here, so it can still be read after another
+        request or process evicts it; the caller must close CachedResult.file.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT etag, media_type, filename, headers FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            path = self._path(key)
+            try:
+                file = open(path, 'rb')
+            except FileNotFoundError:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (time.time(), key))
+
+        return CachedResult(path, row[0], row[1], row[2], json.loads(row[3]), file)
+
+    def put(self, key: str, source: BinaryIO, media_type: str, filename: Optional[str] = None,
+            headers: Optional[Dict[str, str]] = None) -> CachedResult:
+        """
+        Store an output under a key and evict old entries if needed
+
+        Args:
+            key: Cache key
+            source: File object holding the output, read from its start
+            media_type: Content type of the output
+            filename: File name offered for download, if any
+            headers: Extra response headers to serve with the output
+
+        Returns:
+            The stored output, without an open file: it may be evicted at any
+            time, so read it again with get or from source
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+
+        # Write under a temporary name so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                source.seek(0)
+                while chunk := source.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            os.replace(temp_path, self._path(key))
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+        result = CachedResult(self._path(key), f'"{digest.hexdigest()[:32]}"', media_type, filename, headers or {})
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, etag, media_type, filename, headers, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, result.etag, media_type, filename, json.dumps(result.headers), size, now, now)
+            )
+            self._evict(conn, keep=key)
+        return result
+
+    def _evict(self, conn: sqlite3.Connection, keep: str):
+        """Drop least recently used entries (other than the one just stored) until under max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in conn.execute(
+            "SELECT key, size FROM results WHERE key != ? ORDER BY accessed_at ASC", (keep,)
+        ).fetchall():
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _path(self, key: str) -> str:
+        """File holding the output of a key"""
+        return os.path.join(self.directory, key)
@@ -0,0 +1,184 @@
+"""
+Single Flight
+Coalesce identical work in flight, within a process and across the processes of a host
+"""
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# Numbers the leads of the process, shared by every instance so lease owners never repeat
+_leads = itertools.count()
+
+
+class FlightLocks(SQLiteStore):
+    """Leases on work keys kept in SQLite, so one process of a host does a piece of work at a time"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS flights ("
+        "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)",
+    )
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize flight locks
+
+        Args:
+            path: SQLite database path (if None, uses CACHE_DIR from env)
+        """
+        cache_dir = os.getenv('CACHE_DIR', 'cache')
+        super().__init__(path or os.path.join(cache_dir, 'flights.sqlite3'))
+
+    def try_acquire(self, key: str, owner: str, lease: float) -> bool:
+        """Take the lease on a key unless another owner holds an unexpired one"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires_at FROM flights WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO flights (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, now + lease)
+            )
+        return True
+
+    def renew(self, key: str, owner: str, lease: float):
+        """Extend a lease still held"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE flights SET expires_at = ? WHERE key = ? AND owner = ?",
+                (time.time() + lease, key, owner)
+            )
+
+    def release(self, key: str, owner: str):
+        """Give up a lease"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, owner))
+
+
+@dataclass
+class _Flight:
+    """Work in flight and the callers awaiting it"""
+    task: asyncio.Task
+    waiters: int = 0
+
+
+class SingleFlight:
+    """Run a piece of work once for all callers asking for it at the same time"""
+
+    def __init__(self, locks: Optional[FlightLocks] = None, lease: Optional[float] = None,
+                 poll_interval: float = 0.1):
+        """
+        Initialize single flight
+
+        Args:
+            locks: Cross-process leases (if None, created unless
+                SINGLE_FLIGHT_PROCESSES=false, which coalesces only within
+                the process)
+            lease: Seconds a lease lasts without renewal, so the work of a
+                process that died is taken over (if None, reads
+                SINGLE_FLIGHT_LEASE from env)
+            poll_interval: Seconds between checks of a lease held by another process
+        """
+        if locks is None and os.getenv('SINGLE_FLIGHT_PROCESSES', 'true').lower() == 'true':
+            locks = FlightLocks()
+        self.locks = locks
+        self.lease = lease if lease is not None else float(os.getenv('SINGLE_FLIGHT_LEASE', 60))
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, _Flight] = {}
+        # Runs started, and callers that joined a run in flight instead
+        self.started = 0
+        self.joined = 0
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run work for a key, or join the run already in flight
+
+        Work runs as a task of its own and is cancelled only once every
+        caller awaiting it is cancelled, so it must not use resources the
+        starting caller releases when it goes away, e.g. its upload.
+
+        Once this process leads, it waits for any other process of the host
+        doing the same key to finish before starting, so work should first
+        look for a result the other process may have stored.
+
+        Args:
+            key: Identifies the work, e.g. input hash and options
+            work: Coroutine function doing the work
+
+        Returns:
+            Tuple of (result, whether this caller started the work); the same
+            result object is returned to every caller
+        """
+        flight = self._flights.get(key)
+        started = flight is None
+        if started:
+            flight = _Flight(asyncio.create_task(self._lead(key, work)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.joined += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), started
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of runs in flight in this process"""
+        return len(self._flights)
+
+    def _forget(self, key: str, flight: _Flight):
+        """Drop a finished flight, so later callers start afresh"""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _lead(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Do the work once no other process of the host is doing it"""
+        if not self.locks:
+            return await work()
+
+        owner = f"{self._owner}:{next(_leads)}"
+        while not await asyncio.to_thread(self.locks.try_acquire, key, owner, self.lease):
+            await asyncio.sleep(self.poll_interval)
+
+        renewal = asyncio.create_task(self._renew(key, owner))
+        try:
+            return await work()
+        finally:
+            renewal.cancel()
+            await asyncio.to_thread(self.locks.release, key, owner)
+
+    async def _renew(self, key: str, owner: str):
+        """Keep a lease while the work runs"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await asyncio.to_thread(self.locks.renew, key, owner, self.lease)
+            except Exception as e:
+                logger.warning("Flight lease renewal failed: %s", e)
+
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide single flight"""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
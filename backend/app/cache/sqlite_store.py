@@ -0,0 +1,48 @@
+"""
+SQLite Store
+Shared plumbing for the persistent SQLite-backed caches
+"""
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Tuple
+
+
+class SQLiteStore:
+    """Base class for stores kept in a local SQLite database"""
+
+    # CREATE statements executed once per process on first use
+    SCHEMA: Tuple[str, ...] = ()
+
+    def __init__(self, path: str):
+        """
+        Initialize store
+
+        Args:
+            path: SQLite database path (parent directories are created)
+        """
+        self.path = path
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection, commit on success and always close it"""
+        if not self._initialized:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                conn.commit()
+                self._initialized = True
+
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,41 @@
+"""
+Tests for the description memo
+"""
+import pytest
+from . import description_memo
+from .description_memo import DescriptionMemo
+
+
+@pytest.fixture
+def memo(tmp_path):
+    return DescriptionMemo(str(tmp_path / 'descriptions.sqlite3'), max_entries=3)
+
+
+def test_keys_ignore_case_unicode_form_and_whitespace():
+    key = DescriptionMemo.make_key("Excavación en zanja", "m3", "model", "1")
+
+    assert DescriptionMemo.make_key("  EXCAVACIÓN   en\tzanja ", "M3", "model", "1") == key
+    assert DescriptionMemo.make_key("Excavación en zanja", "m2", "model", "1") != key
+    assert DescriptionMemo.make_key("Excavación en zanja", "m3", "other", "1") != key
+    assert DescriptionMemo.make_key("Excavación en zanja", "m3", "model", "2") != key
+
+
+def test_lookups_return_only_stored_keys(memo):
+    memo.set_many({'a': "A mejorada", 'b': "B mejorada"})
+
+    assert memo.get_many(['a', 'c']) == {'a': "A mejorada"}
+    assert memo.get_many([]) == {}
+
+
+def test_least_recently_used_entries_are_evicted(memo, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(description_memo.time, 'time', lambda: now[0])
+
+    for key in 'abc':
+        memo.set_many({key: key.upper()})
+        now[0] += 1
+    memo.get_many(['a'])
+    now[0] += 1
+    memo.set_many({'d': "D"})
+
+    assert memo.get_many('abcd') == {'a': "A", 'c': "C", 'd': "D"}
@@ -0,0 +1,60 @@
+"""
+Tests for the extraction cache
+"""
+import hashlib
+import pytest
+from ..models.budget import Budget, BudgetChapter
+from . import extraction_cache
+from .extraction_cache import ExtractionCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExtractionCache(str(tmp_path / 'extraction.sqlite3'), ttl=60, max_bytes=1024 * 1024)
+
+
+def test_keys_depend_on_content_and_settings():
+    digest = hashlib.sha256(b'%PDF-1.4').hexdigest()
+    key = ExtractionCache.make_key(digest, 'rules', 'model', '1')
+
+    assert key == ExtractionCache.make_key(digest, 'rules', 'model', '1')
+    assert len({
+        key,
+        ExtractionCache.make_key(hashlib.sha256(b'%PDF-1.5').hexdigest(), 'rules', 'model', '1'),
+        ExtractionCache.make_key(digest, 'ai', 'model', '1'),
+        ExtractionCache.make_key(digest, 'rules', 'other', '1'),
+        ExtractionCache.make_key(digest, 'rules', 'model', '2'),
+    }) == 5
+
+
+def test_budgets_are_returned_until_they_expire(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(extraction_cache.time, 'time', lambda: now[0])
+    budget = Budget(chapters=[BudgetChapter(code="01", title="Demoliciones")])
+
+    assert cache.get('key') is None
+    cache.set('key', budget)
+    now[0] += 60
+    assert cache.get('key') == budget
+
+    now[0] += 1
+    assert cache.get('key') is None
+    # Expired entries are dropped, not just hidden
+    now[0] = 1000.0
+    assert cache.get('key') is None
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(extraction_cache.time, 'time', lambda: now[0])
+    budget = Budget(chapters=[BudgetChapter(code="01", title="x" * 1000)])
+    cache.max_bytes = 2 * len(budget.model_dump_json())
+
+    for key in ('a', 'b'):
+        cache.set(key, budget)
+        now[0] += 1
+    cache.get('a')
+    now[0] += 1
+    cache.set('c', budget)
+
+    assert [key for key in 'abc' if cache.get(key) is not None] == ['a', 'c']
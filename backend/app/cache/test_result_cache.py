@@ -0,0 +1,76 @@
+"""
+Tests for the conversion result cache
+"""
+import io
+import pytest
+from . import result_cache
+from .result_cache import ResultCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / 'results.sqlite3'), str(tmp_path / 'results'), max_bytes=10)
+
+
+def read(result):
+    with result.file:
+        return result.file.read()
+
+
+def cached(cache, keys):
+    """Keys whose output is still cached"""
+    found = [(key, cache.get(key)) for key in keys]
+    for _, result in found:
+        if result is not None:
+            result.file.close()
+    return [key for key, result in found if result is not None]
+
+
+def test_outputs_are_served_with_their_etag_and_headers(cache):
+    stored = cache.put('key', io.BytesIO(b'%PDF'), 'application/pdf', 'a.pdf', {'X-Extraction-Source': 'cache'})
+
+    result = cache.get('key')
+
+    assert read(result) == b'%PDF'
+    assert (result.etag, result.media_type, result.filename) == (stored.etag, 'application/pdf', 'a.pdf')
+    assert result.headers == {'X-Extraction-Source': 'cache'}
+    assert cache.put('other', io.BytesIO(b'%PDF'), 'application/pdf').etag == stored.etag
+    assert cache.get('missing') is None
+
+
+def test_least_recently_used_outputs_are_evicted_past_max_bytes(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'time', lambda: now[0])
+
+    for key in 'ab':
+        cache.put(key, io.BytesIO(b'1234'), 'application/json')
+        now[0] += 1
+    read(cache.get('a'))
+    now[0] += 1
+    cache.put('c', io.BytesIO(b'1234'), 'application/json')
+
+    # a was read after b was stored, so b makes room for c
+    assert cached(cache, 'abc') == ['a', 'c']
+
+
+def test_an_open_output_survives_its_eviction(cache):
+    cache.put('a', io.BytesIO(b'12345678'), 'application/json')
+    result = cache.get('a')
+
+    cache.put('b', io.BytesIO(b'abcdefgh'), 'application/json')
+
+    assert cached(cache, 'ab') == ['b']
+    assert read(result) == b'12345678'
+
+
+def test_outputs_whose_file_is_gone_are_forgotten(cache, tmp_path):
+    cache.put('a', io.BytesIO(b'1'), 'application/json')
+    (tmp_path / 'results' / 'a').unlink()
+
+    assert cache.get('a') is None
+    with cache._connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 0
+
+
+def test_a_zero_budget_disables_the_cache(tmp_path):
+    assert not ResultCache(str(tmp_path / 'results.sqlite3'), max_bytes=0).enabled
@@ -0,0 +1,159 @@
+"""
+Tests for single flight
+"""
+import asyncio
+import pytest
+from .single_flight import FlightLocks, SingleFlight
+
+
+class Work:
+    """Work that runs until released, counting its runs"""
+
+    def __init__(self, result='done'):
+        self.result = result
+        self.runs = 0
+        self.cancelled = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        self.started.set()
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.result
+
+
+@pytest.fixture(autouse=True)
+def in_process_only(monkeypatch):
+    monkeypatch.setenv('SINGLE_FLIGHT_PROCESSES', 'false')
+
+
+def single_flight(tmp_path=None):
+    locks = FlightLocks(str(tmp_path / 'flights.sqlite3')) if tmp_path else None
+    return SingleFlight(locks=locks, poll_interval=0.01)
+
+
+def test_concurrent_callers_share_one_run():
+    async def run():
+        flights, work = single_flight(), Work()
+        calls = [asyncio.create_task(flights.do('key', work)) for _ in range(3)]
+        await work.started.wait()
+        work.release.set()
+        results = await asyncio.gather(*calls)
+        return flights, work, results
+
+    flights, work, results = asyncio.run(run())
+
+    assert work.runs == 1
+    assert results == [('done', True), ('done', False), ('done', False)]
+    assert (flights.started, flights.joined) == (1, 2)
+
+
+def test_cancelling_one_caller_keeps_the_work_for_the_others():
+    async def run():
+        flights, work = single_flight(), Work()
+        first = asyncio.create_task(flights.do('key', work))
+        second = asyncio.create_task(flights.do('key', work))
+        await work.started.wait()
+
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        work.release.set()
+        return work, first, await second
+
+    work, first, result = asyncio.run(run())
+
+    assert first.cancelled()
+    assert result == ('done', False)
+    assert (work.runs, work.cancelled) == (1, 0)
+
+
+def test_cancelling_every_caller_cancels_the_work():
+    async def run():
+        flights, work = single_flight(), Work()
+        calls = [asyncio.create_task(flights.do('key', work)) for _ in range(2)]
+        await work.started.wait()
+
+        for call in calls:
+            call.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flights, work
+
+    flights, work = asyncio.run(run())
+
+    assert work.cancelled == 1
+    assert flights.in_flight == 0
+
+
+def test_finished_flights_are_forgotten():
+    async def run():
+        flights, work = single_flight(), Work()
+        work.release.set()
+        first = await flights.do('key', work)
+        second = await flights.do('key', work)
+        return flights, work, first, second
+
+    flights, work, first, second = asyncio.run(run())
+
+    assert (first, second) == (('done', True), ('done', True))
+    assert work.runs == 2
+    assert flights.in_flight == 0
+
+
+def test_errors_reach_every_caller():
+    async def fail():
+        await asyncio.sleep(0)
+        raise ValueError("bad input")
+
+    async def run():
+        flights = single_flight()
+        calls = [asyncio.create_task(flights.do('key', fail)) for _ in range(2)]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+def test_processes_wait_for_each_others_lease(tmp_path):
+    async def run():
+        # Two instances stand for two processes sharing the lease database
+        first, second = single_flight(tmp_path), single_flight(tmp_path)
+        first_work, second_work = Work('first'), Work('second')
+
+        leading = asyncio.create_task(first.do('key', first_work))
+        await first_work.started.wait()
+        waiting = asyncio.create_task(second.do('key', second_work))
+        await asyncio.sleep(0.05)
+        runs_while_leased = second_work.runs
+
+        first_work.release.set()
+        await leading
+        second_work.release.set()
+        return runs_while_leased, await waiting
+
+    runs_while_leased, result = asyncio.run(run())
+
+    assert runs_while_leased == 0
+    assert result == ('second', True)
+
+
+def test_leases_are_released_when_the_work_is_cancelled(tmp_path):
+    async def run():
+        flights, work = single_flight(tmp_path), Work()
+        call = asyncio.create_task(flights.do('key', work))
+        await work.started.wait()
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        return work
+
+    work = asyncio.run(run())
+
+    assert work.cancelled == 1
+    assert FlightLocks(str(tmp_path / 'flights.sqlite3')).try_acquire('key', 'other', 60)
@@ -1,5 +1,13 @@
 """Generators for different budget formats"""
-from .bc3_generator import BC3Generator
-from .pdf_generator import PDFGenerator
+import importlib
+
+# PDFGenerator loads reportlab, so generators are imported when first accessed
+_EXPORTS = {'BC3Generator': '.bc3_generator', 'PDFGenerator': '.pdf_generator'}
 
 __all__ = ['BC3Generator', 'PDFGenerator']
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
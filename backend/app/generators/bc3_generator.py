@@ -5,6 +5,7 @@ Generates FIEBDC-3 (BC3) budget files from Budget objects
 from typing import List, Set
 from datetime import datetime
 from ..models.budget import Budget, BudgetChapter, BudgetItem
+from ..metrics import stage
 
 
 class BC3Generator:
@@ -24,9 +25,20 @@ class BC3Generator:
         with open(file_path, 'w', encoding='latin-1') as f:
             f.write(content)
 
+    def generate_bytes(self, budget: Budget) -> bytes:
+        """Generate BC3 file data from a Budget object"""
+        return self.generate_content(budget).encode('latin-1')
+
     def generate_content(self, budget: Budget) -> str:
         """Generate BC3 content string from Budget object"""
+        with stage('render'):
+            return self._generate_records(budget)
+
+    def _generate_records(self, budget: Budget) -> str:
+        """Write every record of a budget"""
         records = []
+        # Codes already written, per file: the generator is shared between requests
+        self.generated_codes = set()
 
         # Version record
         records.append(self._generate_version_record())
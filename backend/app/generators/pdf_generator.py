@@ -8,13 +8,19 @@ from reportlab.lib.units import cm
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
+from reportlab.pdfbase import pdfmetrics
 from datetime import datetime
+from typing import BinaryIO, Union
 from ..models.budget import Budget, BudgetChapter
+from ..metrics import stage
 
 
 class PDFGenerator:
     """Generator for PDF budget documents"""
 
+    # Fonts of the styles and tables below
+    FONTS = ('Helvetica', 'Helvetica-Bold')
+
     def __init__(self):
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
@@ -52,8 +58,13 @@ class PDFGenerator:
             leftIndent=20
         ))
 
-    def generate_file(self, budget: Budget, file_path: str):
-        """Generate a PDF file from a Budget object"""
+    def preload(self):
+        """Load the font metrics reportlab otherwise reads during the first render"""
+        for name in self.FONTS:
+            pdfmetrics.getFont(name)
+
+    def generate_file(self, budget: Budget, file_path: Union[str, BinaryIO]):
+        """Generate a PDF file (a path or a writable binary file object) from a Budget object"""
         doc = SimpleDocTemplate(
             file_path,
             pagesize=A4,
@@ -76,7 +87,8 @@ class PDFGenerator:
         story.extend(self._generate_summary(budget))
 
         # Build PDF
-        doc.build(story)
+        with stage('render'):
+            doc.build(story)
 
     def _generate_header(self, budget: Budget) -> list:
         """Generate PDF header with budget info"""
@@ -0,0 +1,14 @@
+"""Conversion jobs run by worker processes"""
+from .store import (
+    JobStore, Job, JobResult, QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, FINAL_STATES
+)
+from .conversions import CONVERSIONS, Conversion, convert, get_services, warm_services
+from .pool import WorkerPool, get_worker_pool
+from .batch import BatchEntry, BatchError, BatchInput, expand_inputs, iter_batch_zip, submit_batch
+
+__all__ = [
+    'JobStore', 'Job', 'JobResult', 'QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED',
+    'FINAL_STATES', 'CONVERSIONS', 'Conversion', 'convert', 'get_services', 'warm_services',
+    'WorkerPool', 'get_worker_pool',
+    'BatchEntry', 'BatchError', 'BatchInput', 'expand_inputs', 'iter_batch_zip', 'submit_batch'
+]
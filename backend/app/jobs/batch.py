@@ -0,0 +1,268 @@
+"""
+Batch Conversion
+Fan a set of files out as jobs and stream their outputs back as one ZIP archive
+"""
+import asyncio
+import json
+import os
+import posixpath
+import time
+import zipfile
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, BinaryIO, Dict, Iterable, List, Optional, Tuple
+from .conversions import CONVERSIONS
+from .store import FAILED, FINAL_STATES, SUCCEEDED, JobStore
+
+MANIFEST_NAME = 'manifest.json'
+
+# Raised reading a damaged, truncated, encrypted or unsupported archive member
+READ_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, OSError, RuntimeError, NotImplementedError)
+
+
+@dataclass
+class BatchEntry:
+    """One input file of a batch and what became of it"""
+    file: str
+    output: Optional[str] = None
+    status: str = 'skipped'
+    error: Optional[str] = None
+    job_id: Optional[str] = None
+    seconds: Optional[float] = None
+    details: Dict = field(default_factory=dict)
+
+
+@dataclass
+class BatchInput:
+    """A file of a batch, read only when its job is queued"""
+    name: str
+    size: int
+    source: BinaryIO
+    # Entry of the ZIP archive in source holding the file, if any
+    archive: Optional[zipfile.ZipFile] = None
+    member: Optional[zipfile.ZipInfo] = None
+
+    def read(self) -> bytes:
+        """Content of the file"""
+        if self.archive is not None:
+            return self.archive.read(self.member)
+        self.source.seek(0)
+        return self.source.read()
+
+
+class BatchError(ValueError):
+    """Batch input that cannot be accepted"""
+
+
+class _ZipSink:
+    """Write-only file collecting what zipfile writes, to be handed out in chunks"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        """Bytes written since the last call"""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def expand_inputs(files: Iterable[Tuple[str, BinaryIO]], max_files: Optional[int] = None,
+                  max_bytes: Optional[int] = None) -> List[BatchInput]:
+    """
+    List the files of a batch, looking into ZIP archives without unpacking them
+
+    Args:
+        files: (name, file object) of each uploaded file, e.g. spooled uploads;
+            they must stay open until the batch is submitted
+        max_files: Most files accepted (if None, reads BATCH_MAX_FILES from env)
+        max_bytes: Most bytes accepted after unpacking (if None, reads BATCH_MAX_BYTES from env)
+
+    Returns:
+        Each file to convert; names inside an archive keep their folders
+
+    Raises:
+        BatchError: If an archive is invalid or the batch is too large
+    """
+    if max_files is None:
+        max_files = int(os.getenv('BATCH_MAX_FILES', 1000))
+    if max_bytes is None:
+        max_bytes = int(os.getenv('BATCH_MAX_BYTES', 512 * 1024 * 1024))
+
+    inputs = []
+    total = 0
+
+    def add(batch_input: BatchInput):
+        nonlocal total
+        # Archive members are read no further than their declared size, so it can be trusted
+        total += batch_input.size
+        if len(inputs) >= max_files:
+            raise BatchError(f"Batch has more than {max_files} files")
+        if total > max_bytes:
+            raise BatchError(f"Batch is larger than {max_bytes} bytes")
+        inputs.append(batch_input)
+
+    for name, source in files:
+        if not name.lower().endswith('.zip'):
+            add(BatchInput(name, source.seek(0, os.SEEK_END), source))
+            continue
+        try:
+            source.seek(0)
+            archive = zipfile.ZipFile(source)
+        except zipfile.BadZipFile as e:
+            raise BatchError(f"Invalid ZIP archive {name}: {e}")
+        for info in archive.infolist():
+            if not info.is_dir() and not _hidden(info.filename):
+                add(BatchInput(info.filename, info.file_size, source, archive, info))
+    return inputs
+
+
+def submit_batch(store: JobStore, inputs: List[BatchInput], target: str,
+                 options: Dict, timeout: float) -> List[BatchEntry]:
+    """
+    Queue a conversion job for every input that can be converted to the target format
+
+    Inputs are read one at a time, as their job is queued. An input that
+    cannot be read fails on its own; if queueing fails otherwise, the jobs
+    already queued are cancelled.
+
+    Args:
+        store: Job store
+        inputs: Files of the batch, from expand_inputs
+        target: Output format ('pdf', 'bc3' or 'json')
+        options: Conversion options, as for jobs
+        timeout: Seconds each conversion may run
+
+    Returns:
+        One entry per input; those that cannot be converted are 'skipped',
+        those that cannot be read 'failed'
+    """
+    entries = []
+    outputs = set()
+    try:
+        for batch_input in inputs:
+            name = batch_input.name
+            stem, extension = posixpath.splitext(name)
+            conversion = f"{extension.lower().lstrip('.')}-to-{target}"
+            entry = BatchEntry(file=name)
+            entries.append(entry)
+            if conversion not in CONVERSIONS:
+                entry.error = f"Cannot convert {extension or 'files without extension'} to {target}"
+                continue
+
+            try:
+                data = batch_input.read()
+            except READ_ERRORS as e:
+                entry.status, entry.error = FAILED, f"Cannot read {name}: {e}"
+                continue
+
+            output = f"{_safe_path(stem)}.{target}"
+            counter = 1
+            while output in outputs or output == MANIFEST_NAME:
+                counter += 1
+                output = f"{_safe_path(stem)}-{counter}.{target}"
+            outputs.add(output)
+
+            entry.output = output
+            entry.status = 'queued'
+            entry.job_id = store.submit(conversion, posixpath.basename(name), data, options, timeout)
+    except BaseException:
+        for entry in entries:
+            if entry.job_id:
+                store.cancel(entry.job_id)
+        raise
+    return entries
+
+
+async def iter_batch_zip(store: JobStore, entries: List[BatchEntry],
+                         poll_interval: Optional[float] = None) -> AsyncIterator[bytes]:
+    """
+    Stream a ZIP archive with each output as soon as its job finishes, then the manifest
+
+    Jobs still unfinished when the stream is closed early (e.g. the client
+    disconnected) are cancelled.
+
+    Args:
+        store: Job store
+        entries: Entries returned by submit_batch
+        poll_interval: Seconds between job status checks
+            (if None, reads JOB_POLL_INTERVAL from env)
+
+    Yields:
+        Chunks of the archive
+    """
+    if poll_interval is None:
+        poll_interval = float(os.getenv('JOB_POLL_INTERVAL', 0.5))
+    started = time.monotonic()
+    pending = {entry.job_id: entry for entry in entries if entry.job_id}
+    sink = _ZipSink()
+
+    try:
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            while pending:
+                statuses = await asyncio.to_thread(store.statuses, list(pending))
+                # Jobs purged meanwhile count as failed
+                finished = [job_id for job_id in pending if statuses.get(job_id, FAILED) in FINAL_STATES]
+                for job_id in finished:
+                    entry = pending.pop(job_id)
+                    entry.seconds = round(time.monotonic() - started, 3)
+                    await _collect(store, archive, entry, statuses.get(job_id, FAILED))
+                    yield sink.take()
+                if pending and not finished:
+                    await asyncio.sleep(poll_interval)
+
+            manifest = {
+                'files': [asdict(entry) for entry in entries],
+                'summary': _summary(entries),
+            }
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+        yield sink.take()
+    finally:
+        for job_id in pending:
+            await asyncio.to_thread(store.cancel, job_id)
+
+
+async def _collect(store: JobStore, archive: zipfile.ZipFile, entry: BatchEntry, status: str):
+    """Write a finished job's output to the archive and record its outcome"""
+    entry.status = status
+    if status != SUCCEEDED:
+        job = await asyncio.to_thread(store.get, entry.job_id)
+        entry.error = job['error'] if job else "Job expired"
+        entry.details = job['details'] if job else {}
+        entry.output = None
+        return
+
+    result = await asyncio.to_thread(store.result, entry.job_id)
+    if result is None:
+        entry.status, entry.error, entry.output = FAILED, "Result expired", None
+        return
+    entry.details = result.details
+    # PDF output is already compressed
+    compression = zipfile.ZIP_STORED if entry.output.endswith('.pdf') else zipfile.ZIP_DEFLATED
+    await asyncio.to_thread(archive.writestr, entry.output, result.content, compression)
+
+
+def _summary(entries: List[BatchEntry]) -> Dict[str, int]:
+    """Number of entries per status"""
+    summary: Dict[str, int] = {}
+    for entry in entries:
+        summary[entry.status] = summary.get(entry.status, 0) + 1
+    return summary
+
+
+def _hidden(name: str) -> bool:
+    """Whether an archive member is metadata rather than a budget, e.g. __MACOSX/ or .DS_Store"""
+    return any(part.startswith(('.', '__MACOSX')) for part in name.split('/'))
+
+
+def _safe_path(path: str) -> str:
+    """Relative archive path without parent references or absolute prefixes"""
+    parts = [part for part in path.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return '/'.join(parts) or 'file'
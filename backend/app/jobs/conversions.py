@@ -0,0 +1,209 @@
+"""
+Job Conversions
+The conversions jobs run, the same as the /convert routes but outside any request
+"""
+import asyncio
+import io
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from ..metrics import stage
+from ..models.budget import Budget
+
+# Receives the fraction done (0-1) and a short description of the current stage
+ProgressCallback = Callable[[float, str], None]
+
+
+@dataclass(frozen=True)
+class Conversion:
+    """Input and output formats of a conversion"""
+    source: str
+    target: str
+
+    @property
+    def extension(self) -> str:
+        """File extension of accepted inputs"""
+        return f".{self.source}"
+
+    @property
+    def media_type(self) -> str:
+        """Content type of the output"""
+        return MEDIA_TYPES[self.target]
+
+
+MEDIA_TYPES = {
+    'bc3': 'application/octet-stream',
+    'json': 'application/json',
+    'pdf': 'application/pdf',
+}
+
+CONVERSIONS = {
+    f"{source}-to-{target}": Conversion(source, target)
+    for source, target in (
+        ('bc3', 'pdf'), ('bc3', 'json'), ('pdf', 'bc3'), ('pdf', 'json'), ('json', 'bc3'), ('json', 'pdf')
+    )
+}
+
+def _load_bc3_parser():
+    from ..parsers.bc3_parser import BC3Parser
+    return BC3Parser()
+
+
+def _load_bc3_generator():
+    from ..generators.bc3_generator import BC3Generator
+    return BC3Generator()
+
+
+def _load_pdf_generator():
+    from ..generators.pdf_generator import PDFGenerator
+    return PDFGenerator()
+
+
+def _load_pdf_extractor():
+    from ..ai.pdf_extractor import PDFExtractor
+    return PDFExtractor()
+
+
+def _load_budget_enhancer():
+    from ..ai.budget_enhancer import BudgetEnhancer
+    return BudgetEnhancer()
+
+
+_LOADERS: Dict[str, Callable[[], Any]] = {
+    'bc3_parser': _load_bc3_parser,
+    'bc3_generator': _load_bc3_generator,
+    'pdf_generator': _load_pdf_generator,
+    'pdf_extractor': _load_pdf_extractor,
+    'budget_enhancer': _load_budget_enhancer,
+}
+
+
+class _Services(Mapping):
+    """Services by name, each created the first time it is looked up"""
+
+    def __init__(self):
+        self._loaded: Dict[str, Any] = {}
+        # Reentrant, in case loading one service looks up another
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name: str) -> Any:
+        service = self._loaded.get(name)
+        if service is None:
+            loader = _LOADERS[name]
+            with self._lock:
+                service = self._loaded.get(name)
+                if service is None:
+                    service = self._loaded[name] = loader()
+        return service
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_LOADERS)
+
+    def __len__(self) -> int:
+        return len(_LOADERS)
+
+
+_services = _Services()
+
+
+def get_services() -> Mapping[str, Any]:
+    """
+    Parsers, generators and AI services of this process, each created on first use
+
+    They are imported on lookup rather than at module level, since reportlab,
+    pdfplumber and the AI client take most of the time an API process needs to
+    start, and a BC3 conversion needs none of them.
+    """
+    return _services
+
+
+def warm_services() -> float:
+    """
+    Load the services, their fonts and the AI client library ahead of the first request
+
+    Returns:
+        Seconds taken
+    """
+    started = time.perf_counter()
+    services = get_services()
+    for name in services:
+        services[name]
+    services['pdf_generator'].preload()
+    services['pdf_extractor'].gateway.preload()
+    return time.perf_counter() - started
+
+
+async def convert(name: str, data: bytes, options: Dict[str, Any],
+                  progress: Optional[ProgressCallback] = None) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Run a conversion
+
+    Args:
+        name: Conversion name, a key of CONVERSIONS
+        data: Input file content
+        options: 'use_ai' and 'cache' for PDF inputs, 'enhance' to improve
+            descriptions with AI before writing the output
+        progress: Called as stages advance
+
+    Returns:
+        Tuple of (output content, details) where details holds the
+        extraction report of PDF inputs
+    """
+    conversion = CONVERSIONS[name]
+    services = get_services()
+    enhance = bool(options.get('enhance'))
+    # Reading takes most of the time, unless descriptions are enhanced too
+    read_share = 0.5 if enhance else 0.9
+    details: Dict[str, Any] = {}
+
+    def report(fraction: float, stage: str):
+        if progress is not None:
+            progress(fraction, stage)
+
+    report(0.0, 'reading')
+    if conversion.source == 'bc3':
+        budget = await asyncio.to_thread(services['bc3_parser'].parse_stream, io.BytesIO(data))
+    elif conversion.source == 'json':
+        budget = await asyncio.to_thread(Budget.model_validate_json, data)
+    else:
+        budget = None
+        async for event in services['pdf_extractor'].iter_extraction(
+            io.BytesIO(data),
+            use_ai=options.get('use_ai', True),
+            refresh_cache=options.get('cache') == 'refresh'
+        ):
+            if event['event'] == 'progress':
+                report(read_share * _fraction(event['data']), 'extracting')
+            elif event['event'] == 'result':
+                budget = event['data']['budget']
+                details['extraction'] = event['data']['report']
+
+    if enhance:
+        async for event in services['budget_enhancer'].iter_enhancements(budget):
+            if event['event'] == 'progress':
+                report(read_share + (0.9 - read_share) * _fraction(event['data']), 'enhancing')
+
+    report(0.9, 'writing')
+    content = await asyncio.to_thread(_write, conversion.target, budget, services)
+    return content, details
+
+
+def _fraction(data: Dict[str, Any]) -> float:
+    """Fraction done of a progress event"""
+    return data['done'] / data['total'] if data.get('total') else 1.0
+
+
+def _write(target: str, budget: Budget, services: Mapping[str, Any]) -> bytes:
+    """Serialize a budget in the target format"""
+    if target == 'bc3':
+        return services['bc3_generator'].generate_bytes(budget)
+    if target == 'json':
+        # Same serialization as the JSON the /convert routes return
+        with stage('serialize'):
+            return JSONResponse(jsonable_encoder(budget.model_dump())).body
+    buffer = io.BytesIO()
+    services['pdf_generator'].generate_file(budget, buffer)
+    return buffer.getvalue()
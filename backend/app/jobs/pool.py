@@ -0,0 +1,176 @@
+"""
+Job Worker Pool
+Worker processes of an API process, restarted when they die and killed when a job overruns
+"""
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional
+from .store import JobStore
+from .worker import run_worker, worker_id
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """Supervise a fixed number of job worker processes"""
+
+    def __init__(self, store: Optional[JobStore] = None, workers: Optional[int] = None,
+                 poll_interval: Optional[float] = None, heartbeat_interval: float = 1.0,
+                 stale_after: Optional[float] = None, kill_grace: float = 10.0,
+                 purge_interval: float = 60.0):
+        """
+        Initialize worker pool
+
+        Args:
+            store: Job store (if None, one is created from env)
+            workers: Worker processes, 0 to only queue jobs for other processes
+                (if None, reads JOB_WORKERS from env, defaulting to 0; the
+                app.server launcher runs a pool for all its API workers)
+            poll_interval: Seconds between queue checks of idle workers and
+                supervision rounds (if None, reads JOB_POLL_INTERVAL from env)
+            heartbeat_interval: Seconds between heartbeats of running jobs
+            stale_after: Seconds without a heartbeat after which a running job's
+                worker is considered lost, e.g. after a crash or restart
+                (if None, reads JOB_STALE_AFTER from env)
+            kill_grace: Seconds a job may overrun its timeout or a cancellation
+                request before its worker process is killed
+            purge_interval: Seconds between deletions of expired jobs
+        """
+        self.store = store or JobStore()
+        if workers is None:
+            workers = int(os.getenv('JOB_WORKERS') or 0)
+        self.size = workers
+        self.poll_interval = poll_interval if poll_interval is not None else float(
+            os.getenv('JOB_POLL_INTERVAL', 0.5)
+        )
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after if stale_after is not None else float(os.getenv('JOB_STALE_AFTER', 60))
+        self.kill_grace = kill_grace
+        self.purge_interval = purge_interval
+        # Worker processes are started fresh rather than forked from a process running threads
+        self._context = multiprocessing.get_context('spawn')
+        self._processes: Dict[str, multiprocessing.Process] = {}
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the worker processes and their supervisor"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._supervise()
+        self._thread = threading.Thread(target=self._run, name='job-supervisor', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stop the workers; jobs they were running are queued again
+
+        Args:
+            timeout: Seconds to wait for each worker to exit
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+
+        running = {job_id: worker for job_id, worker, *_ in self.store.running()}
+        for job_id, worker in running.items():
+            if worker in self._processes:
+                self.store.requeue(job_id, "Worker stopped")
+        self._processes.clear()
+
+    def alive(self) -> int:
+        """Number of worker processes running"""
+        return sum(process.is_alive() for process in list(self._processes.values()))
+
+    def _run(self):
+        """Supervisor loop"""
+        last_purge = 0.0
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                self._supervise()
+                if time.time() - last_purge >= self.purge_interval:
+                    self.store.purge()
+                    last_purge = time.time()
+            except Exception:
+                logger.exception("Job supervision failed")
+
+    def _supervise(self):
+        """One supervision round"""
+        # Kill workers stuck past a job's timeout or ignoring a cancellation
+        now = time.time()
+        for job_id, worker, started_at, timeout, cancel_requested_at in self.store.running():
+            process = self._processes.get(worker)
+            if process is None:
+                continue
+            if now > started_at + timeout + self.kill_grace:
+                self._kill(worker)
+                self.store.fail(job_id, f"Timed out after {timeout:g}s")
+            elif cancel_requested_at is not None and now > cancel_requested_at + self.kill_grace:
+                self._kill(worker)
+                self.store.requeue(job_id, "Cancelled")
+            elif not process.is_alive():
+                self.store.requeue(job_id, f"Worker exited with code {process.exitcode}")
+
+        # Jobs of workers lost before a restart: at once if they ran on this
+        # host, otherwise once their heartbeats stop
+        for job_id, worker, *_ in self.store.running():
+            host, _, pid = worker.rpartition(':')
+            if worker not in self._processes and host == socket.gethostname() and not _pid_alive(int(pid)):
+                self.store.requeue(job_id, "Worker lost")
+        self.store.recover(self.stale_after)
+
+        # Replace dead workers
+        for worker, process in list(self._processes.items()):
+            if not process.is_alive():
+                del self._processes[worker]
+        while len(self._processes) < self.size:
+            process = self._context.Process(
+                target=run_worker,
+                args=(self.poll_interval, self.heartbeat_interval),
+                name='job-worker',
+                daemon=True
+            )
+            process.start()
+            self._processes[worker_id(process.pid)] = process
+
+    def _kill(self, worker: str):
+        """Kill a worker process"""
+        process = self._processes.pop(worker)
+        process.kill()
+        process.join()
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a process exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_pool: Optional[WorkerPool] = None
+
+
+def get_worker_pool() -> WorkerPool:
+    """Return the process-wide job worker pool"""
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool()
+    return _pool
@@ -0,0 +1,307 @@
+"""
+Job Store
+Persistent SQLite queue of conversion jobs, their progress and their results
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from ..cache.sqlite_store import SQLiteStore
+
+# Job states; the last three are final
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINAL_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+@dataclass
+class Job:
+    """A claimed job, as handed to a worker"""
+    id: str
+    conversion: str
+    filename: str
+    options: Dict[str, Any]
+    data: bytes
+    timeout: float
+    attempts: int
+
+
+@dataclass
+class JobResult:
+    """Output of a finished conversion"""
+    content: bytes
+    media_type: str
+    filename: str
+    details: Dict[str, Any] = field(default_factory=dict)
+
+
+class JobStore(SQLiteStore):
+    """Conversion jobs kept in SQLite, shared by the API and every worker process of a host"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id TEXT PRIMARY KEY, conversion TEXT NOT NULL, filename TEXT NOT NULL, "
+        "options TEXT NOT NULL, input BLOB, status TEXT NOT NULL, "
+        "progress REAL NOT NULL DEFAULT 0, message TEXT, error TEXT, details TEXT, "
+        "result BLOB, result_type TEXT, result_name TEXT, "
+        "timeout REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+        "cancel_requested_at REAL, created_at REAL NOT NULL, started_at REAL, "
+        "heartbeat_at REAL, finished_at REAL, expires_at REAL)",
+        "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires_at)",
+    )
+
+    # Columns reported by get()
+    STATUS_COLUMNS = (
+        "id, conversion, filename, status, progress, message, error, details, "
+        "attempts, created_at, started_at, finished_at, expires_at"
+    )
+
+    def __init__(self, path: Optional[str] = None, result_ttl: Optional[int] = None,
+                 max_attempts: Optional[int] = None):
+        """
+        Initialize job store
+
+        Args:
+            path: SQLite database path (if None, uses CACHE_DIR from env)
+            result_ttl: Seconds a finished job and its result are kept
+                (if None, reads JOB_RESULT_TTL from env)
+            max_attempts: Times a job is started before a lost worker fails it
+                (if None, reads JOB_MAX_ATTEMPTS from env)
+        """
+        cache_dir = os.getenv('CACHE_DIR', 'cache')
+        super().__init__(path or os.path.join(cache_dir, 'jobs.sqlite3'))
+        self.result_ttl = result_ttl if result_ttl is not None else int(os.getenv('JOB_RESULT_TTL', 24 * 3600))
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv('JOB_MAX_ATTEMPTS', 2))
+
+    def submit(self, conversion: str, filename: str, data: bytes, options: Dict[str, Any],
+               timeout: float) -> str:
+        """
+        Queue a conversion
+
+        Args:
+            conversion: Conversion name, e.g. 'pdf-to-bc3'
+            filename: Name of the uploaded file
+            data: Uploaded file content
+            options: Conversion options
+            timeout: Seconds the conversion may run
+
+        Returns:
+            Job id
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, conversion, filename, options, input, status, timeout, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, conversion, filename, json.dumps(options), sqlite3.Binary(data),
+                 QUEUED, timeout, time.time())
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a job, or None if unknown or expired"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                f"SELECT {self.STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None or _expired(row['expires_at']):
+            return None
+
+        status = dict(row)
+        status['details'] = json.loads(row['details']) if row['details'] else {}
+        for name in ('created_at', 'started_at', 'finished_at', 'expires_at'):
+            if status[name] is not None:
+                status[name] = datetime.fromtimestamp(status[name], timezone.utc)
+        return status
+
+    def statuses(self, job_ids: List[str]) -> Dict[str, str]:
+        """Status of each of several jobs, leaving out unknown ones"""
+        statuses = {}
+        with self._connect() as conn:
+            # Stay below SQLite's limit on query parameters
+            for start in range(0, len(job_ids), 500):
+                chunk = job_ids[start:start + 500]
+                statuses.update(conn.execute(
+                    f"SELECT id, status FROM jobs WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return statuses
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status, finished ones until purged"""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def result(self, job_id: str) -> Optional[JobResult]:
+        """Output of a succeeded job, or None if there is none (yet)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result, result_type, result_name, details, expires_at FROM jobs "
+                "WHERE id = ? AND status = ?",
+                (job_id, SUCCEEDED)
+            ).fetchone()
+        if row is None or _expired(row[4]):
+            return None
+        return JobResult(bytes(row[0]), row[1], row[2], json.loads(row[3]) if row[3] else {})
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """
+        Take the oldest queued job
+
+        Args:
+            worker: Id of the claiming worker, '<host>:<pid>'
+
+        Returns:
+            The job, now running, or None if the queue is empty
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, conversion, filename, options, input, timeout, attempts FROM jobs "
+                "WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, progress = 0, "
+                "message = NULL, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (RUNNING, worker, now, now, row[0])
+            )
+        return Job(row[0], row[1], row[2], json.loads(row[3]), bytes(row[4]), row[5], row[6] + 1)
+
+    def heartbeat(self, job_id: str, progress: float, message: Optional[str]) -> bool:
+        """
+        Record that a running job is alive and how far it got
+
+        Returns:
+            Whether cancellation was requested
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ?, progress = ?, message = ? WHERE id = ? AND status = ?",
+                (time.time(), progress, message, job_id, RUNNING)
+            )
+            row = conn.execute("SELECT cancel_requested_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row[0] is not None
+
+    def succeed(self, job_id: str, result: JobResult):
+        """Store the output of a running job"""
+        self._finish(
+            job_id, SUCCEEDED,
+            "progress = 1, result = ?, result_type = ?, result_name = ?, details = ?",
+            (sqlite3.Binary(result.content), result.media_type, result.filename, json.dumps(result.details))
+        )
+
+    def fail(self, job_id: str, error: str, status: str = FAILED, details: Optional[Dict[str, Any]] = None):
+        """Finish a running (or queued) job without output"""
+        self._finish(job_id, status, "error = ?, details = ?", (error, json.dumps(details or {})))
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a job: queued ones at once, running ones once their worker notices
+
+        Returns:
+            Job status after the request, or None if unknown
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] == QUEUED:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, input = NULL, finished_at = ?, expires_at = ? "
+                    "WHERE id = ?",
+                    (CANCELLED, "Cancelled", now, now + self.result_ttl, job_id)
+                )
+                return CANCELLED
+            if row[0] == RUNNING:
+                conn.execute(
+                    "UPDATE jobs SET cancel_requested_at = COALESCE(cancel_requested_at, ?) WHERE id = ?",
+                    (now, job_id)
+                )
+            return row[0]
+
+    def running(self) -> List[Tuple[str, str, float, float, Optional[float]]]:
+        """(id, worker, started_at, timeout, cancel_requested_at) of every running job"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, worker, started_at, timeout, cancel_requested_at FROM jobs WHERE status = ?",
+                (RUNNING,)
+            ).fetchall()
+
+    def requeue(self, job_id: str, reason: str):
+        """
+        Give a running job whose worker was lost another attempt, or fail it
+
+        Args:
+            job_id: Job id
+            reason: Why the worker was lost, reported if the job fails
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT attempts, cancel_requested_at FROM jobs WHERE id = ? AND status = ?", (job_id, RUNNING)
+            ).fetchone()
+            if row is None:
+                return
+            if row[0] < self.max_attempts and row[1] is None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, heartbeat_at = NULL WHERE id = ?",
+                    (QUEUED, job_id)
+                )
+                return
+        self.fail(job_id, "Cancelled" if row[1] is not None else reason,
+                  status=CANCELLED if row[1] is not None else FAILED)
+
+    def recover(self, stale_after: float) -> int:
+        """
+        Requeue running jobs whose worker stopped sending heartbeats, e.g. after a restart
+
+        Args:
+            stale_after: Seconds without a heartbeat after which a worker is lost
+
+        Returns:
+            Number of jobs recovered
+        """
+        with self._connect() as conn:
+            stale = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND heartbeat_at < ?",
+                (RUNNING, time.time() - stale_after)
+            )]
+        for job_id in stale:
+            self.requeue(job_id, "Worker lost")
+        return len(stale)
+
+    def purge(self) -> int:
+        """Delete finished jobs past their result TTL; returns how many"""
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+            ).rowcount
+
+    def _finish(self, job_id: str, status: str, assignments: str, values: tuple):
+        """Move a job to a final state, dropping its input"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET status = ?, {assignments}, input = NULL, finished_at = ?, expires_at = ? "
+                "WHERE id = ? AND status IN (?, ?)",
+                (status, *values, now, now + self.result_ttl, job_id, QUEUED, RUNNING)
+            )
+
+
+def _expired(expires_at: Optional[float]) -> bool:
+    """Whether a finished job is past its TTL but not purged yet"""
+    return expires_at is not None and expires_at < time.time()
@@ -0,0 +1,97 @@
+"""
+Tests for batch conversion
+"""
+import io
+import zipfile
+import pytest
+from .batch import BatchError, expand_inputs, submit_batch
+from .store import CANCELLED, FAILED, QUEUED, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+def archive(files, damaged=()):
+    """ZIP archive of name -> content; members named in damaged fail their CRC check"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as output:
+        for name, content in files.items():
+            output.writestr(name, content)
+    data = buffer.getvalue()
+    for name in damaged:
+        content = files[name]
+        data = data.replace(content, bytes(reversed(content)), 1)
+    return io.BytesIO(data)
+
+
+def test_archives_are_listed_without_their_metadata():
+    inputs = expand_inputs([
+        ('obra.zip', archive({'a/uno.bc3': b'~V|1|', '__MACOSX/a/._uno.bc3': b'x', 'b/.DS_Store': b'x'})),
+        ('dos.pdf', io.BytesIO(b'%PDF-')),
+    ])
+
+    assert [(i.name, i.size) for i in inputs] == [('a/uno.bc3', 5), ('dos.pdf', 5)]
+    assert [i.read() for i in inputs] == [b'~V|1|', b'%PDF-']
+
+
+def test_batches_over_the_limits_are_rejected():
+    files = [(f'{n}.bc3', io.BytesIO(b'~V|')) for n in range(3)]
+
+    with pytest.raises(BatchError):
+        expand_inputs(files, max_files=2)
+    with pytest.raises(BatchError):
+        expand_inputs(files, max_bytes=8)
+    with pytest.raises(BatchError):
+        expand_inputs([('roto.zip', io.BytesIO(b'not a zip'))])
+
+
+def test_inputs_are_queued_with_unique_outputs(store):
+    inputs = expand_inputs([
+        ('obra.zip', archive({'a.bc3': b'~V|1|', 'a.pdf': b'%PDF-', 'notas.txt': b'x', 'manifest.bc3': b'~V|',
+                     '/tmp/b.bc3': b'~V|'})),
+    ])
+
+    entries = submit_batch(store, inputs, 'json', {}, timeout=30)
+
+    assert [(e.file, e.status, e.output) for e in entries] == [
+        ('a.bc3', QUEUED, 'a.json'),
+        ('a.pdf', QUEUED, 'a-2.json'),
+        ('notas.txt', 'skipped', None),
+        ('manifest.bc3', QUEUED, 'manifest-2.json'),
+        ('/tmp/b.bc3', QUEUED, 'tmp/b.json'),
+    ]
+    assert store.counts() == {QUEUED: 4}
+
+
+def test_unreadable_members_fail_on_their_own(store):
+    files = {'uno.bc3': b'~V|uno|', 'dos.bc3': b'~V|dos|', 'tres.bc3': b'~V|tres|'}
+    inputs = expand_inputs([('obra.zip', archive(files, damaged=['dos.bc3']))])
+
+    entries = submit_batch(store, inputs, 'json', {}, timeout=30)
+
+    assert [(e.file, e.status) for e in entries] == [
+        ('uno.bc3', QUEUED), ('dos.bc3', FAILED), ('tres.bc3', QUEUED)
+    ]
+    assert 'dos.bc3' in entries[1].error
+    assert (entries[1].job_id, entries[1].output) == (None, None)
+    assert store.counts() == {QUEUED: 2}
+
+
+def test_jobs_queued_before_a_failure_are_cancelled(store, monkeypatch):
+    submit = store.submit
+    calls = []
+
+    def failing_submit(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        return submit(*args)
+
+    monkeypatch.setattr(store, 'submit', failing_submit)
+    inputs = expand_inputs([(f'{n}.bc3', io.BytesIO(b'~V|')) for n in range(3)])
+
+    with pytest.raises(OSError):
+        submit_batch(store, inputs, 'json', {}, timeout=30)
+    assert store.counts() == {CANCELLED: 1}
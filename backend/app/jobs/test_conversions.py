@@ -0,0 +1,41 @@
+"""
+Tests for job conversions and the services they use
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from .conversions import get_services
+
+BACKEND = Path(__file__).resolve().parents[2]
+
+HEAVY_MODULES = ('pdfplumber', 'reportlab', 'anthropic')
+
+# Run in a fresh interpreter, since other tests load the heavy modules into this one
+PROBE = """
+import json, sys
+from app.jobs import get_services
+from app.routes.convert import _result_key
+_result_key('bc3-to-json', 'digest')
+get_services()['bc3_parser'].parse_stream
+get_services()['bc3_generator'].generate_bytes
+print(json.dumps([name for name in %r if name in sys.modules]))
+"""
+
+
+def test_bc3_conversions_load_no_pdf_or_ai_library(tmp_path):
+    env = {**os.environ, 'CACHE_DIR': str(tmp_path), 'ANTHROPIC_API_KEY': ''}
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE % (HEAVY_MODULES,)],
+        cwd=BACKEND, env=env, capture_output=True, text=True, timeout=60, check=True
+    ).stdout
+
+    assert json.loads(output.splitlines()[-1]) == []
+
+
+def test_services_are_created_once_on_lookup():
+    services = get_services()
+
+    assert set(services) == {'bc3_parser', 'bc3_generator', 'pdf_generator', 'pdf_extractor', 'budget_enhancer'}
+    assert services['bc3_parser'] is get_services()['bc3_parser']
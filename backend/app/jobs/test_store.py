@@ -0,0 +1,92 @@
+"""
+Tests for the job store and worker pool
+"""
+import time
+import pytest
+from .pool import WorkerPool
+from .store import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, JobResult, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'), result_ttl=60, max_attempts=2)
+
+
+def submit(store, name='budget.bc3'):
+    return store.submit('bc3-to-json', name, b'~V|', {'ai': False}, timeout=30)
+
+
+def test_jobs_are_claimed_oldest_first_and_only_once(store):
+    first = submit(store, 'a.bc3')
+    second = submit(store, 'b.bc3')
+
+    job = store.claim('host:1')
+    assert (job.id, job.filename, job.data, job.options, job.attempts) == (first, 'a.bc3', b'~V|', {'ai': False}, 1)
+    assert store.claim('host:2').id == second
+    assert store.claim('host:3') is None
+    assert store.get(first)['status'] == RUNNING
+
+
+def test_lost_workers_jobs_are_requeued_until_attempts_run_out(store):
+    job_id = submit(store)
+
+    store.claim('host:1')
+    store.requeue(job_id, "Worker lost")
+    assert store.get(job_id)['status'] == QUEUED
+
+    assert store.claim('host:2').attempts == 2
+    store.requeue(job_id, "Worker lost")
+    status = store.get(job_id)
+    assert (status['status'], status['error']) == (FAILED, "Worker lost")
+
+
+def test_stale_running_jobs_are_recovered(store):
+    job_id = submit(store)
+    store.claim('host:1')
+
+    assert store.recover(stale_after=3600) == 0
+    time.sleep(0.01)
+    assert store.recover(stale_after=0) == 1
+    assert store.get(job_id)['status'] == QUEUED
+
+
+def test_cancelling_queued_and_running_jobs(store):
+    running = submit(store)
+    store.claim('host:1')
+    queued = submit(store)
+
+    assert store.cancel(queued) == CANCELLED
+    assert store.claim('host:2') is None
+
+    # Running jobs are cancelled once their worker notices, and never requeued
+    assert store.cancel(running) == RUNNING
+    assert store.heartbeat(running, 0.5, "Leyendo") is True
+    store.requeue(running, "Cancelled")
+    assert store.get(running)['status'] == CANCELLED
+
+    assert store.cancel('unknown') is None
+
+
+def test_results_are_kept_until_they_expire(store):
+    job_id = submit(store)
+    store.claim('host:1')
+    store.succeed(job_id, JobResult(b'{}', 'application/json', 'budget.json', {'items': 3}))
+
+    assert store.get(job_id)['status'] == SUCCEEDED
+    assert store.result(job_id) == JobResult(b'{}', 'application/json', 'budget.json', {'items': 3})
+    assert store.counts() == {SUCCEEDED: 1}
+
+    expired = JobStore(store.path, result_ttl=-1)
+    other = submit(expired)
+    expired.claim('host:1')
+    expired.fail(other, "boom")
+    assert expired.get(other) is None
+    assert expired.purge() == 1
+
+
+def test_in_process_pool_is_opt_in(monkeypatch, store):
+    monkeypatch.delenv('JOB_WORKERS', raising=False)
+    assert WorkerPool(store).size == 0
+
+    monkeypatch.setenv('JOB_WORKERS', '3')
+    assert WorkerPool(store).size == 3
@@ -0,0 +1,124 @@
+"""
+Job Worker
+Process that takes queued jobs from the store and runs them one at a time
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from typing import Optional
+from ..ai.scheduler import ai_priority
+from ..ai.usage import track_usage
+from .conversions import CONVERSIONS, convert
+from .store import CANCELLED, Job, JobResult, JobStore
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id(pid: Optional[int] = None) -> str:
+    """Id a worker process claims jobs under"""
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+def run_worker(poll_interval: float, heartbeat_interval: float):
+    """
+    Worker process entry point; runs until terminated
+
+    Args:
+        poll_interval: Seconds between checks of an empty queue
+        heartbeat_interval: Seconds between heartbeats (and cancellation
+            checks) of a running job
+    """
+    # Ctrl+C reaches the whole process group: leave shutdown to the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve(JobStore(), poll_interval, heartbeat_interval))
+
+
+async def _serve(store: JobStore, poll_interval: float, heartbeat_interval: float):
+    """Claim and run jobs forever"""
+    me = worker_id()
+    while not _orphaned():
+        try:
+            job = await asyncio.to_thread(store.claim, me)
+        except Exception as e:
+            logger.warning("Job claim failed: %s", e)
+            job = None
+
+        if job is None:
+            await asyncio.sleep(poll_interval)
+            continue
+        await run_job(store, job, heartbeat_interval)
+
+
+async def run_job(store: JobStore, job: Job, heartbeat_interval: float):
+    """
+    Run a claimed job to a final state
+
+    The conversion runs as a task while this coroutine sends heartbeats
+    with its progress, and cancels it when cancellation is requested or the
+    job's timeout passes.
+
+    Args:
+        store: Job store
+        job: Claimed job
+        heartbeat_interval: Seconds between heartbeats
+    """
+    state = {'progress': 0.0, 'message': None}
+
+    def progress(fraction: float, stage: str):
+        state['progress'] = round(fraction, 3)
+        state['message'] = stage
+
+    # AI calls of jobs yield to those of interactive requests
+    with ai_priority('batch'), track_usage(lambda: f"job:{job.conversion}") as usage:
+        task = asyncio.create_task(convert(job.conversion, job.data, job.options, progress))
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + job.timeout
+    outcome = None
+    while not task.done():
+        await asyncio.wait({task}, timeout=min(heartbeat_interval, max(deadline - loop.time(), 0)))
+        if task.done():
+            break
+        if loop.time() >= deadline:
+            outcome = 'timeout'
+        elif _orphaned():
+            # Leave the job running in the store: it is recovered once heartbeats stop
+            task.cancel()
+            return
+        else:
+            try:
+                if await asyncio.to_thread(store.heartbeat, job.id, state['progress'], state['message']):
+                    outcome = 'cancelled'
+            except Exception as e:
+                logger.warning("Job heartbeat failed: %s", e)
+        if outcome:
+            task.cancel()
+            await asyncio.wait({task})
+
+    details = {'ai_usage': usage.to_dict()}
+    try:
+        content, conversion_details = task.result()
+    except asyncio.CancelledError:
+        if outcome == 'timeout':
+            await asyncio.to_thread(store.fail, job.id, f"Timed out after {job.timeout:g}s", details=details)
+        else:
+            await asyncio.to_thread(store.fail, job.id, "Cancelled", status=CANCELLED, details=details)
+        return
+    except Exception as e:
+        logger.error("Job %s failed: %s", job.id, e)
+        await asyncio.to_thread(store.fail, job.id, f"Conversion failed: {e}", details=details)
+        return
+
+    conversion = CONVERSIONS[job.conversion]
+    filename = f"{os.path.splitext(job.filename)[0]}.{conversion.target}"
+    result = JobResult(content, conversion.media_type, filename, {**conversion_details, **details})
+    await asyncio.to_thread(store.succeed, job.id, result)
+
+
+def _orphaned() -> bool:
+    """Whether the API process that started this worker is gone"""
+    parent = multiprocessing.parent_process()
+    return parent is not None and not parent.is_alive()
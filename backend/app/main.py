@@ -2,17 +2,29 @@
 Main FastAPI application
 Budget Import/Export with AI
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
+import logging
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
-from .routes import convert_router, ai_router
-
-# Load environment variables
+# Load environment variables before the modules that read them on import
 load_dotenv()
 
+from .routes import convert_router, ai_router, jobs_router, metrics_router, debug_router
+from .ai.gateway import get_gateway
+from .ai.usage import track_usage
+from .jobs import get_worker_pool, warm_services
+from .routes.admission import AdmissionController, AdmissionMiddleware, default_limits
+from .routes.debug import ProfilingMiddleware
+from .routes.metrics import MetricsMiddleware, register_collectors
+from .routes.spool import configure_uploads, sweep_periodically, sweep_spool_dir
+
+logger = logging.getLogger(__name__)
+
 # Create FastAPI app
 app = FastAPI(
     title="Budget Import/Export API",
@@ -20,6 +32,17 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Profile single requests when an administrator asks for it
+app.add_middleware(ProfilingMiddleware)
+
+# Limit request bodies and concurrent conversions, rejecting overload early
+admission = AdmissionController(default_limits())
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Time requests and pipeline stages, rejected requests included, for /metrics
+app.add_middleware(MetricsMiddleware)
+register_collectors(admission)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,9 +50,76 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-AI-Usage", "Retry-After", "X-Profile-Id"],
 )
 
 
+@app.middleware("http")
+async def ai_usage_header(request: Request, call_next):
+    """
+    Account AI work to the request and report it in the X-AI-Usage header
+
+    Event streams send their headers before any AI work runs, so they get
+    no header and report their usage in a final 'usage' event instead.
+    """
+    def route() -> str:
+        # Label by route template, e.g. /jobs/{job_id}, once routing has matched
+        matched = request.scope.get('route')
+        return matched.path if matched is not None else request.url.path
+
+    with track_usage(route) as usage:
+        response = await call_next(request)
+
+    if not response.headers.get('content-type', '').startswith('text/event-stream'):
+        response.headers['X-AI-Usage'] = usage.header()
+    return response
+
+
+# Removal of spills orphaned by dead workers, repeated while the process runs
+_sweeper: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def prepare_spooling():
+    """Spool uploads into the spool directory and remove spills orphaned by dead workers"""
+    global _sweeper
+    configure_uploads()
+    removed = sweep_spool_dir()
+    if removed:
+        logger.info("Removed %s orphaned spool files", removed)
+    _sweeper = asyncio.create_task(sweep_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_spool_sweeper():
+    """Stop sweeping the spool directory"""
+    if _sweeper is not None:
+        _sweeper.cancel()
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Start the conversion job worker processes"""
+    get_worker_pool().start()
+
+
+# Loading of the parsers, generators and AI client, started at startup and awaited by /ready
+_warmup: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_warmup():
+    """Load the services in the background, so the process accepts connections before they are ready"""
+    global _warmup
+    _warmup = asyncio.create_task(asyncio.to_thread(warm_services))
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Stop the job workers, queueing their running jobs again"""
+    get_worker_pool().stop()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -37,14 +127,15 @@ async def root():
         "message": "Budget Import/Export API",
         "version": "1.0.0",
         "docs": "/docs",
-        "health": "/health"
+        "health": "/health",
+        "ready": "/ready"
     }
 
 
 @app.get("/health")
 async def health():
-    """Health check endpoint"""
-    ai_enabled = bool(os.getenv('ANTHROPIC_API_KEY'))
+    """Liveness check: answers as soon as the process serves requests, see /ready for readiness"""
+    ai_enabled = get_gateway().enabled
 
     return {
         "status": "healthy",
@@ -59,9 +150,23 @@ async def health():
     }
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness check: 503 until the services are loaded, so no request waits for them"""
+    if _warmup is None or not _warmup.done():
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    if _warmup.exception() is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "detail": str(_warmup.exception())})
+
+    return {"status": "ready", "warmup_seconds": round(_warmup.result(), 3)}
+
+
 # Include routers
 app.include_router(convert_router)
 app.include_router(ai_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
+app.include_router(debug_router)
 
 
 # Exception handlers
@@ -78,6 +183,7 @@ async def global_exception_handler(request, exc):
 
 
 if __name__ == "__main__":
+    # Development server reloading on code changes; production runs python -m app.server
     import uvicorn
 
     port = int(os.getenv("API_PORT", 8000))
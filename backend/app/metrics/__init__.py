@@ -0,0 +1,12 @@
+"""Process metrics exposed in the Prometheus text format"""
+from .registry import Counter, Gauge, Histogram, Registry, DURATION_BUCKETS, SIZE_BUCKETS, COUNT_BUCKETS
+from .tracing import Span, Trace, start_trace, span, record_span
+from .pipeline import (
+    get_registry, track_route, current_route, stage, observe_stage, observe_budget, record_cache_lookups
+)
+
+__all__ = [
+    'Counter', 'Gauge', 'Histogram', 'Registry', 'DURATION_BUCKETS', 'SIZE_BUCKETS', 'COUNT_BUCKETS',
+    'get_registry', 'track_route', 'current_route', 'stage', 'observe_stage', 'observe_budget',
+    'record_cache_lookups', 'Span', 'Trace', 'start_trace', 'span', 'record_span'
+]
@@ -0,0 +1,110 @@
+"""
+Pipeline Metrics
+Timings, sizes and cache lookups of budget processing, labelled by the route being served
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from ..models.budget import Budget, BudgetChapter
+from .registry import COUNT_BUCKETS, SIZE_BUCKETS, Registry
+from .tracing import record_span, span
+
+# Route label of work done outside any request, e.g. by job workers
+BACKGROUND_ROUTE = 'background'
+
+_registry = Registry()
+_route: contextvars.ContextVar[Optional[Callable[[], str]]] = contextvars.ContextVar('metrics_route', default=None)
+
+REQUEST_SECONDS = _registry.histogram(
+    'budget_http_request_duration_seconds', "Time to serve a request, response body included",
+    ('route', 'method', 'status')
+)
+REQUESTS_IN_FLIGHT = _registry.gauge(
+    'budget_http_requests_in_flight', "Requests being served"
+)
+REQUEST_BYTES = _registry.histogram(
+    'budget_http_request_size_bytes', "Size of request bodies", ('route',), SIZE_BUCKETS
+)
+RESPONSE_BYTES = _registry.histogram(
+    'budget_http_response_size_bytes', "Size of response bodies", ('route',), SIZE_BUCKETS
+)
+STAGE_SECONDS = _registry.histogram(
+    'budget_stage_duration_seconds',
+    "Time spent in a pipeline stage: upload, parse, build, extract, enhance, render or serialize",
+    ('route', 'stage')
+)
+BUDGET_ITEMS = _registry.histogram(
+    'budget_items', "Items per budget read or extracted", ('route', 'source'), COUNT_BUCKETS
+)
+CACHE_LOOKUPS = _registry.counter(
+    'budget_cache_lookups', "Cache lookups by outcome (hit or miss)", ('cache', 'result')
+)
+
+
+def get_registry() -> Registry:
+    """Return the process-wide metrics registry"""
+    return _registry
+
+
+@contextmanager
+def track_route(route: Callable[[], str]) -> Iterator[None]:
+    """
+    Label metrics recorded within the block (and tasks started from it) with a route
+
+    Args:
+        route: Returns the route label; called when a metric is recorded, so
+            it may resolve the matched route after routing
+    """
+    token = _route.set(route)
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+
+def current_route() -> str:
+    """Route label of the work being done"""
+    route = _route.get()
+    return route() if route is not None else BACKGROUND_ROUTE
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record the time spent in a pipeline stage, also as a span if the request is traced"""
+    STAGE_SECONDS.observe(seconds, route=current_route(), stage=stage)
+    record_span(stage, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as a pipeline stage, and as a span if the request is traced"""
+    started = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, route=current_route(), stage=name)
+
+
+def observe_budget(budget: Budget, source: str):
+    """Record the number of items of a budget read from a source ('bc3' or 'pdf')"""
+    BUDGET_ITEMS.observe(_count_items(budget.chapters), route=current_route(), source=source)
+
+
+def record_cache_lookups(cache: str, hits: int = 0, misses: int = 0):
+    """Count lookups of a cache"""
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result='miss')
+
+
+def _count_items(chapters: list) -> int:
+    """Items of chapters and their subchapters"""
+    count = 0
+    stack: list = list(chapters)
+    while stack:
+        chapter: BudgetChapter = stack.pop()
+        count += len(chapter.items)
+        stack.extend(chapter.subchapters)
+    return count
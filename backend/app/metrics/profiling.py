@@ -0,0 +1,283 @@
+"""
+Request Profiling
+Run single requests under a deterministic or sampling profiler with memory tracing, and keep what they recorded
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+PROFILE_MODES = ('cprofile', 'sampling')
+SUMMARY_NAME = 'profile.json'
+ARTIFACT_NAMES = {'cprofile': 'profile.pstats', 'sampling': 'profile.collapsed'}
+
+# Functions listed in a summary
+TOP_FUNCTIONS = 25
+# Source lines listed in a memory summary
+TOP_ALLOCATIONS = 15
+
+# Modules a thread is in when it waits for work, so samples ending there are idle
+IDLE_MODULES = ('threading.py', 'selectors.py', 'queue.py', 'thread.py')
+
+_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class SamplingProfiler:
+    """Periodically record the stack of every busy thread, in the collapsed format flame graph tools read"""
+
+    def __init__(self, interval: float):
+        """
+        Initialize sampling profiler
+
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stopping.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me or os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack = ";".join([names.get(ident, str(ident))] + frames[::-1])
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def collapsed(self) -> str:
+        """One line per distinct stack: frames from the root separated by ';', then the sample count"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def top(self) -> List[Dict[str, Any]]:
+        """Functions most often on a stack, with how often they were the one running"""
+        total: Dict[str, int] = {}
+        own: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            for frame in set(frames):
+                total[frame] = total.get(frame, 0) + count
+            if frames:
+                own[frames[-1]] = own.get(frames[-1], 0) + count
+        ranked = sorted(total, key=lambda frame: (-own.get(frame, 0), -total[frame]))[:TOP_FUNCTIONS]
+        return [{'function': frame, 'own_samples': own.get(frame, 0), 'samples': total[frame]} for frame in ranked]
+
+
+class RequestProfiler:
+    """Profile whatever runs between start and stop, one profiler per process at a time"""
+
+    _active = threading.Lock()
+
+    def __init__(self, mode: str, interval: Optional[float] = None, memory: Optional[bool] = None):
+        """
+        Initialize request profiler
+
+        Args:
+            mode: 'cprofile' to count every call of the event loop thread, or
+                'sampling' to sample the stacks of all threads
+            interval: Seconds between samples in sampling mode (if None,
+                reads PROFILE_SAMPLE_INTERVAL from env)
+            memory: Whether to trace allocations for peak memory (if None,
+                reads PROFILE_MEMORY from env)
+        """
+        self.mode = mode
+        self.interval = interval if interval is not None else float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+        self.memory = memory if memory is not None else os.getenv('PROFILE_MEMORY', 'true').lower() == 'true'
+        self._profiler: Any = None
+        self._traced = False
+        self._started = 0.0
+
+    def start(self) -> bool:
+        """
+        Start profiling
+
+        Returns:
+            False if another request of this process is being profiled, since
+            profilers hook into the interpreter globally
+        """
+        if not self._active.acquire(blocking=False):
+            return False
+        if self.memory:
+            self._traced = not tracemalloc.is_tracing()
+            if self._traced:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        self._started = time.perf_counter()
+        if self.mode == 'sampling':
+            self._profiler = SamplingProfiler(self.interval)
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return True
+
+    def stop(self) -> Tuple[Dict[str, Any], Any]:
+        """
+        Stop profiling
+
+        Returns:
+            Tuple of (summary, profiler) where the profiler is handed to
+            ProfileStore.save to write its artifact
+        """
+        try:
+            if self.mode == 'sampling':
+                self._profiler.stop()
+            else:
+                self._profiler.disable()
+            summary: Dict[str, Any] = {
+                'mode': self.mode,
+                'profiled_seconds': round(time.perf_counter() - self._started, 6),
+            }
+
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                statistics = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]
+                summary['memory'] = {
+                    'peak_bytes': peak,
+                    'current_bytes': current,
+                    # Still allocated when the request ended, by source line
+                    'top_allocations': [
+                        {'line': str(stat.traceback), 'bytes': stat.size, 'blocks': stat.count}
+                        for stat in statistics
+                    ],
+                }
+                if self._traced:
+                    tracemalloc.stop()
+            return summary, self._profiler
+        finally:
+            self._active.release()
+
+
+class ProfileStore:
+    """Profiles kept on local disk, one folder each, the oldest removed past a count"""
+
+    def __init__(self, directory: Optional[str] = None, keep: Optional[int] = None):
+        """
+        Initialize profile store
+
+        Args:
+            directory: Where profiles are kept (if None, a folder in CACHE_DIR)
+            keep: Profiles kept (if None, reads PROFILE_KEEP from env)
+        """
+        self.directory = directory or os.path.join(os.getenv('CACHE_DIR', 'cache'), 'profiles')
+        self.keep = keep if keep is not None else int(os.getenv('PROFILE_KEEP', 50))
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def save(self, profile_id: str, summary: Dict[str, Any], profiler: Any):
+        """
+        Store a profile
+
+        Args:
+            profile_id: Id from new_id
+            summary: Request, span, memory and profiler details
+            profiler: cProfile.Profile or SamplingProfiler that ran
+        """
+        folder = os.path.join(self.directory, profile_id)
+        os.makedirs(folder, exist_ok=True)
+        artifact = os.path.join(folder, ARTIFACT_NAMES[summary['mode']])
+
+        if isinstance(profiler, SamplingProfiler):
+            with open(artifact, 'w', encoding='utf-8') as f:
+                f.write(profiler.collapsed())
+            summary['top_functions'] = profiler.top()
+        else:
+            profiler.dump_stats(artifact)
+            summary['top_functions'] = _top_calls(pstats.Stats(profiler))
+
+        summary['id'] = profile_id
+        summary['created_at'] = datetime.now(timezone.utc).isoformat()
+        with open(os.path.join(folder, SUMMARY_NAME), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        self._prune()
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """Summary of a profile, or None if unknown"""
+        path = self._path(profile_id, SUMMARY_NAME)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def artifact(self, profile_id: str) -> Optional[str]:
+        """Path of a profile's profiler output, or None if unknown"""
+        for name in ARTIFACT_NAMES.values():
+            path = self._path(profile_id, name)
+            if path is not None and os.path.exists(path):
+                return path
+        return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Id, request and timing of every profile, newest first"""
+        profiles = []
+        for profile_id in self._ids():
+            summary = self.get(profile_id)
+            if summary is not None:
+                profiles.append({
+                    name: summary.get(name)
+                    for name in ('id', 'created_at', 'method', 'path', 'route', 'status', 'mode', 'duration')
+                })
+        return sorted(profiles, key=lambda profile: profile['created_at'] or '', reverse=True)
+
+    def _ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory) if _ID_PATTERN.match(name)]
+
+    def _prune(self):
+        """Remove the oldest profiles past the count kept"""
+        folders = sorted(
+            (os.path.join(self.directory, profile_id) for profile_id in self._ids()),
+            key=os.path.getmtime, reverse=True
+        )
+        for folder in folders[self.keep:]:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def _path(self, profile_id: str, name: str) -> Optional[str]:
+        """File of a profile, or None for ids that are not ours (e.g. path traversal)"""
+        if not _ID_PATTERN.match(profile_id):
+            return None
+        return os.path.join(self.directory, profile_id, name)
+
+
+def _top_calls(stats: pstats.Stats) -> List[Dict[str, Any]]:
+    """Functions with the most cumulative time"""
+    rows = []
+    for (filename, line, name), (primitive, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f"{name} ({os.path.basename(filename)}:{line})",
+            'calls': calls,
+            'own_seconds': round(own, 6),
+            'cumulative_seconds': round(cumulative, 6),
+        })
+    rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+    return rows[:TOP_FUNCTIONS]
@@ -0,0 +1,230 @@
+"""
+Metrics Registry
+Counters, gauges and histograms kept in process memory and rendered in the Prometheus text format
+"""
+import bisect
+import logging
+import math
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# Seconds, from a quick parse to a long AI extraction
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Bytes, 1 KiB to 1 GiB in steps of 4
+SIZE_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(11))
+COUNT_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+class Metric(ABC):
+    """A named metric with labelled values"""
+
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        """Label values in declaration order"""
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, LabelValues, Tuple[Tuple[str, str], ...], float]]:
+        """(suffix, label values, extra labels, value) of every sample"""
+
+    def render(self) -> List[str]:
+        """Lines of the text exposition format"""
+        lines = [
+            f"# HELP {self.name} {_escape_help(self.documentation)}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        for suffix, values, extra, value in self.samples():
+            pairs = list(zip(self.labelnames, values)) + list(extra)
+            labels = ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs)
+            lines.append(f"{self.name}{suffix}{{{labels}}} {_format_value(value)}" if labels
+                         else f"{self.name}{suffix} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Value that only goes up, counted here or read from a function at collection time"""
+
+    TYPE = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        """
+        Initialize counter
+
+        Args:
+            name: Metric name, without the _total suffix
+            documentation: Help text
+            labelnames: Label names
+            collect: Returns the current total of each label set, kept by
+                whatever does the counting
+        """
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1, **labels: str):
+        """Add to the value of a label set"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        values = _collected(self, self._collect)
+        return [('_total', key, (), value) for key, value in sorted(values.items())]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, set directly or read from a function at collection time"""
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        """
+        Initialize gauge
+
+        Args:
+            name: Metric name
+            documentation: Help text
+            labelnames: Label names
+            collect: Returns the current value of each label set, replacing
+                the values set directly
+        """
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        values = _collected(self, self._collect)
+        return [('', key, (), value) for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Observations counted in cumulative buckets"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count in each bucket (the last is +Inf), and the sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        """Record one observation"""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(key, list(counts), self._sums[key]) for key, counts in sorted(self._counts.items())]
+
+        samples = []
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(('_bucket', key, (('le', _format_value(bound)),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), cumulative))
+        return samples
+
+
+class Registry:
+    """Metrics exposed together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, or return the one already registered under its name"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                collect: Optional[Callable[[], Dict[LabelValues, float]]] = None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, collect))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              collect: Optional[Callable[[], Dict[LabelValues, float]]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _collected(metric: Metric, collect: Optional[Callable[[], Dict[LabelValues, float]]]
+               ) -> Dict[LabelValues, float]:
+    """Values of a counter or gauge, from its function if it has one"""
+    if collect is None:
+        with metric._lock:
+            return dict(metric._values)
+    try:
+        return collect()
+    except Exception as e:
+        logger.warning("Metric %s collection failed: %s", metric.name, e)
+        return {}
+
+
+def _format_value(value: float) -> str:
+    """Number as Prometheus writes it"""
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
@@ -0,0 +1,93 @@
+"""
+Tests for the metrics registry
+"""
+import pytest
+from .registry import Counter, Histogram, Metric, Registry
+
+
+def test_counters_and_gauges_render_in_the_exposition_format():
+    registry = Registry()
+    requests = registry.counter('budget_requests', "Requests served", ('route', 'status'))
+    in_flight = registry.gauge('budget_in_flight', "Requests in flight")
+
+    requests.inc(route='/convert', status='200')
+    requests.inc(2, route='/convert', status='200')
+    requests.inc(route='/ai', status='500')
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert registry.render() == (
+        '# HELP budget_requests Requests served\n'
+        '# TYPE budget_requests counter\n'
+        'budget_requests_total{route="/ai",status="500"} 1\n'
+        'budget_requests_total{route="/convert",status="200"} 3\n'
+        '# HELP budget_in_flight Requests in flight\n'
+        '# TYPE budget_in_flight gauge\n'
+        'budget_in_flight 1\n'
+    )
+
+
+def test_histograms_count_observations_in_cumulative_buckets():
+    histogram = Histogram('budget_seconds', "Duration", ('stage',), buckets=(0.1, 1))
+
+    for value in (0.05, 0.1, 0.5, 7):
+        histogram.observe(value, stage='parse')
+
+    assert histogram.render()[2:] == [
+        'budget_seconds_bucket{stage="parse",le="0.1"} 2',
+        'budget_seconds_bucket{stage="parse",le="1"} 3',
+        'budget_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'budget_seconds_sum{stage="parse"} 7.65',
+        'budget_seconds_count{stage="parse"} 4',
+    ]
+
+
+def test_label_values_and_help_are_escaped():
+    counter = Counter('budget_errors', 'Errors\nby kind', ('message',))
+
+    counter.inc(message='bad "quote"\nand \\')
+
+    assert counter.render() == [
+        r'# HELP budget_errors Errors\nby kind',
+        '# TYPE budget_errors counter',
+        r'budget_errors_total{message="bad \"quote\"\nand \\"} 1',
+    ]
+
+
+def test_collected_values_are_read_at_render_time():
+    totals = {('hit',): 3.0}
+    registry = Registry()
+    registry.counter('budget_cache', "Cache lookups", ('outcome',), collect=lambda: totals)
+
+    totals[('miss',)] = 1.0
+
+    assert registry.render().splitlines()[2:] == [
+        'budget_cache_total{outcome="hit"} 3',
+        'budget_cache_total{outcome="miss"} 1',
+    ]
+
+
+def test_failed_collection_renders_no_samples():
+    def broken():
+        raise RuntimeError("store unavailable")
+
+    registry = Registry()
+    registry.gauge('budget_jobs', "Jobs", ('state',), collect=broken)
+
+    assert registry.render().splitlines()[2:] == []
+
+
+def test_registering_a_name_again_returns_the_existing_metric():
+    registry = Registry()
+    first = registry.counter('budget_calls', "Calls")
+
+    assert registry.counter('budget_calls', "Calls") is first
+
+
+def test_metrics_must_implement_samples():
+    class Incomplete(Metric):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete('budget_incomplete', "Incomplete")
@@ -0,0 +1,81 @@
+"""
+Tracing
+Nested timing spans of one request, collected only while the request is being profiled
+"""
+import contextvars
+import itertools
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+
+@dataclass
+class Span:
+    """A timed piece of work; times are seconds since the trace started"""
+    id: int
+    name: str
+    start: float
+    duration: Optional[float] = None
+    parent: Optional[int] = None
+
+
+class Trace:
+    """Spans recorded for one request, from any task or thread working for it"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self._ids = itertools.count(1)
+
+    def open(self, name: str, started: float, parent: Optional[int]) -> Span:
+        """Start a span at a perf_counter time"""
+        span = Span(next(self._ids), name, round(started - self.started, 6), parent=parent)
+        self.spans.append(span)
+        return span
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Spans in start order"""
+        return [asdict(span) for span in sorted(self.spans, key=lambda span: span.start)]
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('trace', default=None)
+_parent: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar('trace_parent', default=None)
+
+
+@contextmanager
+def start_trace() -> Iterator[Trace]:
+    """Collect the spans of work done within the block (and tasks and threads started from it)"""
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Record the block as a span of the current trace, nesting the spans opened within it"""
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    current = trace.open(name, started, _parent.get())
+    token = _parent.set(current.id)
+    try:
+        yield
+    finally:
+        _parent.reset(token)
+        current.duration = round(time.perf_counter() - started, 6)
+
+
+def record_span(name: str, seconds: float):
+    """Record work that just finished, e.g. timed across the yields of a generator"""
+    trace = _trace.get()
+    if trace is None:
+        return
+    ended = time.perf_counter()
+    trace.open(name, ended - seconds, _parent.get()).duration = round(seconds, 6)
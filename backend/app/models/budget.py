@@ -32,6 +32,9 @@ class BudgetChapter(BaseModel):
     title: str = Field(..., description="Chapter title")
     items: List[BudgetItem] = Field(default_factory=list, description="Items in this chapter")
     subchapters: List['BudgetChapter'] = Field(default_factory=list, description="Subchapters")
+    declared_total: Optional[Decimal] = Field(
+        default=None, description="Total stated by the source file, if any"
+    )
 
     @property
     def total(self) -> Decimal:
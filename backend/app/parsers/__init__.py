@@ -1,4 +1,7 @@
 """Parsers for different budget formats"""
 from .bc3_parser import BC3Parser
+from .pdf_table_parser import PDFTableParser
+from .pdf_rule_parser import PDFRuleParser
+from .number_format import NumberFormat, get_number_format
 
-__all__ = ['BC3Parser']
+__all__ = ['BC3Parser', 'PDFTableParser', 'PDFRuleParser', 'NumberFormat', 'get_number_format']
@@ -3,10 +3,11 @@ BC3 Format Parser
 Parses FIEBDC-3 (BC3) budget files
 """
 import re
-from typing import Dict, List, Tuple, Optional
+from typing import BinaryIO, Dict, List, Tuple, Optional
 from decimal import Decimal
 from datetime import datetime
 from ..models.budget import Budget, BudgetChapter, BudgetItem, BudgetMetadata
+from ..metrics import observe_budget, stage
 
 
 class BC3Parser:
@@ -28,19 +29,33 @@ class BC3Parser:
 
         return self.parse_content(content)
 
+    def parse_stream(self, stream: BinaryIO) -> Budget:
+        """Parse BC3 data from a binary file object"""
+        return self.parse_content(stream.read().decode('latin-1'))
+
     def parse_content(self, content: str) -> Budget:
         """Parse BC3 content string"""
-        # Split into records
-        records = content.split(self.RECORD_SEPARATOR)
+        # Start from a clean state: the parser is shared between requests
+        self.records = {}
+        self.metadata = BudgetMetadata()
 
-        # First pass: collect all records
-        for record in records:
-            if not record.strip():
-                continue
-            self._parse_record(record)
+        with stage('parse'):
+            # Split into records
+            records = content.split(self.RECORD_SEPARATOR)
+
+            # First pass: collect all records
+            for record in records:
+                if not record.strip():
+                    continue
+                self._parse_record(record)
 
         # Second pass: build budget structure
-        budget = self._build_budget()
+        with stage('build'):
+            budget = self._build_budget()
+        observe_budget(budget, 'bc3')
+
+        # Don't keep the records of the last file alive between requests
+        self.records = {}
         return budget
 
     def _parse_record(self, record: str):
@@ -192,7 +207,9 @@ class BC3Parser:
 
         chapter = BudgetChapter(
             code=code,
-            title=record.get('description', code)
+            title=record.get('description', code),
+            # The price of a chapter concept is its stated total; 0 means not given
+            declared_total=record.get('price') or None
         )
 
         # Add children
@@ -0,0 +1,131 @@
+"""
+Number Format
+Parsing of amounts printed in budget documents
+"""
+import os
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+# Characters that may surround an amount without being part of it
+_CURRENCY_CHARS = '€$£  '
+
+
+class NumberFormat:
+    """Regional number format with fixed decimal and thousands separators"""
+
+    def __init__(self, decimal_separator: str = ',', thousands_separator: str = '.'):
+        """
+        Initialize number format
+
+        Args:
+            decimal_separator: Character marking the decimal part
+            thousands_separator: Character grouping thousands (may be empty)
+        """
+        self.decimal_separator = decimal_separator
+        self.thousands_separator = thousands_separator
+
+        decimal = re.escape(decimal_separator)
+        if thousands_separator:
+            thousands = re.escape(thousands_separator)
+            self.pattern = (
+                rf'[-+]?(?:\d{{1,3}}(?:{thousands}\d{{3}})+|\d+)(?:{decimal}\d+)?'
+            )
+        else:
+            self.pattern = rf'[-+]?\d+(?:{decimal}\d+)?'
+
+        self._full_match = re.compile(rf'^{self.pattern}$').match
+        translation = {decimal_separator: '.'}
+        if thousands_separator:
+            translation[thousands_separator] = None
+        self._translation = str.maketrans(translation)
+
+    def parse(self, text: str) -> Optional[Decimal]:
+        """
+        Parse an amount such as '1.234,56' or '95,00 €'
+
+        Args:
+            text: Token to parse
+
+        Returns:
+            Decimal value, or None if the token is not a number in this format
+        """
+        value = text.strip(_CURRENCY_CHARS)
+        if not self._full_match(value):
+            return None
+        return Decimal(value.translate(self._translation))
+
+
+class AutoNumberFormat(NumberFormat):
+    """Number format that infers the separators of each token"""
+
+    def __init__(self):
+        self.decimal_separator = None
+        self.thousands_separator = None
+        self.pattern = r'[-+]?\d[\d.,]*'
+        self._full_match = re.compile(rf'^{self.pattern}$').match
+
+    def parse(self, text: str) -> Optional[Decimal]:
+        """
+        Parse an amount such as '1.234,56', '1,234.56', '12,50' or '95.00 €'
+
+        When a single separator is followed by exactly three digits it is read
+        as a thousands separator if it is a dot and as a decimal separator if it
+        is a comma, matching the Spanish convention.
+
+        Args:
+            text: Token to parse
+
+        Returns:
+            Decimal value, or None if the token is not a number
+        """
+        value = text.strip(_CURRENCY_CHARS)
+        if not self._full_match(value):
+            return None
+
+        last_dot = value.rfind('.')
+        last_comma = value.rfind(',')
+
+        if last_dot >= 0 and last_comma >= 0:
+            # Both separators present: the rightmost one is the decimal mark
+            if last_comma > last_dot:
+                value = value.replace('.', '').replace(',', '.')
+            else:
+                value = value.replace(',', '')
+        elif last_comma >= 0:
+            if value.count(',') > 1:
+                value = value.replace(',', '')
+            else:
+                value = value.replace(',', '.')
+        elif last_dot >= 0:
+            if value.count('.') > 1 or len(value) - last_dot - 1 == 3:
+                value = value.replace('.', '')
+
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            return None
+
+
+NUMBER_FORMATS = {
+    'auto': AutoNumberFormat(),
+    'es': NumberFormat(decimal_separator=',', thousands_separator='.'),
+    'en': NumberFormat(decimal_separator='.', thousands_separator=','),
+}
+
+
+def get_number_format(name: Optional[str] = None) -> NumberFormat:
+    """
+    Return a number format by name
+
+    Args:
+        name: 'auto', 'es' or 'en' (if None, reads PDF_NUMBER_FORMAT from env)
+
+    Returns:
+        NumberFormat instance
+    """
+    name = name or os.getenv('PDF_NUMBER_FORMAT', 'auto')
+    try:
+        return NUMBER_FORMATS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown number format: {name}")
@@ -0,0 +1,147 @@
+"""
+PDF Rule Parser
+Single-pass, rule-based extraction of budgets from PDF text lines
+"""
+import re
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from typing import Iterable, List, Optional, Sequence
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from .number_format import NumberFormat, get_number_format
+from .pdf_table_parser import next_chapter_code
+
+
+class LineClassifier(ABC):
+    """Recognise one kind of line and apply it to the budget being built"""
+
+    pattern: 're.Pattern'
+
+    def handle(self, line: str, builder: '_BudgetBuilder') -> bool:
+        """
+        Apply the line to the builder if it matches
+
+        Args:
+            line: Stripped, non-empty text line
+            builder: Budget under construction
+
+        Returns:
+            True if the line was consumed
+        """
+        match = self.pattern.match(line)
+        if match is None:
+            return False
+        self.apply(match, builder)
+        return True
+
+    @abstractmethod
+    def apply(self, match: 're.Match', builder: '_BudgetBuilder'):
+        """Update the builder from a successful match"""
+
+
+class ChapterClassifier(LineClassifier):
+    """Chapter headings: long uppercase lines or numbered titles such as '1. DEMOLICIONES'"""
+
+    def __init__(self):
+        self.pattern = re.compile(r'^(?:[A-Z\s]{10,}$|\d+\.\s+[A-Z])')
+
+    def apply(self, match: 're.Match', builder: '_BudgetBuilder'):
+        builder.open_chapter(match.string)
+
+
+class ItemClassifier(LineClassifier):
+    """Item lines: code, description, quantity, unit, unit price and total"""
+
+    def __init__(self, number_format: NumberFormat):
+        """
+        Initialize item classifier
+
+        Args:
+            number_format: Format used to read quantities and prices
+        """
+        number = number_format.pattern
+        self.number_format = number_format
+        self.pattern = re.compile(
+            rf'^(?P<code>[A-Z0-9.]+)\s+(?P<description>.+?)\s+'
+            rf'(?P<quantity>{number})\s+(?P<unit>[A-Za-z%][\w²³.]*)\s+'
+            rf'(?P<price>{number})\s*€?\s+(?P<total>{number})'
+        )
+
+    def apply(self, match: 're.Match', builder: '_BudgetBuilder'):
+        parse = self.number_format.parse
+        quantity = parse(match.group('quantity'))
+        price = parse(match.group('price'))
+        if quantity is None or price is None:
+            return
+
+        builder.add_item(BudgetItem(
+            code=match.group('code'),
+            description=match.group('description'),
+            quantity=quantity,
+            unit=match.group('unit'),
+            price=price
+        ))
+
+
+class PDFRuleParser:
+    """Build a budget from text lines with a precompiled set of line classifiers"""
+
+    def __init__(self, number_format: Optional[NumberFormat] = None,
+                 classifiers: Optional[Sequence[LineClassifier]] = None):
+        """
+        Initialize rule parser
+
+        Args:
+            number_format: Format of amounts (if None, reads PDF_NUMBER_FORMAT from env)
+            classifiers: Classifiers tried in order for every line
+                (if None, chapter headings then item lines)
+        """
+        self.number_format = number_format or get_number_format()
+        self.classifiers: List[LineClassifier] = list(classifiers) if classifiers is not None else [
+            ChapterClassifier(),
+            ItemClassifier(self.number_format),
+        ]
+
+    def parse(self, lines: Iterable[str], budget: Optional[Budget] = None) -> Budget:
+        """
+        Consume lines in a single pass
+
+        Args:
+            lines: Text lines, typically streamed page by page
+            budget: Budget to extend; its last chapter keeps receiving items
+                until a new heading is found (if None, a new budget is created)
+
+        Returns:
+            The budget with the extracted chapters and items
+        """
+        builder = _BudgetBuilder(budget if budget is not None else Budget())
+        classifiers = self.classifiers
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            for classifier in classifiers:
+                if classifier.handle(line, builder):
+                    break
+
+        return builder.budget
+
+
+class _BudgetBuilder:
+    """Accumulate chapters and items while lines are classified"""
+
+    def __init__(self, budget: Budget):
+        self.budget = budget
+        self.chapter: Optional[BudgetChapter] = budget.chapters[-1] if budget.chapters else None
+
+    def open_chapter(self, title: str):
+        """Start a new chapter with a generated code"""
+        self.chapter = BudgetChapter(code=next_chapter_code(self.budget.chapters), title=title)
+        self.budget.chapters.append(self.chapter)
+
+    def add_item(self, item: BudgetItem):
+        """Add an item to the current chapter, opening a default one if needed"""
+        if self.chapter is None:
+            self.open_chapter("Presupuesto General")
+        self.chapter.items.append(item)
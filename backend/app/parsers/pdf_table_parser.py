@@ -0,0 +1,416 @@
+"""
+PDF Table Parser
+Deterministic, layout-aware extraction of tabular budgets from PDF pages
+"""
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from ..models.budget import BudgetChapter, BudgetItem
+from .number_format import NumberFormat, get_number_format
+
+
+# Header words recognised for each column role (accents stripped, lowercase)
+HEADER_WORDS = {
+    'code': {'codigo', 'cod', 'cod.', 'code', 'ref', 'ref.', 'referencia'},
+    'description': {'descripcion', 'concepto', 'resumen', 'designacion', 'partida'},
+    'unit': {'ud', 'ud.', 'uds', 'unidad', 'unid', 'unid.', 'u'},
+    'quantity': {'cantidad', 'cant', 'cant.', 'medicion', 'mediciones', 'uds.'},
+    'price': {'precio', 'p.unit', 'p.unit.', 'p.u.', 'pu', 'unitario'},
+    'total': {'total', 'importe', 'subtotal', 'parcial'},
+}
+
+NUMERIC_ROLES = ('quantity', 'price', 'total')
+
+UNIT_PATTERN = re.compile(
+    r'^(m|m2|m²|m3|m³|ml|m\.l\.|ud|ud\.|u|uds|kg|t|tn|h|l|pa|p\.a\.|mes|dia|día|km|cm|mm|ha|%)$',
+    re.IGNORECASE
+)
+
+CODE_PATTERN = re.compile(r'^[A-Za-z0-9][\w.\-/]*$')
+
+CHAPTER_PATTERN = re.compile(
+    r'^(?:CAP[IÍ]TULO\s+)?(?P<code>[A-Z]{0,4}\d+(?:[.\-]\d+)*)\.?\s*[-–:]?\s+(?P<title>[^\d\s].*)$'
+)
+
+UPPERCASE_TITLE_PATTERN = re.compile(r'^[A-ZÁÉÍÓÚÑÜ\s]{10,}$')
+
+SKIP_PREFIXES = ('total', 'suma', 'subtotal')
+
+CURRENCY_TOKENS = {'€', '$', 'eur', 'euros'}
+
+
+@dataclass
+class PageExtraction:
+    """Result of parsing a single PDF page"""
+    page_number: int
+    text: str
+    chapters: List[BudgetChapter] = field(default_factory=list)
+    candidate_rows: int = 0
+    verified_rows: int = 0
+
+    @property
+    def confidence(self) -> float:
+        """Share of item rows whose quantity x price matches the printed total"""
+        if self.candidate_rows == 0:
+            # Nothing that looks like a budget line: there is nothing to miss
+            return 1.0
+        return self.verified_rows / self.candidate_rows
+
+    @property
+    def item_count(self) -> int:
+        """Number of items found on the page"""
+        return sum(_count_items(chapter) for chapter in self.chapters)
+
+
+class PDFTableParser:
+    """Parse budget tables from pdfplumber pages using word positions"""
+
+    def __init__(self, line_tolerance: float = 3.0, number_format: Optional[NumberFormat] = None):
+        """
+        Initialize table parser
+
+        Args:
+            line_tolerance: Maximum vertical distance (pt) between words of the same line
+            number_format: Format of amounts (if None, reads PDF_NUMBER_FORMAT from env)
+        """
+        self.line_tolerance = line_tolerance
+        self.number_format = number_format or get_number_format()
+
+    def parse_pages(self, pages: Iterable[Any],
+                    chapters: Optional[List[BudgetChapter]] = None) -> Iterator[PageExtraction]:
+        """
+        Parse pdfplumber pages in document order
+
+        Column layout and the current chapter carry over from one page to the
+        next, so tables that continue across page breaks are handled.
+
+        Args:
+            pages: pdfplumber page objects
+            chapters: Chapters of the document read so far, also by other
+                parsers, kept up to date by the caller between pages; chapters
+                without a printed code are numbered after them
+
+        Yields:
+            One PageExtraction per page
+        """
+        state = _DocumentState(chapters)
+
+        for number, page in enumerate(pages, start=1):
+            words = page.extract_words()
+            text = page.extract_text() or ''
+            # Release the page's layout objects so long documents stay flat in memory
+            page.flush_cache()
+            yield self._parse_page(number, text, words, state)
+
+    def _parse_page(self, number: int, text: str, words: List[Dict[str, Any]],
+                    state: '_DocumentState') -> PageExtraction:
+        """Parse the words of one page"""
+        result = PageExtraction(page_number=number, text=text)
+        state.start_page(result)
+
+        for line in self._group_lines(words):
+            columns = self._detect_header(line)
+            if columns:
+                state.columns = columns
+                state.last_item = None
+                continue
+
+            self._parse_line(line, state, result)
+
+        return result
+
+    def _group_lines(self, words: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Group words into visual lines by their vertical position"""
+        lines: List[List[Dict[str, Any]]] = []
+        current_top = None
+
+        for word in sorted(words, key=lambda w: (round(w['top']), w['x0'])):
+            if current_top is None or abs(word['top'] - current_top) > self.line_tolerance:
+                lines.append([])
+                current_top = word['top']
+            lines[-1].append(word)
+
+        for line in lines:
+            line.sort(key=lambda w: w['x0'])
+
+        return lines
+
+    def _detect_header(self, line: List[Dict[str, Any]]) -> Optional[Dict[str, float]]:
+        """Return column centers by role if the line is a table header"""
+        columns: Dict[str, float] = {}
+
+        for word in line:
+            key = _normalize(word['text'])
+            for role, names in HEADER_WORDS.items():
+                if key in names and role not in columns:
+                    columns[role] = (word['x0'] + word['x1']) / 2
+                    break
+
+        numeric = sum(1 for role in NUMERIC_ROLES if role in columns)
+        if len(columns) >= 3 and numeric >= 2:
+            return columns
+        return None
+
+    def _parse_line(self, line: List[Dict[str, Any]], state: '_DocumentState',
+                    result: PageExtraction):
+        """Classify a line as item, description continuation or chapter heading"""
+        texts = [word['text'] for word in line]
+        if _normalize(texts[0]).startswith(SKIP_PREFIXES):
+            state.last_item = None
+            self._read_chapter_total(line, state)
+            return
+
+        numbers, unit, tail_start = self._split_tail(line)
+
+        if len(numbers) >= 2:
+            self._add_item(line[:tail_start], numbers, unit, state, result)
+            return
+
+        joined = ' '.join(texts)
+
+        if not numbers and state.last_item is not None and self._is_continuation(line, state):
+            state.last_item.description = f"{state.last_item.description} {joined}"
+            return
+
+        state.last_item = None
+        chapter_match = CHAPTER_PATTERN.match(joined)
+        if chapter_match:
+            state.open_chapter(chapter_match.group('code'), chapter_match.group('title').strip())
+        elif UPPERCASE_TITLE_PATTERN.match(joined):
+            state.open_chapter(None, joined)
+
+    def _read_chapter_total(self, line: List[Dict[str, Any]], state: '_DocumentState'):
+        """Record the stated total of the open chapter from a 'Total capítulo ...' line"""
+        if state.chapter_code is None:
+            return
+
+        tokens = [_normalize(word['text']) for word in line]
+        names_chapter = any(token.startswith('capitulo') for token in tokens)
+        if not tokens[0].startswith('total') or not (
+                names_chapter or state.chapter_code.lower() in tokens):
+            return
+
+        numbers, _, _ = self._split_tail(line)
+        if numbers:
+            state.current_chapter().declared_total = numbers[-1][0]
+
+    def _split_tail(self, line: List[Dict[str, Any]]):
+        """
+        Split trailing numeric columns off a line
+
+        Returns:
+            Tuple of (numbers as (value, x-center) pairs, unit or None, index where the tail starts)
+        """
+        numbers = []
+        unit = None
+        index = len(line)
+
+        while index > 0:
+            word = line[index - 1]
+            text = word['text']
+
+            if _normalize(text) in CURRENCY_TOKENS:
+                index -= 1
+                continue
+
+            value = self.number_format.parse(text)
+            if value is not None and len(numbers) < 3:
+                numbers.insert(0, (value, (word['x0'] + word['x1']) / 2))
+                index -= 1
+                continue
+
+            if unit is None and numbers and UNIT_PATTERN.match(text):
+                unit = text
+                index -= 1
+                continue
+
+            break
+
+        # The first token is the item code, even when it looks like a number
+        if index == 0 and numbers and len(line) > 1:
+            numbers.pop(0)
+            index = 1
+
+        return numbers, unit, index
+
+    def _assign_numbers(self, numbers, columns: Optional[Dict[str, float]]) -> Dict[str, Decimal]:
+        """Map tail numbers to quantity/price/total roles"""
+        if columns and all(role in columns for role in NUMERIC_ROLES):
+            assigned: Dict[str, Decimal] = {}
+            for value, center in numbers:
+                role = min(NUMERIC_ROLES, key=lambda r: abs(columns[r] - center))
+                if role in assigned:
+                    break
+                assigned[role] = value
+            else:
+                return assigned
+
+        # Positional fallback: quantity, price, total from left to right
+        values = [value for value, _ in numbers]
+        if len(values) >= 3:
+            return dict(zip(NUMERIC_ROLES, values[-3:]))
+        return {'price': values[0], 'total': values[1]}
+
+    def _add_item(self, head: List[Dict[str, Any]], numbers, unit: Optional[str],
+                  state: '_DocumentState', result: PageExtraction):
+        """Build an item from the code/description head and the numeric tail"""
+        result.candidate_rows += 1
+        values = self._assign_numbers(numbers, state.columns)
+
+        code = None
+        if len(head) > 1 and CODE_PATTERN.match(head[0]['text']) and any(
+            ch.isdigit() for ch in head[0]['text']
+        ):
+            code = head[0]['text']
+            head = head[1:]
+
+        # A unit printed in its own column, before or after the description
+        if unit is None and head and state.columns and 'unit' in state.columns:
+            unit_center = state.columns['unit']
+            for index in (0, len(head) - 1):
+                word = head[index]
+                center = (word['x0'] + word['x1']) / 2
+                if UNIT_PATTERN.match(word['text']) and abs(center - unit_center) < 25:
+                    unit = word['text']
+                    head = head[:index] + head[index + 1:]
+                    break
+
+        description = ' '.join(word['text'] for word in head).strip()
+        if not description:
+            return
+
+        quantity = values.get('quantity')
+        price = values.get('price')
+        total = values.get('total')
+
+        if quantity is not None and price is not None and total is not None:
+            if _matches(quantity * price, total):
+                result.verified_rows += 1
+        elif price is not None and total is not None and price != 0:
+            quantity = (total / price).quantize(Decimal('0.001'))
+
+        chapter = state.current_chapter()
+        item = BudgetItem(
+            code=code or f"{chapter.code}.{len(chapter.items) + 1:03d}",
+            unit=unit or 'ud',
+            description=description,
+            price=price if price is not None else Decimal('0'),
+            quantity=quantity if quantity is not None else Decimal('1')
+        )
+        chapter.items.append(item)
+        state.last_item = item
+        state.description_x = head[0]['x0']
+
+    def _is_continuation(self, line: List[Dict[str, Any]], state: '_DocumentState') -> bool:
+        """Whether a number-free line continues the previous item's description"""
+        if state.description_x is not None:
+            return abs(line[0]['x0'] - state.description_x) <= 15
+        return line[0]['text'][:1].islower()
+
+
+class _DocumentState:
+    """Layout and chapter context shared across the pages of a document"""
+
+    def __init__(self, chapters: Optional[List[BudgetChapter]] = None):
+        self.chapters = chapters if chapters is not None else []
+        self.columns: Optional[Dict[str, float]] = None
+        self.chapter_code: Optional[str] = None
+        self.chapter_title: Optional[str] = None
+        self.parent_code: Optional[str] = None
+        self.parent_title: Optional[str] = None
+        # Codes given to chapters without a printed one
+        self.generated_codes: List[str] = []
+        self.last_item: Optional[BudgetItem] = None
+        self.description_x: Optional[float] = None
+        self.result: Optional[PageExtraction] = None
+
+    def start_page(self, result: PageExtraction):
+        """Begin a new page; the open chapter continues on it"""
+        self.result = result
+        self.last_item = None
+
+    def open_chapter(self, code: Optional[str], title: str):
+        """Start a new chapter, nesting it when its code extends the open chapter code"""
+        if not code:
+            code = next_chapter_code(self.chapters, self.generated_codes)
+            self.generated_codes.append(code)
+
+        top_code = self.parent_code or self.chapter_code
+        if top_code and code != top_code and code.startswith(f"{top_code}."):
+            if self.parent_code is None:
+                self.parent_code, self.parent_title = self.chapter_code, self.chapter_title
+        else:
+            self.parent_code = self.parent_title = None
+
+        self.chapter_code, self.chapter_title = code, title
+
+    def current_chapter(self) -> BudgetChapter:
+        """Return the chapter receiving items on this page, creating it if needed"""
+        if self.chapter_code is None:
+            self.open_chapter(None, "Presupuesto General")
+
+        chapters = self.result.chapters
+        if self.parent_code is not None:
+            if not chapters or chapters[-1].code != self.parent_code:
+                chapters.append(BudgetChapter(code=self.parent_code, title=self.parent_title))
+            chapters = chapters[-1].subchapters
+
+        if not chapters or chapters[-1].code != self.chapter_code:
+            chapters.append(BudgetChapter(code=self.chapter_code, title=self.chapter_title))
+        return chapters[-1]
+
+
+def next_chapter_code(chapters: List[BudgetChapter], taken: Iterable[str] = ()) -> str:
+    """
+    Code for a chapter without one, numbered after the chapters so far
+
+    Args:
+        chapters: Chapters of the document so far
+        taken: Other codes already given out
+
+    Returns:
+        The first free code from CAP<n>, n being one more than the chapter count
+    """
+    used = {chapter.code for chapter in chapters}
+    used.update(taken)
+    number = len(chapters) + 1
+    while f"CAP{number:02d}" in used:
+        number += 1
+    return f"CAP{number:02d}"
+
+
+def merge_chapters(target: List[BudgetChapter], chapters: Iterable[BudgetChapter]):
+    """
+    Append chapters to a list, merging a chapter that continues the last one
+
+    Args:
+        target: Chapter list to extend in place
+        chapters: Chapters to append in order
+    """
+    for chapter in chapters:
+        if target and target[-1].code == chapter.code:
+            target[-1].items.extend(chapter.items)
+            merge_chapters(target[-1].subchapters, chapter.subchapters)
+            if chapter.declared_total is not None:
+                target[-1].declared_total = chapter.declared_total
+        else:
+            target.append(chapter)
+
+
+def _count_items(chapter: BudgetChapter) -> int:
+    """Count items in a chapter and its subchapters"""
+    return len(chapter.items) + sum(_count_items(sub) for sub in chapter.subchapters)
+
+
+def _matches(computed: Decimal, printed: Decimal) -> bool:
+    """Whether a computed total agrees with the printed one within rounding"""
+    tolerance = max(Decimal('0.011'), abs(printed) * Decimal('0.005'))
+    return abs(computed - printed) <= tolerance
+
+
+def _normalize(text: str) -> str:
+    """Lowercase and strip accents for keyword comparison"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
@@ -0,0 +1,65 @@
+"""
+Tests for number formats
+"""
+from decimal import Decimal
+import pytest
+from .number_format import AutoNumberFormat, NumberFormat, get_number_format
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("1.234,56", Decimal("1234.56")),
+    ("95,00 €", Decimal("95.00")),
+    ("-12,5", Decimal("-12.5")),
+    ("1.234.567", Decimal("1234567")),
+    ("7", Decimal("7")),
+])
+def test_spanish_format(text, expected):
+    assert get_number_format('es').parse(text) == expected
+
+
+@pytest.mark.parametrize('text', ["1,234.56", "12.34", "1.23,4", "abc", "", "1 234"])
+def test_spanish_format_rejects_other_formats(text):
+    assert get_number_format('es').parse(text) is None
+
+
+def test_english_format():
+    number_format = get_number_format('en')
+
+    assert number_format.parse("1,234.56") == Decimal("1234.56")
+    assert number_format.parse("$95.00") == Decimal("95.00")
+    assert number_format.parse("1.234,56") is None
+
+
+def test_format_without_thousands_separator():
+    number_format = NumberFormat(decimal_separator='.', thousands_separator='')
+
+    assert number_format.parse("1234.5") == Decimal("1234.5")
+    assert number_format.parse("1,234.5") is None
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("1.234,56", Decimal("1234.56")),
+    ("1,234.56", Decimal("1234.56")),
+    ("12,50", Decimal("12.50")),
+    ("95.00 €", Decimal("95.00")),
+    # A lone dot before three digits groups thousands; a lone comma is decimal
+    ("1.234", Decimal("1234")),
+    ("1,234", Decimal("1.234")),
+    ("1.234.567", Decimal("1234567")),
+    ("1,234,567", Decimal("1234567")),
+])
+def test_auto_format_infers_separators(text, expected):
+    assert AutoNumberFormat().parse(text) == expected
+
+
+@pytest.mark.parametrize('text', ["abc", "", "€", "1.2.3,4,5"])
+def test_auto_format_rejects_non_numbers(text):
+    assert AutoNumberFormat().parse(text) is None
+
+
+def test_format_names(monkeypatch):
+    monkeypatch.setenv('PDF_NUMBER_FORMAT', 'EN')
+    assert get_number_format() is get_number_format('en')
+
+    with pytest.raises(ValueError):
+        get_number_format('fr')
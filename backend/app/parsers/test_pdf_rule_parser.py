@@ -0,0 +1,90 @@
+"""
+Tests for the rule-based PDF line classifiers
+"""
+import re
+from decimal import Decimal
+import pytest
+from ..models.budget import Budget, BudgetChapter
+from .number_format import get_number_format
+from .pdf_rule_parser import (
+    ChapterClassifier, ItemClassifier, LineClassifier, PDFRuleParser, _BudgetBuilder
+)
+
+
+def test_chapter_classifier_matches_headings_only():
+    classifier = ChapterClassifier()
+    builder = _BudgetBuilder(Budget())
+
+    assert classifier.handle("MOVIMIENTO DE TIERRAS", builder)
+    assert classifier.handle("2. Cimentaciones", builder)
+    assert not classifier.handle("Excavación en zanja", builder)
+    assert not classifier.handle("CORTO", builder)
+
+    assert [(c.code, c.title) for c in builder.budget.chapters] == [
+        ("CAP01", "MOVIMIENTO DE TIERRAS"), ("CAP02", "2. Cimentaciones")
+    ]
+
+
+def test_item_classifier_reads_amounts_in_the_given_format():
+    classifier = ItemClassifier(get_number_format('es'))
+    builder = _BudgetBuilder(Budget())
+
+    assert classifier.handle("01.01 Excavación en zanja 1.250,50 m3 12,75 € 15.943,88", builder)
+
+    [chapter] = builder.budget.chapters
+    [item] = chapter.items
+    assert (chapter.code, chapter.title) == ("CAP01", "Presupuesto General")
+    assert (item.code, item.description, item.unit) == ("01.01", "Excavación en zanja", "m3")
+    assert (item.quantity, item.price) == (Decimal("1250.50"), Decimal("12.75"))
+
+
+def test_item_classifier_ignores_lines_without_amounts():
+    classifier = ItemClassifier(get_number_format('es'))
+    builder = _BudgetBuilder(Budget())
+
+    assert not classifier.handle("01.01 Excavación en zanja con medios mecánicos", builder)
+    assert builder.budget.chapters == []
+
+
+def test_classifiers_are_tried_in_order_and_custom_ones_can_be_added():
+    class NoteClassifier(LineClassifier):
+        pattern = re.compile(r'^Nota:')
+
+        def __init__(self):
+            self.notes = []
+
+        def apply(self, match, builder):
+            self.notes.append(match.string)
+
+    notes = NoteClassifier()
+    number_format = get_number_format('es')
+    parser = PDFRuleParser(number_format, [notes, ChapterClassifier(), ItemClassifier(number_format)])
+
+    budget = parser.parse([
+        "DEMOLICIONES Y TRABAJOS PREVIOS",
+        "Nota: precios sin IVA",
+        "D01 Demolición de tabique 20,00 m2 8,50 170,00",
+        "   ",
+    ])
+
+    assert notes.notes == ["Nota: precios sin IVA"]
+    assert [(c.code, len(c.items)) for c in budget.chapters] == [("CAP01", 1)]
+
+
+def test_parsing_continues_the_last_chapter_of_a_budget():
+    budget = Budget(chapters=[BudgetChapter(code="01", title="Estructuras")])
+
+    PDFRuleParser(get_number_format('es')).parse([
+        "E02 Viga de hormigón 3,00 m 45,00 135,00",
+        "CUBIERTAS E IMPERMEABILIZACION",
+    ], budget)
+
+    assert [(c.code, len(c.items)) for c in budget.chapters] == [("01", 1), ("CAP02", 0)]
+
+
+def test_classifiers_must_implement_apply():
+    class Incomplete(LineClassifier):
+        pattern = re.compile(r'^x')
+
+    with pytest.raises(TypeError):
+        Incomplete()
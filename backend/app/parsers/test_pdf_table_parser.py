@@ -0,0 +1,186 @@
+"""
+Tests for the PDF table parser and chapter merging
+"""
+from decimal import Decimal
+from ..models.budget import BudgetChapter, BudgetItem
+from .number_format import get_number_format
+from .pdf_table_parser import PDFTableParser, merge_chapters, next_chapter_code
+
+# Column positions (pt) of a typical budget table
+COLUMNS = {'code': 40, 'description': 100, 'unit': 330, 'quantity': 380, 'price': 450, 'total': 520}
+HEADER = [('Código', 'code'), ('Descripción', 'description'), ('Ud', 'unit'),
+          ('Cantidad', 'quantity'), ('Precio', 'price'), ('Importe', 'total')]
+
+
+class FakePage:
+    """Stand-in for a pdfplumber page, built from lines of (text, x0) words"""
+
+    def __init__(self, lines):
+        self.words = []
+        for row, line in enumerate(lines):
+            for text, x0 in line:
+                self.words.append({
+                    'text': text, 'x0': x0, 'x1': x0 + 6 * len(text),
+                    'top': 100 + 14 * row, 'bottom': 110 + 14 * row,
+                })
+
+    def extract_words(self):
+        return self.words
+
+    def extract_text(self):
+        return ''
+
+    def flush_cache(self):
+        pass
+
+
+def header():
+    return [(text, COLUMNS[role]) for text, role in HEADER]
+
+
+def item(code, description, unit, quantity, price, total):
+    line = [(code, COLUMNS['code'])]
+    line += [(word, COLUMNS['description'] + 40 * index) for index, word in enumerate(description.split())]
+    line += [(unit, COLUMNS['unit']), (quantity, COLUMNS['quantity']),
+             (price, COLUMNS['price']), (total, COLUMNS['total'])]
+    return line
+
+
+def text_line(text, x0=COLUMNS['code']):
+    return [(word, x0 + 40 * index) for index, word in enumerate(text.split())]
+
+
+def parse(*pages, chapters=None):
+    parser = PDFTableParser(number_format=get_number_format('es'))
+    return list(parser.parse_pages([FakePage(lines) for lines in pages], chapters))
+
+
+def test_reads_items_under_a_header_and_verifies_totals():
+    [page] = parse([
+        header(),
+        text_line("01 MOVIMIENTO DE TIERRAS"),
+        item("01.01", "Excavación en zanja", "m3", "10,00", "12,50", "125,00"),
+        item("01.02", "Relleno de tierras", "m3", "4,00", "7,25", "29,00"),
+    ])
+
+    [chapter] = page.chapters
+    assert (chapter.code, chapter.title) == ("01", "MOVIMIENTO DE TIERRAS")
+    assert [(i.code, i.description, i.unit, i.quantity, i.price) for i in chapter.items] == [
+        ("01.01", "Excavación en zanja", "m3", Decimal("10.00"), Decimal("12.50")),
+        ("01.02", "Relleno de tierras", "m3", Decimal("4.00"), Decimal("7.25")),
+    ]
+    assert (page.candidate_rows, page.verified_rows, page.confidence) == (2, 2, 1.0)
+
+
+def test_rows_whose_total_does_not_match_lower_the_confidence():
+    [page] = parse([
+        header(),
+        item("01.01", "Excavación", "m3", "10,00", "12,50", "125,00"),
+        item("01.02", "Relleno", "m3", "4,00", "7,25", "99,00"),
+    ])
+
+    assert page.item_count == 2
+    assert page.confidence == 0.5
+
+
+def test_pages_without_budget_lines_are_fully_confident():
+    [page] = parse([text_line("Memoria descriptiva del proyecto")])
+
+    assert page.item_count == 0
+    assert page.confidence == 1.0
+
+
+def test_continuation_lines_extend_the_previous_description():
+    [page] = parse([
+        header(),
+        item("01.01", "Excavación en zanja", "m3", "10,00", "12,50", "125,00"),
+        text_line("con medios mecánicos", COLUMNS['description']),
+    ])
+
+    assert page.chapters[0].items[0].description == "Excavación en zanja con medios mecánicos"
+
+
+def test_chapter_total_lines_set_the_declared_total():
+    [page] = parse([
+        header(),
+        text_line("01 DEMOLICIONES"),
+        item("01.01", "Demolición de tabique", "m2", "2,00", "10,00", "20,00"),
+        text_line("Total capítulo 01") + [("20,00", COLUMNS['total'])],
+    ])
+
+    assert page.chapters[0].declared_total == Decimal("20.00")
+    assert page.item_count == 1
+
+
+def test_tables_continue_across_pages():
+    first, second = parse(
+        [header(), text_line("01 ESTRUCTURAS"), item("01.01", "Pilar", "ud", "2,00", "5,00", "10,00")],
+        [item("01.02", "Viga", "ud", "3,00", "5,00", "15,00")],
+    )
+
+    assert [chapter.code for chapter in second.chapters] == ["01"]
+    assert second.chapters[0].items[0].code == "01.02"
+    assert second.verified_rows == 1
+
+
+def test_subchapter_codes_nest_under_their_chapter():
+    [page] = parse([
+        header(),
+        text_line("02 CIMENTACIONES"),
+        text_line("02.1 ZAPATAS"),
+        item("02.1.01", "Hormigón HA-25", "m3", "1,00", "90,00", "90,00"),
+    ])
+
+    [chapter] = page.chapters
+    assert chapter.code == "02"
+    assert [sub.code for sub in chapter.subchapters] == ["02.1"]
+    assert chapter.subchapters[0].items[0].code == "02.1.01"
+
+
+def test_chapters_without_code_are_numbered_after_the_documents_chapters():
+    earlier = [BudgetChapter(code="CAP01", title="Leído por reglas")]
+    [page] = parse([
+        header(),
+        text_line("INSTALACIONES ELECTRICAS"),
+        item("E.01", "Punto de luz", "ud", "1,00", "30,00", "30,00"),
+        text_line("INSTALACIONES DE FONTANERIA"),
+        item("F.01", "Toma de agua", "ud", "1,00", "40,00", "40,00"),
+    ], chapters=earlier)
+
+    assert [chapter.code for chapter in page.chapters] == ["CAP02", "CAP03"]
+
+
+def test_next_chapter_code_skips_codes_in_use():
+    chapters = [BudgetChapter(code="01", title="A"), BudgetChapter(code="CAP03", title="B")]
+
+    assert next_chapter_code([]) == "CAP01"
+    assert next_chapter_code(chapters) == "CAP04"
+    assert next_chapter_code(chapters[:1], taken=["CAP02"]) == "CAP03"
+
+
+def make_item(code):
+    return BudgetItem(code=code, unit="ud", description=code, price=Decimal("1"), quantity=Decimal("1"))
+
+
+def test_merge_chapters_continues_the_last_chapter():
+    target = [BudgetChapter(code="01", title="A", items=[make_item("01.01")])]
+    continuation = BudgetChapter(
+        code="01", title="A", items=[make_item("01.02")], declared_total=Decimal("2"),
+        subchapters=[BudgetChapter(code="01.1", title="A1", items=[make_item("01.1.01")])]
+    )
+
+    merge_chapters(target, [continuation, BudgetChapter(code="02", title="B", items=[make_item("02.01")])])
+
+    assert [chapter.code for chapter in target] == ["01", "02"]
+    assert [i.code for i in target[0].items] == ["01.01", "01.02"]
+    assert target[0].declared_total == Decimal("2")
+    assert [sub.code for sub in target[0].subchapters] == ["01.1"]
+
+
+def test_merge_chapters_only_joins_the_last_chapter():
+    target = [BudgetChapter(code="01", title="A"), BudgetChapter(code="02", title="B")]
+
+    merge_chapters(target, [BudgetChapter(code="01", title="A", items=[make_item("x")])])
+
+    assert [chapter.code for chapter in target] == ["01", "02", "01"]
+    assert target[0].items == []
@@ -1,5 +1,8 @@
 """API routes"""
 from .convert import router as convert_router
 from .ai import router as ai_router
+from .jobs import router as jobs_router
+from .metrics import router as metrics_router
+from .debug import router as debug_router
 
-__all__ = ['convert_router', 'ai_router']
+__all__ = ['convert_router', 'ai_router', 'jobs_router', 'metrics_router', 'debug_router']
@@ -0,0 +1,297 @@
+"""
+Admission control for conversion endpoints
+Caps request bodies, concurrent executions, waiting requests and the memory they may take, rejecting overload early
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class AdmissionLimit:
+    """Limits of a group of endpoints"""
+    name: str
+    # Path prefixes of the group, matched in order across groups
+    paths: Tuple[str, ...]
+    max_body_bytes: int
+    # Requests running at once (0 for no limit) and waiting for a turn
+    max_concurrent: int = 0
+    max_queued: int = 0
+    # Memory a request is expected to take, as a multiple of its body size
+    memory_factor: float = 1.0
+
+
+class Overloaded(Exception):
+    """A request turned away to protect the requests already running"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _BodyTooLarge(Exception):
+    """A request body grew past its limit while being read"""
+
+
+class _Group:
+    """Running and waiting requests of one group"""
+
+    def __init__(self, limit: AdmissionLimit):
+        self.limit = limit
+        self.running = 0
+        self.waiting = 0
+        # Smoothed seconds a request runs, to tell rejected clients when to retry
+        self.duration = 0.0
+        self.admitted = 0
+        self.rejected: Dict[int, int] = {}
+
+    def retry_after(self) -> int:
+        """Seconds until the requests ahead are likely done"""
+        if not self.duration:
+            return 1
+        slots = self.limit.max_concurrent or 1
+        return min(300, max(1, math.ceil(self.duration * (self.waiting + 1) / slots)))
+
+
+class AdmissionController:
+    """Admit requests while their group and the memory budget have room, queueing a bounded number"""
+
+    def __init__(self, limits: List[AdmissionLimit], memory_bytes: Optional[int] = None,
+                 queue_timeout: Optional[float] = None):
+        """
+        Initialize admission controller
+
+        Args:
+            limits: Limits per group of endpoints
+            memory_bytes: Memory all admitted requests may take together, by
+                their estimated cost, 0 for no limit (if None, reads
+                ADMISSION_MEMORY_BYTES from env)
+            queue_timeout: Seconds a request waits for its turn before being
+                rejected (if None, reads ADMISSION_QUEUE_TIMEOUT from env)
+        """
+        self.groups = [_Group(limit) for limit in limits]
+        self.memory_bytes = memory_bytes if memory_bytes is not None else int(
+            os.getenv('ADMISSION_MEMORY_BYTES', 1024 * 1024 * 1024)
+        )
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(
+            os.getenv('ADMISSION_QUEUE_TIMEOUT', 30)
+        )
+        self.memory_used = 0
+        self._changed: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def match(self, path: str) -> Optional[_Group]:
+        """Group of a request path, or None if it is not controlled"""
+        for group in self.groups:
+            if path.startswith(group.limit.paths):
+                return group
+        return None
+
+    def cost(self, group: _Group, body_bytes: int) -> int:
+        """Estimated memory of a request; capped so a large one can still run alone"""
+        cost = int(body_bytes * group.limit.memory_factor)
+        return min(cost, self.memory_bytes) if self.memory_bytes else 0
+
+    async def acquire(self, group: _Group, cost: int):
+        """
+        Wait for a turn to run
+
+        Args:
+            group: Group of the request
+            cost: Estimated memory of the request
+
+        Raises:
+            Overloaded: 429 if too many requests already wait, 503 if no turn
+                came within the queue timeout
+        """
+        changed = self._condition()
+        async with changed:
+            if not group.waiting and self._fits(group, cost):
+                self._admit(group, cost)
+                return
+            if group.waiting >= group.limit.max_queued:
+                raise self._reject(group, 429, f"Too many {group.limit.name} requests in progress")
+
+            group.waiting += 1
+            try:
+                await asyncio.wait_for(changed.wait_for(lambda: self._fits(group, cost)), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject(group, 503, f"Server busy with {group.limit.name} requests")
+            finally:
+                group.waiting -= 1
+            self._admit(group, cost)
+
+    async def release(self, group: _Group, cost: int, seconds: float):
+        """Give back a turn once the request is done"""
+        changed = self._condition()
+        async with changed:
+            group.running -= 1
+            self.memory_used -= cost
+            group.duration = seconds if not group.duration else 0.8 * group.duration + 0.2 * seconds
+            changed.notify_all()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Running, waiting, admitted and rejected requests per group"""
+        return {
+            group.limit.name: {
+                'running': group.running,
+                'waiting': group.waiting,
+                'admitted': group.admitted,
+                'rejected': dict(group.rejected),
+            }
+            for group in self.groups
+        }
+
+    def _condition(self) -> asyncio.Condition:
+        """Condition signalled when a turn frees up, bound to the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._changed is None or self._loop is not loop:
+            self._changed = asyncio.Condition()
+            self._loop = loop
+        return self._changed
+
+    def _fits(self, group: _Group, cost: int) -> bool:
+        """Whether the group has a free slot and the memory budget room for the cost"""
+        if group.limit.max_concurrent and group.running >= group.limit.max_concurrent:
+            return False
+        return not self.memory_bytes or self.memory_used + cost <= self.memory_bytes
+
+    def _admit(self, group: _Group, cost: int):
+        group.running += 1
+        group.admitted += 1
+        self.memory_used += cost
+
+    def _reject(self, group: _Group, status_code: int, detail: str) -> Overloaded:
+        group.rejected[status_code] = group.rejected.get(status_code, 0) + 1
+        return Overloaded(status_code, detail, group.retry_after())
+
+
+def default_limits() -> List[AdmissionLimit]:
+    """Limits of the conversion endpoints, from env"""
+    max_file_size = int(os.getenv('MAX_FILE_SIZE', 10 * 1024 * 1024))
+
+    def limit(name: str, paths: Tuple[str, ...], max_body_bytes: int, concurrent: int, queued: int,
+              memory_factor: float) -> AdmissionLimit:
+        prefix = f"ADMISSION_{name.upper()}"
+        return AdmissionLimit(
+            name, paths, max_body_bytes,
+            int(os.getenv(f"{prefix}_CONCURRENCY", concurrent)),
+            int(os.getenv(f"{prefix}_QUEUE", queued)),
+            memory_factor
+        )
+
+    return [
+        # Batches are read whole before being unpacked into jobs
+        limit('batch', ('/convert/batch',), int(os.getenv('BATCH_MAX_BYTES', 512 * 1024 * 1024)), 2, 4, 2),
+        # PDF extraction holds every parsed page
+        limit('extraction', ('/convert/pdf-to-',), max_file_size, 2, 8, 10),
+        limit('conversion', ('/convert/',), max_file_size, 4, 16, 4),
+        # AI routes mostly wait on the API
+        limit('ai', ('/ai/',), max_file_size, 8, 32, 4),
+        # Jobs are queued, so only their bodies are capped
+        limit('jobs', ('/jobs',), max_file_size, 0, 0, 0),
+    ]
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying admission control to requests with a body"""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        """
+        Initialize admission middleware
+
+        Args:
+            app: ASGI application
+            controller: Admission controller (if None, built from env with default_limits)
+        """
+        self.app = app
+        self.controller = controller or AdmissionController(default_limits())
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] in ('GET', 'HEAD', 'OPTIONS'):
+            await self.app(scope, receive, send)
+            return
+
+        group = self.controller.match(scope['path'])
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Reject bodies declared too large before reading any of them
+        max_body_bytes = group.limit.max_body_bytes
+        declared = _content_length(scope)
+        if declared is not None and declared > max_body_bytes:
+            await _respond(send, 413, f"Request body larger than {max_body_bytes} bytes")
+            return
+
+        cost = self.controller.cost(group, declared if declared is not None else max_body_bytes)
+        try:
+            await self.controller.acquire(group, cost)
+        except Overloaded as e:
+            await _respond(send, e.status_code, e.detail, {'Retry-After': str(e.retry_after)})
+            return
+
+        started = time.monotonic()
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def receive_limited():
+            # Chunked bodies carry no length: count them as they stream in
+            nonlocal received, too_large
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > max_body_bytes:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def send_tracked(message):
+            nonlocal response_started
+            # Drop whatever error the app makes of the aborted body, and answer 413 below
+            if too_large and not response_started:
+                return
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_limited, send_tracked)
+        except Exception:
+            if not too_large or response_started:
+                raise
+        finally:
+            # Held until the response is fully sent, since streamed responses keep their memory
+            await self.controller.release(group, cost, time.monotonic() - started)
+
+        if too_large and not response_started:
+            await _respond(send, 413, f"Request body larger than {max_body_bytes} bytes")
+
+
+def _content_length(scope) -> Optional[int]:
+    """Declared body size of a request, if any"""
+    for name, value in scope['headers']:
+        if name == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def _respond(send, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+    """Send a JSON error response like those of HTTPException"""
+    body = json.dumps({'detail': detail}).encode('utf-8')
+    raw_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    # Ask the client to reconnect rather than send the rest of the body on this connection
+    raw_headers.append((b'connection', b'close'))
+    await send({'type': 'http.response.start', 'status': status_code, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
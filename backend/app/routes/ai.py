@@ -1,22 +1,27 @@
 """
 AI enhancement routes
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import tempfile
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from dataclasses import asdict
+import asyncio
 import os
-from ..parsers.bc3_parser import BC3Parser
-from ..ai.budget_enhancer import BudgetEnhancer
+from ..ai.usage import get_usage_metrics, with_usage
+from ..cache.result_cache import ResultCache
+from ..cache.single_flight import get_single_flight
+from ..jobs import get_services
 from ..models.budget import Budget
+from .disconnect import cancel_on_disconnect
+from .spool import upload_digest
+from .sse import event_stream
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
-# Initialize services
-bc3_parser = BC3Parser()
-budget_enhancer = BudgetEnhancer()
+# Parsers and AI services are loaded on first use by get_services
+flights = get_single_flight()
 
 
 @router.post("/enhance-budget")
-async def enhance_budget(budget_data: Budget):
+async def enhance_budget(request: Request, budget_data: Budget):
     """
     Enhance budget descriptions using AI
 
@@ -27,34 +32,93 @@ async def enhance_budget(budget_data: Budget):
         Enhanced budget
     """
     try:
-        enhanced_budget = budget_enhancer.enhance_descriptions(budget_data)
+        enhanced_budget = await cancel_on_disconnect(
+            request, get_services()['budget_enhancer'].enhance_descriptions(budget_data)
+        )
         return enhanced_budget.model_dump()
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Enhancement failed: {str(e)}")
 
 
 @router.post("/validate-budget")
-async def validate_budget(budget_data: Budget):
+async def validate_budget(request: Request, budget_data: Budget, duplicates: bool = False):
     """
     Validate budget and get suggestions
 
     Args:
         budget_data: Budget object as JSON
+        duplicates: Also look for near-duplicate items, which takes seconds
+            on budgets of tens of thousands of items
 
     Returns:
-        Validation results with warnings and suggestions
+        Validation results with warnings and suggestions, and the AI usage
+        of the request
     """
     try:
-        validation_result = budget_enhancer.validate_budget(budget_data)
-        return validation_result
+        validation_result = await cancel_on_disconnect(
+            request, get_services()['budget_enhancer'].validate_budget(budget_data, duplicates)
+        )
+        return with_usage(validation_result)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Validation failed: {str(e)}")
 
 
+@router.get("/usage")
+async def ai_usage():
+    """
+    AI usage of this worker since it started
+
+    Returns:
+        Calls, tokens, latency, retries, estimated cost and cache hits by
+        route and in total
+    """
+    return get_usage_metrics().snapshot()
+
+
+@router.post("/duplicates")
+async def find_duplicates(budget_data: Budget, against_base: bool = False):
+    """
+    Find near-duplicate items in a budget, and optionally in the price base
+
+    Args:
+        budget_data: Budget object as JSON
+        against_base: Also match every item against the price base set in PRICE_BASE_PATH
+
+    Returns:
+        Groups of duplicate items and, if requested, the closest price base
+        entry for each item
+    """
+    if against_base and not os.getenv('PRICE_BASE_PATH'):
+        raise HTTPException(status_code=400, detail="No price base configured (PRICE_BASE_PATH)")
+
+    def run():
+        # Imported here since the index loads numpy, which the other routes do without
+        from ..validation.duplicates import DuplicateIndex, budget_entries
+        from ..validation.price_base import get_price_base_index
+        result = {
+            'groups': [asdict(group) for group in DuplicateIndex.from_budget(budget_data).find_duplicates()]
+        }
+        if against_base:
+            matches = get_price_base_index().query(budget_entries(budget_data))
+            result['base_matches'] = [asdict(match) for match in matches]
+        return result
+
+    try:
+        # Indexing is CPU-bound: keep it off the event loop
+        return await asyncio.to_thread(run)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Duplicate detection failed: {str(e)}")
+
+
 @router.post("/enhance-bc3")
-async def enhance_bc3_file(file: UploadFile = File(...)):
+async def enhance_bc3_file(request: Request, file: UploadFile = File(...)):
     """
     Enhance a BC3 file using AI
 
@@ -68,23 +132,71 @@ async def enhance_bc3_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="File must be a BC3 file")
 
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.bc3') as temp_bc3:
-            content = await file.read()
-            temp_bc3.write(content)
-            temp_bc3_path = temp_bc3.name
+        services = get_services()
+        key = ResultCache.make_key(
+            await upload_digest(file), 'enhance-bc3',
+            {'ai': services['budget_enhancer'].gateway.enabled},
+            f"{services['budget_enhancer'].MODEL}|{services['budget_enhancer'].PROMPT_VERSION}"
+        )
 
-        # Parse BC3
-        budget = bc3_parser.parse_file(temp_bc3_path)
+        # Parse BC3 straight from the spooled upload, which is gone once this request ends
+        budget = services['bc3_parser'].parse_stream(file.file)
 
-        # Enhance
-        enhanced_budget = budget_enhancer.enhance_descriptions(budget)
+        async def enhance() -> dict:
+            # Descriptions another process enhanced while this one waited come from the memo
+            return (await services['budget_enhancer'].enhance_descriptions(budget)).model_dump()
 
-        # Clean up temp file
-        os.unlink(temp_bc3_path)
+        # Identical requests arriving meanwhile wait for this enhancement instead of repeating it
+        enhanced_budget, _ = await cancel_on_disconnect(request, flights.do(key, enhance))
 
         # Return enhanced budget
-        return enhanced_budget.model_dump()
+        return enhanced_budget
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Enhancement failed: {str(e)}")
+
+
+@router.post("/enhance-budget/stream")
+async def enhance_budget_stream(budget_data: Budget):
+    """
+    Enhance budget descriptions using AI, streaming results as they arrive
+
+    Args:
+        budget_data: Budget object as JSON
+
+    Returns:
+        Server-sent events: 'items' with enhanced descriptions by item code,
+        'progress' per request, 'summary', and 'result' with the enhanced budget
+    """
+    async def events():
+        async for event in get_services()['budget_enhancer'].iter_enhancements(budget_data):
+            yield event
+        yield {'event': 'result', 'data': budget_data.model_dump()}
+
+    return event_stream(events())
+
+
+@router.post("/enhance-bc3/stream")
+async def enhance_bc3_file_stream(file: UploadFile = File(...)):
+    """
+    Enhance a BC3 file using AI, streaming results as they arrive
+
+    Args:
+        file: BC3 file to enhance
+
+    Returns:
+        Server-sent events, as for /ai/enhance-budget/stream
+    """
+    if not file.filename.endswith('.bc3'):
+        raise HTTPException(status_code=400, detail="File must be a BC3 file")
+
+    try:
+        # Parse BC3 before streaming so parse errors get a proper status
+        budget = get_services()['bc3_parser'].parse_stream(file.file)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Enhancement failed: {str(e)}")
+
+    return await enhance_budget_stream(budget)
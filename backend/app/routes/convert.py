@@ -1,85 +1,271 @@
 """
 Conversion routes for budget formats
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
-import tempfile
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, List, Literal, Optional, Union
+import asyncio
+import hashlib
+import io
+import logging
 import os
 from pathlib import Path
-from ..parsers.bc3_parser import BC3Parser
-from ..generators.bc3_generator import BC3Generator
-from ..generators.pdf_generator import PDFGenerator
-from ..ai.pdf_extractor import PDFExtractor
-from ..ai.budget_enhancer import BudgetEnhancer
+from ..ai.gateway import get_gateway
+from ..ai.usage import current_usage, record_cache_hits
+from ..ai.versions import (
+    ENHANCEMENT_MODEL, ENHANCEMENT_PROMPT_VERSION, EXTRACTION_MODEL, EXTRACTION_PROMPT_VERSION
+)
+from ..cache.result_cache import CachedResult, ResultCache
+from ..cache.single_flight import get_single_flight
+from ..metrics import record_cache_lookups, stage
 from ..models.budget import Budget
+from ..jobs import BatchError, expand_inputs, get_services, get_worker_pool, iter_batch_zip, submit_batch
+from .disconnect import cancel_on_disconnect
+from .sse import event_stream
+from .spool import attachment_headers, new_spool, spool_response, spool_upload, upload_digest
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/convert", tags=["convert"])
 
-# Initialize services
-bc3_parser = BC3Parser()
-bc3_generator = BC3Generator()
-pdf_generator = PDFGenerator()
-pdf_extractor = PDFExtractor()
-budget_enhancer = BudgetEnhancer()
+# Parsers, generators and AI services are loaded on first use by get_services
+result_cache = ResultCache()
+flights = get_single_flight()
+
+# Bump whenever parsing or generation changes so cached results are invalidated
+RESULT_VERSION = "1"
+
+
+def _extraction_headers(report: dict) -> dict:
+    """Response headers describing how a PDF was extracted"""
+    headers = {'X-Extraction-Source': report['source']}
+    if 'confidence' in report:
+        headers['X-Extraction-Confidence'] = f"{report['confidence']:.3f}"
+    return headers
+
+
+@dataclass
+class _Output:
+    """A conversion output kept in memory, when it could not be cached"""
+    content: bytes
+    media_type: str
+    filename: Optional[str] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+def _result_key(endpoint: str, content_hash: str, **options) -> str:
+    """Key identifying the output of a conversion, in the result cache and in flight"""
+    version = "|".join((
+        RESULT_VERSION, EXTRACTION_MODEL, EXTRACTION_PROMPT_VERSION, ENHANCEMENT_MODEL, ENHANCEMENT_PROMPT_VERSION
+    ))
+    # Outputs differ depending on whether AI is available at all
+    options['ai'] = get_gateway().enabled
+    return result_cache.make_key(content_hash, endpoint, options, version)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def _result_response(request: Request, result: CachedResult) -> Response:
+    """Send a cached output from its open file, or 304 if the client already has it"""
+    headers = {**result.headers, 'ETag': result.etag}
+    if _etag_matches(request.headers.get('if-none-match'), result.etag):
+        result.file.close()
+        return Response(status_code=304, headers=headers)
+    return spool_response(result.file, result.media_type, result.filename, headers)
+
+
+async def _output_response(request: Request, key: str, output: Union[CachedResult, _Output]) -> Optional[Response]:
+    """Send an output shared by coalesced requests, or None if it was evicted from the cache since"""
+    if isinstance(output, CachedResult):
+        # Every request opens the cached file for itself
+        result = await _lookup_result(key)
+        return _result_response(request, result) if result is not None else None
+    return Response(
+        output.content,
+        media_type=output.media_type,
+        headers={**(attachment_headers(output.filename) if output.filename else {}), **output.headers}
+    )
+
+
+async def _lookup_result(key: str) -> Optional[CachedResult]:
+    """Cached output of a conversion, if there is one"""
+    if not result_cache.enabled:
+        return None
+    try:
+        return await asyncio.to_thread(result_cache.get, key)
+    except Exception as e:
+        logger.warning("Result cache read failed: %s", e)
+        return None
 
 
-@router.post("/bc3-to-pdf")
-async def bc3_to_pdf(file: UploadFile = File(...), enhance: bool = False):
+async def _cached_result(request: Request, key: str) -> Optional[Response]:
+    """Response with the cached output of a conversion, if there is one"""
+    result = await _lookup_result(key)
+    if result_cache.enabled:
+        record_cache_lookups('conversion_result', hits=int(result is not None), misses=int(result is None))
+    if result is None:
+        return None
+    record_cache_hits('conversion_result')
+    return _result_response(request, result)
+
+
+async def _store_result(key: str, output: BinaryIO, media_type: str, filename: Optional[str] = None,
+                        headers: Optional[dict] = None) -> Optional[CachedResult]:
     """
-    Convert BC3 file to PDF
+    Cache the output of a conversion
 
     Args:
-        file: BC3 file to convert
-        enhance: Whether to enhance descriptions with AI
+        key: Result cache key
+        output: Buffer holding the output, left open
+        media_type: Content type
+        filename: File name offered for download (if None, sent inline)
+        headers: Extra response headers, cached with the output
 
     Returns:
-        PDF file
+        The cached output, or None if it was not cached
     """
-    if not file.filename.endswith('.bc3'):
-        raise HTTPException(status_code=400, detail="File must be a BC3 file")
+    usage = current_usage()
+    # Outputs degraded by failed AI calls are not cached
+    if not result_cache.enabled or (usage is not None and usage.failed_calls):
+        return None
+    try:
+        result = await asyncio.to_thread(result_cache.put, key, output, media_type, filename, headers)
+    except Exception as e:
+        logger.warning("Result cache write failed: %s", e)
+        return None
+    return result
+
 
+async def _send_result(request: Request, key: str, output: BinaryIO, media_type: str,
+                       filename: Optional[str] = None, headers: Optional[dict] = None) -> Response:
+    """
+    Cache the output of a conversion and send it
+
+    Args:
+        request: Request being served
+        key: Result cache key
+        output: Buffer holding the output; the response takes ownership
+        media_type: Content type
+        filename: File name offered for download (if None, sent inline)
+        headers: Extra response headers, cached with the output
+
+    Returns:
+        Response with an ETag when cached
+    """
+    result = await _store_result(key, output, media_type, filename, headers)
+    if result is not None:
+        # Sent from the buffer rather than the cache, which may evict it at any time
+        headers = {**(headers or {}), 'ETag': result.etag}
+    return spool_response(output, media_type, filename, headers)
+
+
+async def _share_result(key: str, output: BinaryIO, media_type: str,
+                        filename: Optional[str] = None) -> Union[CachedResult, _Output]:
+    """Cache an output for the requests coalesced on it, or keep it in memory if it cannot be cached"""
+    result = await _store_result(key, output, media_type, filename)
+    if result is not None:
+        output.close()
+        return result
+    with output:
+        output.seek(0)
+        return _Output(output.read(), media_type, filename)
+
+
+def _pdf_output(budget: Budget) -> BinaryIO:
+    """PDF of a budget, generated into a buffer"""
+    pdf = new_spool()
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.bc3') as temp_bc3:
-            content = await file.read()
-            temp_bc3.write(content)
-            temp_bc3_path = temp_bc3.name
+        get_services()['pdf_generator'].generate_file(budget, pdf)
+    except Exception:
+        pdf.close()
+        raise
+    return pdf
 
-        # Parse BC3
-        budget = bc3_parser.parse_file(temp_bc3_path)
 
-        # Enhance if requested
-        if enhance:
-            budget = budget_enhancer.enhance_descriptions(budget)
+def _json_output(budget: Budget) -> BinaryIO:
+    """Budget serialized as the JSON routes return"""
+    with stage('serialize'):
+        return io.BytesIO(JSONResponse(jsonable_encoder(budget.model_dump())).body)
 
-        # Generate PDF
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_pdf:
-            temp_pdf_path = temp_pdf.name
 
-        pdf_generator.generate_file(budget, temp_pdf_path)
+@router.post("/bc3-to-pdf")
+async def bc3_to_pdf(request: Request, file: UploadFile = File(...), enhance: bool = False):
+    """
+    Convert BC3 file to PDF
 
-        # Clean up BC3 temp file
-        os.unlink(temp_bc3_path)
+    Args:
+        file: BC3 file to convert
+        enhance: Whether to enhance descriptions with AI
 
-        # Return PDF file
-        return FileResponse(
-            temp_pdf_path,
-            media_type='application/pdf',
-            filename=f"{Path(file.filename).stem}.pdf"
-        )
+    Returns:
+        PDF file
+    """
+    if not file.filename.endswith('.bc3'):
+        raise HTTPException(status_code=400, detail="File must be a BC3 file")
 
+    try:
+        # Serve a previous conversion of the same file
+        key = _result_key('bc3-to-pdf', await upload_digest(file), enhance=enhance)
+        cached = await _cached_result(request, key)
+        if cached is not None:
+            return cached
+
+        # Parse BC3 straight from the spooled upload, which is gone once this request ends
+        budget = get_services()['bc3_parser'].parse_stream(file.file)
+        filename = f"{Path(file.filename).stem}.pdf"
+
+        enhanced = None
+
+        async def render() -> BinaryIO:
+            # Enhance if requested, once even if rendered again
+            nonlocal enhanced
+            if enhanced is None:
+                enhanced = await get_services()['budget_enhancer'].enhance_descriptions(budget) if enhance else budget
+
+            # Generate PDF
+            return _pdf_output(enhanced)
+
+        async def convert() -> Union[CachedResult, _Output]:
+            # Another process may have converted the same file while this one waited
+            result = await _lookup_result(key)
+            if result is not None:
+                result.file.close()
+                return result
+            return await _share_result(key, await render(), 'application/pdf', filename)
+
+        # Identical requests arriving meanwhile wait for this conversion instead of repeating it
+        output, _ = await cancel_on_disconnect(request, flights.do(key, convert))
+        response = await _output_response(request, key, output)
+        if response is None:
+            # Evicted before this request could open it: render again for this request alone
+            pdf = await cancel_on_disconnect(request, render())
+            response = await _send_result(request, key, pdf, 'application/pdf', filename)
+        return response
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
 @router.post("/pdf-to-bc3")
-async def pdf_to_bc3(file: UploadFile = File(...), use_ai: bool = True):
+async def pdf_to_bc3(request: Request, file: UploadFile = File(...), use_ai: bool = True,
+                     cache: Literal['use', 'refresh'] = 'use'):
     """
     Convert PDF file to BC3
 
     Args:
         file: PDF file to convert
         use_ai: Whether to use AI for extraction (recommended)
+        cache: 'refresh' to ignore a cached extraction of the same PDF
 
     Returns:
         BC3 file
@@ -88,37 +274,32 @@ async def pdf_to_bc3(file: UploadFile = File(...), use_ai: bool = True):
         raise HTTPException(status_code=400, detail="File must be a PDF file")
 
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_pdf:
-            content = await file.read()
-            temp_pdf.write(content)
-            temp_pdf_path = temp_pdf.name
-
-        # Extract budget from PDF
-        budget = pdf_extractor.extract_from_file(temp_pdf_path)
+        # Serve a previous conversion of the same file, unless asked to extract again
+        key = _result_key('pdf-to-bc3', await upload_digest(file), use_ai=use_ai)
+        cached = await _cached_result(request, key) if cache == 'use' else None
+        if cached is not None:
+            return cached
+
+        # Extract budget from the spooled upload
+        budget, report = await cancel_on_disconnect(request, get_services()['pdf_extractor'].extract_with_report(
+            file.file,
+            use_ai=use_ai,
+            refresh_cache=cache == 'refresh'
+        ))
 
         # Generate BC3
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.bc3') as temp_bc3:
-            temp_bc3_path = temp_bc3.name
-
-        bc3_generator.generate_file(budget, temp_bc3_path)
-
-        # Clean up PDF temp file
-        os.unlink(temp_pdf_path)
-
-        # Return BC3 file
-        return FileResponse(
-            temp_bc3_path,
-            media_type='application/octet-stream',
-            filename=f"{Path(file.filename).stem}.bc3"
-        )
+        return await _send_result(request, key, io.BytesIO(get_services()['bc3_generator'].generate_bytes(budget)),
+                                  'application/octet-stream', f"{Path(file.filename).stem}.bc3",
+                                  _extraction_headers(report))
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
 @router.post("/bc3-to-json")
-async def bc3_to_json(file: UploadFile = File(...)):
+async def bc3_to_json(request: Request, file: UploadFile = File(...)):
     """
     Convert BC3 file to JSON
 
@@ -132,32 +313,32 @@ async def bc3_to_json(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="File must be a BC3 file")
 
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.bc3') as temp_bc3:
-            content = await file.read()
-            temp_bc3.write(content)
-            temp_bc3_path = temp_bc3.name
-
-        # Parse BC3
-        budget = bc3_parser.parse_file(temp_bc3_path)
+        # Serve a previous conversion of the same file
+        key = _result_key('bc3-to-json', await upload_digest(file))
+        cached = await _cached_result(request, key)
+        if cached is not None:
+            return cached
 
-        # Clean up temp file
-        os.unlink(temp_bc3_path)
+        # Parse BC3 straight from the spooled upload
+        budget = get_services()['bc3_parser'].parse_stream(file.file)
 
         # Return JSON
-        return budget.model_dump()
+        return await _send_result(request, key, _json_output(budget), 'application/json')
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Parsing failed: {str(e)}")
 
 
 @router.post("/pdf-to-json")
-async def pdf_to_json(file: UploadFile = File(...)):
+async def pdf_to_json(request: Request, file: UploadFile = File(...),
+                      use_ai: bool = True, cache: Literal['use', 'refresh'] = 'use'):
     """
     Convert PDF file to JSON
 
     Args:
         file: PDF file to convert
+        use_ai: Whether to use AI for extraction (recommended)
+        cache: 'refresh' to ignore a cached extraction of the same PDF
 
     Returns:
         JSON budget data
@@ -166,27 +347,72 @@ async def pdf_to_json(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="File must be a PDF file")
 
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_pdf:
-            content = await file.read()
-            temp_pdf.write(content)
-            temp_pdf_path = temp_pdf.name
-
-        # Extract budget from PDF
-        budget = pdf_extractor.extract_from_file(temp_pdf_path)
-
-        # Clean up temp file
-        os.unlink(temp_pdf_path)
+        # Serve a previous conversion of the same file, unless asked to extract again
+        key = _result_key('pdf-to-json', await upload_digest(file), use_ai=use_ai)
+        cached = await _cached_result(request, key) if cache == 'use' else None
+        if cached is not None:
+            return cached
+
+        # Extract budget from the spooled upload
+        budget, report = await cancel_on_disconnect(request, get_services()['pdf_extractor'].extract_with_report(
+            file.file,
+            use_ai=use_ai,
+            refresh_cache=cache == 'refresh'
+        ))
 
         # Return JSON
-        return budget.model_dump()
+        return await _send_result(request, key, _json_output(budget), 'application/json',
+                                  headers=_extraction_headers(report))
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Extraction failed: {str(e)}")
 
 
+@router.post("/pdf-to-json/stream")
+async def pdf_to_json_stream(file: UploadFile = File(...), use_ai: bool = True,
+                             cache: Literal['use', 'refresh'] = 'use'):
+    """
+    Convert PDF file to JSON, streaming chapters as pages are read
+
+    Args:
+        file: PDF file to convert
+        use_ai: Whether to use AI for extraction (recommended)
+        cache: 'refresh' to ignore a cached extraction of the same PDF
+
+    Returns:
+        Server-sent events: 'pages' with the chapters read from some pages,
+        'progress', and 'result' with the budget and extraction report
+    """
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="File must be a PDF file")
+
+    # The upload is closed when this function returns, before the stream is read
+    pdf = await spool_upload(file)
+
+    async def events():
+        try:
+            async for event in get_services()['pdf_extractor'].iter_extraction(
+                pdf,
+                use_ai=use_ai,
+                refresh_cache=cache == 'refresh'
+            ):
+                if event['event'] == 'result':
+                    event = {'event': 'result', 'data': {
+                        'budget': event['data']['budget'].model_dump(),
+                        'report': event['data']['report']
+                    }}
+                yield event
+        finally:
+            # Release the buffer, also when the client goes away mid-stream
+            pdf.close()
+
+    return event_stream(events())
+
+
 @router.post("/json-to-bc3")
-async def json_to_bc3(budget_data: Budget):
+async def json_to_bc3(request: Request, budget_data: Budget):
     """
     Convert JSON budget data to BC3 file
 
@@ -197,25 +423,22 @@ async def json_to_bc3(budget_data: Budget):
         BC3 file
     """
     try:
-        # Generate BC3
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.bc3') as temp_bc3:
-            temp_bc3_path = temp_bc3.name
+        # Serve a previous conversion of the same body
+        key = _result_key('json-to-bc3', hashlib.sha256(await request.body()).hexdigest())
+        cached = await _cached_result(request, key)
+        if cached is not None:
+            return cached
 
-        bc3_generator.generate_file(budget_data, temp_bc3_path)
-
-        # Return BC3 file
-        return FileResponse(
-            temp_bc3_path,
-            media_type='application/octet-stream',
-            filename="presupuesto.bc3"
-        )
+        # Generate BC3
+        return await _send_result(request, key, io.BytesIO(get_services()['bc3_generator'].generate_bytes(budget_data)),
+                                  'application/octet-stream', "presupuesto.bc3")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
 
 @router.post("/json-to-pdf")
-async def json_to_pdf(budget_data: Budget):
+async def json_to_pdf(request: Request, budget_data: Budget):
     """
     Convert JSON budget data to PDF file
 
@@ -226,18 +449,58 @@ async def json_to_pdf(budget_data: Budget):
         PDF file
     """
     try:
+        # Serve a previous conversion of the same body
+        key = _result_key('json-to-pdf', hashlib.sha256(await request.body()).hexdigest())
+        cached = await _cached_result(request, key)
+        if cached is not None:
+            return cached
+
         # Generate PDF
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_pdf:
-            temp_pdf_path = temp_pdf.name
+        return await _send_result(request, key, _pdf_output(budget_data), 'application/pdf', "presupuesto.pdf")
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
-        pdf_generator.generate_file(budget_data, temp_pdf_path)
 
-        # Return PDF file
-        return FileResponse(
-            temp_pdf_path,
-            media_type='application/pdf',
-            filename="presupuesto.pdf"
-        )
+@router.post("/batch")
+async def convert_batch(target: Literal['pdf', 'bc3', 'json'], files: List[UploadFile] = File(...),
+                        use_ai: bool = True, enhance: bool = False,
+                        cache: Literal['use', 'refresh'] = 'use'):
+    """
+    Convert many files at once on the job workers
 
+    Args:
+        target: Output format
+        files: Files to convert (.bc3, .pdf or budget .json), or ZIP archives of them
+        use_ai: Whether to use AI for PDF extraction
+        enhance: Whether to enhance descriptions with AI
+        cache: 'refresh' to ignore cached extractions of the same PDFs
+
+    Returns:
+        ZIP archive streamed as conversions finish, with the outputs under
+        the input paths and a manifest.json giving the status of every file
+    """
+    try:
+        # Uploads stay spooled (on disk past a size); each file is read when its job is queued
+        uploads = [(file.filename, file.file) for file in files]
+        inputs = await asyncio.to_thread(expand_inputs, uploads)
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not inputs:
+        raise HTTPException(status_code=400, detail="No files to convert")
+
+    store = get_worker_pool().store
+    try:
+        entries = await asyncio.to_thread(
+            submit_batch, store, inputs, target,
+            {'use_ai': use_ai, 'enhance': enhance, 'cache': cache},
+            float(os.getenv('JOB_TIMEOUT', 900))
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch submission failed: {str(e)}")
+
+    return StreamingResponse(
+        iter_batch_zip(store, entries),
+        media_type='application/zip',
+        headers=attachment_headers(f"presupuestos-{target}.zip")
+    )
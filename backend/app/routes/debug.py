@@ -0,0 +1,167 @@
+"""
+Debug routes and per-request profiling for administrators
+"""
+import asyncio
+import hmac
+import logging
+import os
+import time
+from typing import Optional
+from urllib.parse import parse_qs
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+from ..metrics.profiling import PROFILE_MODES, ProfileStore, RequestProfiler
+from ..metrics.tracing import span, start_trace
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+profile_store = ProfileStore()
+
+
+def _admin_token() -> Optional[str]:
+    """Token administrators send in X-Admin-Token (ADMIN_TOKEN from env); unset disables debugging"""
+    return os.getenv('ADMIN_TOKEN') or None
+
+
+def _is_admin(token: Optional[str]) -> bool:
+    """Whether a token, as read from a header (decoded as latin-1), is the admin token"""
+    expected = _admin_token()
+    if expected is None or token is None:
+        return False
+    # compare_digest rejects non-ASCII strings: compare the bytes sent with the token's UTF-8 bytes
+    return hmac.compare_digest(token.encode('latin-1'), expected.encode('utf-8'))
+
+
+async def require_admin(request: Request):
+    """Hide the debug routes unless enabled, and reject callers without the admin token"""
+    if _admin_token() is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _is_admin(request.headers.get('x-admin-token')):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """
+    List the kept profiles
+
+    Returns:
+        Id, request, status and duration of each profile, newest first
+    """
+    return {'profiles': await asyncio.to_thread(profile_store.list)}
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str):
+    """
+    Get a profiled request
+
+    Args:
+        profile_id: Id sent back in the X-Profile-Id header
+
+    Returns:
+        Request details, timing spans of the pipeline stages, peak memory and
+        top allocations, and the functions that took the most time
+    """
+    summary = await asyncio.to_thread(profile_store.get, profile_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return summary
+
+
+@router.get("/profiles/{profile_id}/artifact", dependencies=[Depends(require_admin)])
+async def get_profile_artifact(profile_id: str):
+    """
+    Download a profile's profiler output
+
+    Args:
+        profile_id: Profile id
+
+    Returns:
+        cProfile stats (.pstats, readable with pstats or snakeviz) or collapsed
+        stacks (.collapsed, readable with flame graph tools such as speedscope)
+    """
+    path = profile_store.artifact(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type='application/octet-stream',
+                        filename=f"{profile_id}-{os.path.basename(path)}")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests an administrator asks for
+
+    A request is profiled when it carries the admin token in X-Admin-Token
+    and asks for a mode in the X-Profile header or the profile query
+    parameter ('sampling', or 'cprofile' for any other value). Its profile
+    id is returned in X-Profile-Id.
+    """
+
+    def __init__(self, app, store: Optional[ProfileStore] = None):
+        self.app = app
+        self.store = store or profile_store
+
+    async def __call__(self, scope, receive, send):
+        mode = _requested_mode(scope) if scope['type'] == 'http' else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = RequestProfiler(mode)
+        if not profiler.start():
+            await self.app(scope, receive, _with_header(send, b'x-profile-error',
+                                                        b'another request is being profiled'))
+            return
+
+        profile_id = ProfileStore.new_id()
+        status = 500
+        started = time.perf_counter()
+
+        async def send_tracked(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            with start_trace() as trace:
+                with span('request'):
+                    await self.app(scope, receive, _with_header(send_tracked, b'x-profile-id', profile_id.encode()))
+        finally:
+            summary, used = profiler.stop()
+            matched = scope.get('route')
+            summary.update({
+                'method': scope['method'],
+                'path': scope['path'],
+                'route': matched.path if matched is not None else None,
+                'status': status,
+                'duration': round(time.perf_counter() - started, 6),
+                'spans': trace.to_list(),
+            })
+            try:
+                await asyncio.to_thread(self.store.save, profile_id, summary, used)
+            except Exception as e:
+                logger.warning("Saving profile %s failed: %s", profile_id, e)
+
+
+def _requested_mode(scope) -> Optional[str]:
+    """Profiler mode an administrator asked for, or None"""
+    headers = dict(scope['headers'])
+    requested = headers.get(b'x-profile', b'').decode('latin-1')
+    if not requested:
+        requested = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('profile', [''])[0]
+    if not requested or not _is_admin(headers.get(b'x-admin-token', b'').decode('latin-1') or None):
+        return None
+    return requested if requested in PROFILE_MODES else 'cprofile'
+
+
+def _with_header(send, name: bytes, value: bytes):
+    """Wrap send to add a header to the response"""
+    async def wrapped(message):
+        if message['type'] == 'http.response.start':
+            message = {**message, 'headers': [*message.get('headers', []), (name, value)]}
+        await send(message)
+    return wrapped
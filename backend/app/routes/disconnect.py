@@ -0,0 +1,37 @@
+"""
+Client disconnect handling for long-running routes
+"""
+import asyncio
+from typing import Awaitable, TypeVar
+from fastapi import HTTPException, Request
+
+T = TypeVar('T')
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T],
+                               poll_interval: float = 0.5) -> T:
+    """
+    Await a result, cancelling the work if the client disconnects first
+
+    Cancellation propagates into in-flight AI calls, so abandoned requests
+    stop consuming tokens and gateway slots.
+
+    Args:
+        request: Incoming request whose connection is watched
+        awaitable: Work to run
+        poll_interval: Seconds between disconnect checks
+
+    Returns:
+        The awaitable's result
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
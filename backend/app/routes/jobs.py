@@ -0,0 +1,121 @@
+"""
+Conversion job routes
+"""
+import asyncio
+import os
+from fastapi import APIRouter, UploadFile, File, HTTPException, Response
+from typing import Literal, Optional
+from ..jobs import CANCELLED, CONVERSIONS, FINAL_STATES, SUCCEEDED, get_worker_pool
+from .spool import attachment_headers
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+ConversionName = Literal['bc3-to-pdf', 'bc3-to-json', 'pdf-to-bc3', 'pdf-to-json', 'json-to-bc3', 'json-to-pdf']
+
+
+def _status(job: dict) -> dict:
+    """Job status in the API response format"""
+    if job['status'] == SUCCEEDED:
+        job['result_url'] = f"/jobs/{job['id']}/result"
+    return job
+
+
+@router.post("", status_code=202)
+async def submit_job(response: Response, conversion: ConversionName, file: UploadFile = File(...),
+                     use_ai: bool = True, enhance: bool = False,
+                     cache: Literal['use', 'refresh'] = 'use', timeout: Optional[float] = None):
+    """
+    Queue a conversion to run in a worker process
+
+    Args:
+        conversion: Conversion to run, as the /convert route of the same name
+        file: File to convert (.bc3, .pdf or budget .json)
+        use_ai: Whether to use AI for PDF extraction
+        enhance: Whether to enhance descriptions with AI
+        cache: 'refresh' to ignore a cached extraction of the same PDF
+        timeout: Seconds the conversion may run, at most JOB_TIMEOUT
+
+    Returns:
+        Job status, with a Location header pointing to it
+    """
+    spec = CONVERSIONS[conversion]
+    if not file.filename.endswith(spec.extension):
+        raise HTTPException(status_code=400, detail=f"File must be a {spec.source.upper()} file")
+
+    max_timeout = float(os.getenv('JOB_TIMEOUT', 900))
+    if timeout is not None and timeout <= 0:
+        raise HTTPException(status_code=400, detail="Timeout must be positive")
+
+    store = get_worker_pool().store
+    try:
+        data = await file.read()
+        job_id = await asyncio.to_thread(
+            store.submit, conversion, file.filename, data,
+            {'use_ai': use_ai, 'enhance': enhance, 'cache': cache},
+            min(timeout or max_timeout, max_timeout)
+        )
+        job = await asyncio.to_thread(store.get, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Job submission failed: {str(e)}")
+
+    response.headers['Location'] = f"/jobs/{job_id}"
+    return _status(job)
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status and progress of a job
+
+    Args:
+        job_id: Job id
+
+    Returns:
+        Job status: 'queued', 'running', 'succeeded', 'failed' or 'cancelled'
+    """
+    job = await asyncio.to_thread(get_worker_pool().store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return _status(job)
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Output of a succeeded job
+
+    Args:
+        job_id: Job id
+
+    Returns:
+        Converted file
+    """
+    store = get_worker_pool().store
+    result = await asyncio.to_thread(store.result, job_id)
+    if result is None:
+        job = await asyncio.to_thread(store.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found or expired")
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, no result available")
+
+    return Response(result.content, media_type=result.media_type, headers=attachment_headers(result.filename))
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancel a job; a running one stops at its next heartbeat
+
+    Args:
+        job_id: Job id
+
+    Returns:
+        Job status
+    """
+    store = get_worker_pool().store
+    status = await asyncio.to_thread(store.cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if status in FINAL_STATES and status != CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Job already {status}")
+    return _status(await asyncio.to_thread(store.get, job_id))
@@ -0,0 +1,154 @@
+"""
+Metrics routes and request instrumentation
+"""
+import asyncio
+import time
+from fastapi import APIRouter, Response
+from ..ai.usage import get_usage_metrics
+from ..cache.single_flight import get_single_flight
+from ..jobs import get_worker_pool
+from ..metrics import get_registry, observe_stage, track_route
+from ..metrics.pipeline import REQUEST_BYTES, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, RESPONSE_BYTES
+from .admission import AdmissionController
+
+router = APIRouter(tags=["metrics"])
+
+# Route label of requests no route matched, so unknown paths don't grow the label set
+UNMATCHED_ROUTE = 'unmatched'
+
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Metrics of this worker in the Prometheus text format
+
+    Returns:
+        Request, pipeline stage, cache, admission, job queue and AI usage metrics
+    """
+    # Collection reads the job store
+    text = await asyncio.to_thread(get_registry().render)
+    return Response(text, media_type="text/plain; version=0.0.4")
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing requests and measuring their bodies"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        def route() -> str:
+            # Label by route template, e.g. /jobs/{job_id}, once routing has matched
+            matched = scope.get('route')
+            return matched.path if matched is not None else UNMATCHED_ROUTE
+
+        started = time.perf_counter()
+        upload_started = upload_seconds = None
+        received = sent = 0
+        status = 500
+
+        async def receive_counted():
+            nonlocal upload_started, upload_seconds, received
+            if upload_started is None:
+                upload_started = time.perf_counter()
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if not message.get('more_body') and upload_seconds is None:
+                    upload_seconds = time.perf_counter() - upload_started
+            return message
+
+        async def send_counted(message):
+            nonlocal status, sent
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            with track_route(route):
+                await self.app(scope, receive_counted, send_counted)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            label = route()
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route=label,
+                                    method=scope['method'], status=str(status))
+            RESPONSE_BYTES.observe(sent, route=label)
+            if received:
+                REQUEST_BYTES.observe(received, route=label)
+                if upload_seconds is not None:
+                    with track_route(lambda: label):
+                        observe_stage('upload', upload_seconds)
+
+
+def register_collectors(admission: AdmissionController):
+    """
+    Expose the state of the job queue, admission control, request coalescing and AI usage
+
+    Args:
+        admission: Admission controller of the app
+    """
+    registry = get_registry()
+
+    registry.gauge(
+        'budget_jobs', "Jobs by status; queued is the queue depth", ('status',),
+        collect=lambda: {(status,): count for status, count in get_worker_pool().store.counts().items()}
+    )
+    registry.gauge(
+        'budget_job_workers', "Job worker processes running",
+        collect=lambda: {(): get_worker_pool().alive()}
+    )
+
+    registry.gauge(
+        'budget_admission_running', "Requests admitted and running, by endpoint group", ('group',),
+        collect=lambda: {(name,): stats['running'] for name, stats in admission.stats().items()}
+    )
+    registry.gauge(
+        'budget_admission_waiting', "Requests waiting for a turn, by endpoint group", ('group',),
+        collect=lambda: {(name,): stats['waiting'] for name, stats in admission.stats().items()}
+    )
+    registry.gauge(
+        'budget_admission_memory_bytes', "Estimated memory of the admitted requests",
+        collect=lambda: {(): admission.memory_used}
+    )
+    registry.counter(
+        'budget_admission_rejected', "Requests turned away, by endpoint group and status", ('group', 'status'),
+        collect=lambda: {
+            (name, str(status)): count
+            for name, stats in admission.stats().items()
+            for status, count in stats['rejected'].items()
+        }
+    )
+
+    flights = get_single_flight()
+    registry.gauge(
+        'budget_single_flight_in_flight', "Coalesced runs in flight",
+        collect=lambda: {(): flights.in_flight}
+    )
+    registry.counter(
+        'budget_single_flight_calls', "Calls that started a run or joined one in flight", ('outcome',),
+        collect=lambda: {('started',): flights.started, ('joined',): flights.joined}
+    )
+
+    def usage(field: str):
+        return lambda: {
+            (route,): values[field] for route, values in get_usage_metrics().snapshot()['routes'].items()
+        }
+
+    registry.counter('budget_ai_calls', "AI calls, by route", ('route',), collect=usage('calls'))
+    registry.counter('budget_ai_failed_calls', "AI calls without a result, by route", ('route',),
+                     collect=usage('failed_calls'))
+    registry.counter('budget_ai_retries', "AI call retries, by route", ('route',), collect=usage('retries'))
+    registry.counter('budget_ai_input_tokens', "AI prompt tokens, by route", ('route',),
+                     collect=usage('input_tokens'))
+    registry.counter('budget_ai_output_tokens', "AI completion tokens, by route", ('route',),
+                     collect=usage('output_tokens'))
+    registry.counter('budget_ai_cost_usd', "Estimated AI cost, by route", ('route',), collect=usage('cost'))
+    registry.counter('budget_ai_latency_seconds', "Time spent in AI calls, by route", ('route',),
+                     collect=usage('latency'))
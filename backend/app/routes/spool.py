@@ -0,0 +1,180 @@
+"""
+Spooled files for uploads and generated documents
+Buffers stay in memory up to a size threshold; larger ones spill to disk and are removed when closed
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Dict, Iterator, Optional
+from urllib.parse import quote
+from fastapi import UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette import formparsers
+
+logger = logging.getLogger(__name__)
+
+# Name prefix of spilled files, so the sweeper only removes ours
+SPOOL_PREFIX = 'spool-'
+
+CHUNK_SIZE = 64 * 1024
+
+
+def spool_dir() -> str:
+    """Directory disk spills go to (SPOOL_DIR from env, or a folder in the system temp dir)"""
+    return os.getenv('SPOOL_DIR') or os.path.join(tempfile.gettempdir(), 'budget-spool')
+
+
+def spool_max_bytes() -> int:
+    """Bytes a buffer holds in memory before spilling to disk (SPOOL_MAX_BYTES from env)"""
+    return int(os.getenv('SPOOL_MAX_BYTES', 8 * 1024 * 1024))
+
+
+def configure_uploads():
+    """
+    Spool multipart uploads like any other buffer: same threshold and spill directory
+
+    Uploads are buffered by the framework before a route runs, and closed
+    (removing any disk spill) once the route returns.
+    """
+    formparsers.SpooledTemporaryFile = _upload_spool
+
+
+def _upload_spool(max_size: int = 0, **kwargs) -> SpooledTemporaryFile:
+    """Buffer for a multipart upload, created by the framework in place of its own"""
+    return new_spool()
+
+
+def new_spool() -> SpooledTemporaryFile:
+    """Empty buffer that spills to the spool directory past the threshold"""
+    directory = spool_dir()
+    os.makedirs(directory, exist_ok=True)
+    return SpooledTemporaryFile(max_size=spool_max_bytes(), prefix=SPOOL_PREFIX, dir=directory)
+
+
+async def spool_upload(file: UploadFile) -> SpooledTemporaryFile:
+    """
+    Copy an upload into a buffer the caller owns
+
+    Needed when the upload is read after the route returns, e.g. by a
+    streamed response, since the framework closes uploads before that.
+
+    Args:
+        file: Uploaded file
+
+    Returns:
+        Buffer positioned at the start; the caller must close it
+    """
+    spool = new_spool()
+    try:
+        await file.seek(0)
+        while chunk := await file.read(CHUNK_SIZE):
+            spool.write(chunk)
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+
+async def upload_digest(file: UploadFile) -> str:
+    """SHA-256 hex digest of an upload, leaving it rewound for parsing"""
+    def digest() -> str:
+        sha = hashlib.sha256()
+        file.file.seek(0)
+        while chunk := file.file.read(CHUNK_SIZE):
+            sha.update(chunk)
+        file.file.seek(0)
+        return sha.hexdigest()
+
+    return await asyncio.to_thread(digest)
+
+
+def attachment_headers(filename: str) -> Dict[str, str]:
+    """Content-Disposition header offering a download under a file name"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return {'Content-Disposition': f"attachment; filename*=utf-8''{quoted}"}
+    return {'Content-Disposition': f'attachment; filename="{filename}"'}
+
+
+def spool_response(spool: BinaryIO, media_type: str, filename: Optional[str] = None,
+                   headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """
+    Stream a generated document to the client, closing its buffer afterwards
+
+    Args:
+        spool: Buffer holding the document; the response takes ownership
+        media_type: Content type
+        filename: File name offered for download (if None, sent inline)
+        headers: Extra response headers
+
+    Returns:
+        Response that closes the buffer (removing any disk spill) once sent
+    """
+    size = spool.seek(0, os.SEEK_END)
+    spool.seek(0)
+
+    def chunks() -> Iterator[bytes]:
+        while chunk := spool.read(CHUNK_SIZE):
+            yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type=media_type,
+        headers={
+            **(attachment_headers(filename) if filename else {}),
+            'Content-Length': str(size),
+            **(headers or {})
+        },
+        background=BackgroundTask(spool.close)
+    )
+
+
+def sweep_spool_dir(max_age: Optional[float] = None) -> int:
+    """
+    Remove disk spills left behind by workers that died mid-request
+
+    Args:
+        max_age: Seconds since last modification after which a spill is an
+            orphan (if None, reads SPOOL_ORPHAN_AGE from env)
+
+    Returns:
+        Number of files removed
+    """
+    if max_age is None:
+        max_age = float(os.getenv('SPOOL_ORPHAN_AGE', 3600))
+    directory = spool_dir()
+    if not os.path.isdir(directory):
+        return 0
+
+    removed = 0
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        if not entry.name.startswith(SPOOL_PREFIX) or not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except OSError as e:
+            logger.warning("Spool sweep failed for %s: %s", entry.path, e)
+    return removed
+
+
+async def sweep_periodically(interval: Optional[float] = None):
+    """
+    Sweep the spool directory every interval seconds until cancelled
+
+    Args:
+        interval: Seconds between sweeps (if None, reads SPOOL_SWEEP_INTERVAL from env)
+    """
+    if interval is None:
+        interval = float(os.getenv('SPOOL_SWEEP_INTERVAL', 600))
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(sweep_spool_dir)
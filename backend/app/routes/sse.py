@@ -0,0 +1,65 @@
+"""
+Server-sent events for long-running routes
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Dict
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from ..ai.usage import current_usage
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: str, data: Any) -> str:
+    """
+    Serialize one server-sent event
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload
+
+    Returns:
+        Event frame ready to be written to the stream
+    """
+    payload = json.dumps(jsonable_encoder(data), ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def event_stream(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """
+    Stream events of the form {'event': name, 'data': payload} to the client
+
+    Errors raised while streaming are sent as a final 'error' event, since
+    the response status has already been sent. The AI usage of the request
+    follows as a 'usage' event, in place of the X-AI-Usage header, which
+    would be sent before any of it is known. If the client disconnects the
+    generator is closed, which cancels any work still in flight.
+
+    Args:
+        events: Async iterator of events
+
+    Returns:
+        text/event-stream response
+    """
+    async def stream():
+        try:
+            async for event in events:
+                yield format_event(event['event'], event['data'])
+        except Exception as e:
+            logger.exception("Event stream failed")
+            yield format_event('error', {'detail': str(e)})
+
+        usage = current_usage()
+        if usage is not None:
+            yield format_event('usage', usage.to_dict())
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            'Cache-Control': 'no-cache',
+            # Keep reverse proxies from buffering the stream
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -0,0 +1,138 @@
+"""
+Tests for admission control
+"""
+import asyncio
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from .admission import AdmissionController, AdmissionLimit, AdmissionMiddleware, Overloaded
+
+LIMIT = AdmissionLimit('conversion', ('/convert/',), max_body_bytes=100, max_concurrent=1, max_queued=1)
+
+
+def controller(limit=LIMIT, memory_bytes=0, queue_timeout=5):
+    return AdmissionController([limit], memory_bytes=memory_bytes, queue_timeout=queue_timeout)
+
+
+def test_requests_queue_for_a_turn_until_the_queue_is_full():
+    admission = controller()
+    [group] = admission.groups
+
+    async def run():
+        await admission.acquire(group, 0)
+        waiting = asyncio.create_task(admission.acquire(group, 0))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as rejected:
+            await admission.acquire(group, 0)
+        await admission.release(group, 0, 2.0)
+        await waiting
+        return rejected.value
+
+    rejected = asyncio.run(run())
+
+    assert (rejected.status_code, rejected.retry_after) == (429, 1)
+    assert admission.stats()['conversion'] == {'running': 1, 'waiting': 0, 'admitted': 2, 'rejected': {429: 1}}
+
+
+def test_requests_waiting_too_long_are_turned_away():
+    admission = controller(queue_timeout=0.01)
+    [group] = admission.groups
+
+    async def run():
+        await admission.acquire(group, 0)
+        await admission.release(group, 0, 4.0)
+        await admission.acquire(group, 0)
+        with pytest.raises(Overloaded) as rejected:
+            await admission.acquire(group, 0)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+
+    # Told to come back once the request ahead and itself are likely done
+    assert (rejected.status_code, rejected.retry_after) == (503, 8)
+
+
+def test_requests_wait_for_memory_even_with_free_slots():
+    limit = AdmissionLimit('ai', ('/ai/',), max_body_bytes=100, max_concurrent=0, max_queued=4, memory_factor=4)
+    admission = controller(limit, memory_bytes=500)
+    [group] = admission.groups
+
+    async def run():
+        first = admission.cost(group, 100)
+        await admission.acquire(group, first)
+        second = asyncio.create_task(admission.acquire(group, admission.cost(group, 100)))
+        await asyncio.sleep(0.01)
+        blocked = not second.done()
+        await admission.release(group, first, 1.0)
+        await second
+        return first, blocked
+
+    assert asyncio.run(run()) == (400, True)
+    # Larger than the whole budget: runs once alone rather than never
+    assert admission.cost(group, 10 ** 6) == 500
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.post('/convert/echo')
+    async def echo(request: Request):
+        return {'size': len(await request.body())}
+
+    @app.post('/other')
+    async def other(request: Request):
+        return {'size': len(await request.body())}
+
+    app.add_middleware(AdmissionMiddleware, controller=controller())
+    return TestClient(app)
+
+
+def test_bodies_declared_too_large_get_413(client):
+    response = client.post('/convert/echo', content=b'x' * 101)
+
+    assert response.status_code == 413
+    assert response.json() == {'detail': "Request body larger than 100 bytes"}
+    assert client.post('/convert/echo', content=b'x' * 100).json() == {'size': 100}
+
+
+def test_streamed_bodies_are_cut_off_past_the_limit(client):
+    def chunks():
+        for _ in range(5):
+            yield b'x' * 30
+
+    assert client.post('/convert/echo', content=chunks()).status_code == 413
+    # Paths outside every group are not limited
+    assert client.post('/other', content=b'x' * 150).json() == {'size': 150}
+
+
+def test_full_queues_get_429_with_retry_after():
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    middleware = AdmissionMiddleware(app, controller())
+
+    async def request():
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/convert/bc3-to-pdf', 'headers': []}
+        await middleware(scope, receive, send)
+        return sent[0]['status'], dict(sent[0]['headers']).get(b'retry-after')
+
+    async def run():
+        requests = [asyncio.create_task(request()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*requests)
+
+    assert sorted(asyncio.run(run())) == [(200, None), (200, None), (429, b'1')]
@@ -0,0 +1,63 @@
+"""
+Tests for the conversion routes' result cache
+"""
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ..cache.result_cache import ResultCache
+from . import convert
+from .convert import _etag_matches
+
+BUDGET = json.dumps({'chapters': [{'code': "01", 'title': "Demoliciones", 'items': [
+    {'code': "01.01", 'description': "Demolición de tabique", 'unit': "m2", 'quantity': "20", 'price': "8.50"}
+]}]})
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(convert, 'result_cache', ResultCache(str(tmp_path / 'results.sqlite3'),
+                                                             str(tmp_path / 'results'), max_bytes=1024 * 1024))
+    app = FastAPI()
+    app.include_router(convert.router)
+    return TestClient(app)
+
+
+def post(client, body=BUDGET, **headers):
+    return client.post('/convert/json-to-bc3', content=body, headers={'content-type': 'application/json', **headers})
+
+
+def test_repeated_conversions_are_served_from_the_cache(client, monkeypatch):
+    first = post(client)
+    generate = []
+    monkeypatch.setattr(convert, 'get_services', lambda: generate.append(1))
+
+    second = post(client)
+
+    assert first.status_code == second.status_code == 200
+    assert second.content == first.content
+    assert second.headers['etag'] == first.headers['etag']
+    assert second.headers['content-disposition'] == 'attachment; filename="presupuesto.bc3"'
+    assert generate == []
+
+
+def test_clients_holding_the_output_get_304(client):
+    etag = post(client).headers['etag']
+
+    assert post(client, **{'if-none-match': etag}).status_code == 304
+    assert post(client, **{'if-none-match': f'W/{etag}, "other"'}).status_code == 304
+    stale = post(client, **{'if-none-match': '"other"'})
+    assert stale.status_code == 200 and stale.headers['etag'] == etag
+
+
+def test_other_inputs_get_their_own_output(client):
+    other = BUDGET.replace("tabique", "muro")
+
+    assert post(client).headers['etag'] != post(client, other).headers['etag']
+
+
+@pytest.mark.parametrize('header, matches', [
+    (None, False), ('"a"', True), ('W/"a"', True), ('"b", "a"', True), ('*', True), ('"b"', False),
+])
+def test_etag_matching(header, matches):
+    assert _etag_matches(header, '"a"') == matches
@@ -0,0 +1,113 @@
+"""
+Tests for the debug routes and per-request profiling
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ..metrics.profiling import ProfileStore
+from . import debug
+from .debug import ProfilingMiddleware, _is_admin
+
+TOKEN = 'sécret'
+# Clients send the token's UTF-8 bytes, which the server decodes as latin-1
+ADMIN = {'X-Admin-Token': TOKEN.encode('utf-8')}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path), keep=10)
+    monkeypatch.setattr(debug, 'profile_store', store)
+    monkeypatch.setenv('PROFILE_MEMORY', 'false')
+    return store
+
+
+@pytest.fixture
+def client(store):
+    app = FastAPI()
+    app.include_router(debug.router)
+
+    @app.get("/work")
+    async def work():
+        return {'total': sum(range(1000))}
+
+    app.add_middleware(ProfilingMiddleware, store=store)
+    return TestClient(app)
+
+
+def test_admin_token_is_compared_as_utf8_bytes(monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', TOKEN)
+
+    assert _is_admin(ADMIN['X-Admin-Token'].decode('latin-1'))
+    assert not _is_admin(TOKEN)
+    assert not _is_admin(None)
+
+    monkeypatch.delenv('ADMIN_TOKEN')
+    assert not _is_admin(ADMIN['X-Admin-Token'].decode('latin-1'))
+
+
+def test_debug_routes_are_hidden_without_an_admin_token(client, monkeypatch):
+    monkeypatch.delenv('ADMIN_TOKEN', raising=False)
+
+    assert client.get("/debug/profiles", headers=ADMIN).status_code == 404
+
+
+def test_debug_routes_require_the_admin_token(client, monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', TOKEN)
+
+    assert client.get("/debug/profiles").status_code == 403
+    assert client.get("/debug/profiles", headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get("/debug/profiles", headers=ADMIN).json() == {'profiles': []}
+
+
+def test_requests_without_the_admin_token_are_not_profiled(client, store, monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', TOKEN)
+
+    for headers in ({'X-Profile': 'cprofile'}, {'X-Profile': 'cprofile', 'X-Admin-Token': 'wrong'}):
+        response = client.get("/work", headers=headers)
+        assert response.status_code == 200
+        assert 'x-profile-id' not in response.headers
+    assert store.list() == []
+
+
+def test_profiling_is_disabled_without_an_admin_token(client, store, monkeypatch):
+    monkeypatch.delenv('ADMIN_TOKEN', raising=False)
+
+    response = client.get("/work", headers={'X-Profile': 'cprofile', **ADMIN})
+
+    assert 'x-profile-id' not in response.headers
+    assert store.list() == []
+
+
+def test_admin_requests_are_profiled_and_kept(client, monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', TOKEN)
+
+    response = client.get("/work", headers={'X-Profile': 'cprofile', **ADMIN})
+    profile_id = response.headers['x-profile-id']
+
+    assert response.json() == {'total': 499500}
+    [listed] = client.get("/debug/profiles", headers=ADMIN).json()['profiles']
+    assert (listed['id'], listed['path'], listed['route'], listed['status'], listed['mode']) == (
+        profile_id, '/work', '/work', 200, 'cprofile'
+    )
+    summary = client.get(f"/debug/profiles/{profile_id}", headers=ADMIN).json()
+    assert [s['name'] for s in summary['spans']][:1] == ['request']
+    assert summary['top_functions']
+    artifact = client.get(f"/debug/profiles/{profile_id}/artifact", headers=ADMIN)
+    assert artifact.status_code == 200 and artifact.content
+
+
+def test_sampling_mode_can_be_asked_for_in_the_query(client, store, monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', TOKEN)
+
+    response = client.get("/work?profile=sampling", headers=ADMIN)
+
+    summary = store.get(response.headers['x-profile-id'])
+    assert summary['mode'] == 'sampling'
+    assert store.artifact(summary['id']).endswith('.collapsed')
+
+
+def test_unknown_profiles_are_not_found(client, monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', TOKEN)
+
+    assert client.get("/debug/profiles/" + "0" * 32, headers=ADMIN).status_code == 404
+    assert client.get("/debug/profiles/..%2F..%2Fsecrets", headers=ADMIN).status_code == 404
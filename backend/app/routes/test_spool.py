@@ -0,0 +1,65 @@
+"""
+Tests for spooled uploads and the spool sweeper
+"""
+import asyncio
+import os
+import time
+import pytest
+from starlette import formparsers
+from .spool import SPOOL_PREFIX, configure_uploads, sweep_periodically, sweep_spool_dir
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'spool'
+    monkeypatch.setenv('SPOOL_DIR', str(directory))
+    monkeypatch.setenv('SPOOL_MAX_BYTES', '16')
+    # configure_uploads replaces the framework's buffer process-wide
+    monkeypatch.setattr(formparsers, 'SpooledTemporaryFile', formparsers.SpooledTemporaryFile)
+    return directory
+
+
+def orphan(directory, name, age):
+    directory.mkdir(exist_ok=True)
+    path = directory / name
+    path.write_bytes(b'x')
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc to find spilled files")
+def test_uploads_spill_into_the_spool_directory(spool_dir):
+    configure_uploads()
+
+    # What the multipart parser creates for each uploaded file
+    upload = formparsers.SpooledTemporaryFile(max_size=1024 * 1024)
+    upload.write(b'x' * 17)
+
+    assert upload._rolled
+    assert os.readlink(f"/proc/self/fd/{upload.fileno()}").startswith(str(spool_dir))
+    upload.close()
+
+
+def test_sweep_removes_only_old_spills(spool_dir):
+    old = orphan(spool_dir, f"{SPOOL_PREFIX}old", 7200)
+    fresh = orphan(spool_dir, f"{SPOOL_PREFIX}fresh", 10)
+    foreign = orphan(spool_dir, "other", 7200)
+
+    assert sweep_spool_dir(3600) == 1
+    assert not old.exists() and fresh.exists() and foreign.exists()
+
+
+def test_sweeps_repeat_while_the_process_runs(spool_dir, monkeypatch):
+    monkeypatch.setenv('SPOOL_ORPHAN_AGE', '3600')
+
+    async def run():
+        sweeper = asyncio.create_task(sweep_periodically(0.01))
+        first = orphan(spool_dir, f"{SPOOL_PREFIX}first", 7200)
+        await asyncio.sleep(0.05)
+        second = orphan(spool_dir, f"{SPOOL_PREFIX}second", 7200)
+        await asyncio.sleep(0.05)
+        sweeper.cancel()
+        return first.exists(), second.exists()
+
+    assert asyncio.run(run()) == (False, False)
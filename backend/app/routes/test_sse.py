@@ -0,0 +1,98 @@
+"""
+Tests for server-sent event streams
+"""
+import asyncio
+import io
+import json
+from decimal import Decimal
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ..ai.pdf_extractor import PDFExtractor
+from ..ai.usage import record_call, track_usage
+from ..cache.extraction_cache import ExtractionCache
+from ..generators.pdf_generator import PDFGenerator
+from ..jobs import get_services
+from ..main import ai_usage_header
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from .convert import router
+from .sse import event_stream, format_event
+
+
+def parse(text):
+    """(event, data) pairs of a stream"""
+    frames = [frame for frame in text.split("\n\n") if frame]
+    return [
+        (frame.split("\n")[0][len("event: "):], json.loads(frame.split("\n")[1][len("data: "):]))
+        for frame in frames
+    ]
+
+
+def read(response):
+    async def run():
+        with track_usage(lambda: '/test/sse'):
+            return "".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(run())
+
+
+def test_events_are_framed_as_json():
+    assert format_event('items', {'description': "Excavación", 'price': Decimal("1.50")}) == (
+        'event: items\ndata: {"description": "Excavación", "price": 1.5}\n\n'
+    )
+
+
+def test_streams_end_with_the_usage_of_the_request():
+    async def events():
+        record_call('model', 10, 5, 0.1)
+        yield {'event': 'progress', 'data': {'done': 1, 'total': 1}}
+
+    response = event_stream(events())
+
+    assert response.media_type == 'text/event-stream'
+    assert response.headers['cache-control'] == 'no-cache'
+    [progress, usage] = parse(read(response))
+    assert progress == ('progress', {'done': 1, 'total': 1})
+    assert usage[0] == 'usage' and usage[1]['calls'] == 1
+
+
+def test_errors_while_streaming_become_a_final_error_event():
+    async def events():
+        yield {'event': 'progress', 'data': {'done': 1, 'total': 2}}
+        raise ValueError("page 2 is unreadable")
+
+    assert [name for name, _ in parse(read(event_stream(events())))] == ['progress', 'error', 'usage']
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    extractor = PDFExtractor(cache=ExtractionCache(str(tmp_path / 'extraction.sqlite3')))
+    monkeypatch.setitem(get_services()._loaded, 'pdf_extractor', extractor)
+    app = FastAPI()
+    app.middleware('http')(ai_usage_header)
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_pdf_extraction_streams_pages_then_the_result(client):
+    budget = Budget(chapters=[BudgetChapter(code="01", title="Demoliciones", items=[
+        BudgetItem(code="01.01", description="Demolición de tabique", unit="m2",
+                   quantity=Decimal("20"), price=Decimal("8.50")),
+    ])])
+    pdf = io.BytesIO()
+    PDFGenerator().generate_file(budget, pdf)
+
+    response = client.post('/convert/pdf-to-json/stream?use_ai=false',
+                           files={'file': ('presupuesto.pdf', pdf.getvalue(), 'application/pdf')})
+
+    assert response.status_code == 200
+    events = parse(response.text)
+    assert [name for name, _ in events] == ['pages', 'progress', 'progress', 'result', 'usage']
+    result = events[-2][1]
+    assert [item['code'] for item in result['budget']['chapters'][0]['items']] == ["01.01"]
+    assert result['report']['source'] == 'extraction'
+
+
+def test_non_pdf_uploads_are_rejected_before_streaming(client):
+    response = client.post('/convert/pdf-to-json/stream', files={'file': ('budget.bc3', b'~V|')})
+
+    assert response.status_code == 400
@@ -0,0 +1,311 @@
+"""
+Production Server
+Pre-forking launcher: loads the app once, then serves it from uvicorn worker processes that share its memory
+"""
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Workers exiting this soon after starting count as failing to start
+FAST_EXIT_SECONDS = 5.0
+# Failed starts in a row after which the launcher gives up
+MAX_FAILED_STARTS = 5
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server that also leaves, draining its requests, once its memory passes a ceiling"""
+
+    def __init__(self, config: uvicorn.Config, max_memory_bytes: int = 0):
+        super().__init__(config)
+        self.max_memory_bytes = max_memory_bytes
+
+    async def on_tick(self, counter: int) -> bool:
+        # Checked once a second, like uvicorn's own housekeeping
+        if self.max_memory_bytes and counter % 10 == 0 and not self.should_exit:
+            used = private_memory_bytes()
+            if used > self.max_memory_bytes:
+                logger.warning("Worker %s uses %s MiB, over its %s MiB ceiling: recycling",
+                               os.getpid(), used // 2 ** 20, self.max_memory_bytes // 2 ** 20)
+                self.should_exit = True
+        return await super().on_tick(counter)
+
+
+class Launcher:
+    """Supervise API worker processes forked from a preloaded parent, and a job worker pool"""
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, workers: Optional[int] = None,
+                 max_requests: Optional[int] = None, max_requests_jitter: Optional[int] = None,
+                 max_memory_mb: Optional[int] = None, graceful_timeout: Optional[int] = None,
+                 preload: Optional[bool] = None, job_workers: Optional[int] = None):
+        """
+        Initialize launcher
+
+        Args:
+            host: Address to listen on (if None, reads API_HOST from env)
+            port: Port to listen on (if None, reads API_PORT from env)
+            workers: API worker processes (if None, reads SERVER_WORKERS from
+                env, defaulting to the CPU count)
+            max_requests: Requests a worker serves before being replaced, 0 for
+                no limit (if None, reads SERVER_MAX_REQUESTS from env)
+            max_requests_jitter: Up to this many requests are added to each
+                worker's limit, so workers are not all replaced at once (if
+                None, reads SERVER_MAX_REQUESTS_JITTER from env)
+            max_memory_mb: Memory a worker may hold beyond what it shares with
+                the launcher before being replaced, 0 for no limit (if None,
+                reads SERVER_MAX_MEMORY_MB from env)
+            graceful_timeout: Seconds a stopping worker waits for its requests
+                to finish before cancelling them (if None, reads
+                SERVER_GRACEFUL_TIMEOUT from env)
+            preload: Whether to load the app and its services before forking,
+                so workers share them (if None, reads SERVER_PRELOAD from env)
+            job_workers: Job worker processes, run once for all API workers
+                (if None, reads JOB_WORKERS from env, defaulting to the CPU count)
+        """
+        self.host = host or os.getenv('API_HOST', '0.0.0.0')
+        self.port = port or int(os.getenv('API_PORT', 8000))
+        self.workers = workers or int(os.getenv('SERVER_WORKERS') or os.cpu_count() or 1)
+        self.max_requests = max_requests if max_requests is not None else int(
+            os.getenv('SERVER_MAX_REQUESTS', 5000)
+        )
+        self.max_requests_jitter = max_requests_jitter if max_requests_jitter is not None else int(
+            os.getenv('SERVER_MAX_REQUESTS_JITTER', 500)
+        )
+        self.max_memory_bytes = (max_memory_mb if max_memory_mb is not None else int(
+            os.getenv('SERVER_MAX_MEMORY_MB', 1024)
+        )) * 2 ** 20
+        self.graceful_timeout = graceful_timeout if graceful_timeout is not None else int(
+            os.getenv('SERVER_GRACEFUL_TIMEOUT', 60)
+        )
+        self.preload = preload if preload is not None else os.getenv('SERVER_PRELOAD', 'true').lower() == 'true'
+        if job_workers is None:
+            job_workers = int(os.getenv('JOB_WORKERS') or os.cpu_count() or 1)
+        self.job_workers = job_workers
+
+        self._app = None
+        self._socket: Optional[socket.socket] = None
+        # Started time of each API worker, by pid
+        self._started: Dict[int, float] = {}
+        self._jobs_pid: Optional[int] = None
+        self._failed_starts = 0
+        self._stopping = False
+
+    def run(self) -> int:
+        """
+        Serve until SIGTERM or SIGINT, then drain the workers
+
+        Returns:
+            Exit status: 0, or 1 if workers kept failing to start
+        """
+        # API workers only queue jobs; the pool started below runs them for all
+        os.environ['JOB_WORKERS'] = '0'
+        self._socket = self._bind()
+        logger.info("Listening on http://%s:%s with %s workers", self.host, self.port, self.workers)
+
+        if self.preload:
+            self._preload()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._request_stop)
+
+        status = 0
+        try:
+            while not self._stopping:
+                self._reap()
+                if self._failed_starts >= MAX_FAILED_STARTS:
+                    logger.error("Workers failed to start %s times in a row, stopping", self._failed_starts)
+                    status = 1
+                    break
+                if self.job_workers and self._jobs_pid is None:
+                    self._jobs_pid = self._fork(self._run_jobs)
+                while len(self._started) < self.workers:
+                    self._started[self._fork(self._serve)] = time.monotonic()
+                time.sleep(0.5)
+        finally:
+            self._drain()
+        return status
+
+    def _bind(self) -> socket.socket:
+        """Listening socket all workers accept on"""
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _preload(self):
+        """Import the app and load its services, fonts and price base once, for workers to share"""
+        started = time.perf_counter()
+        from .main import app
+        from .jobs import warm_services
+        from .validation.price_base import get_price_base_index
+
+        warm_services()
+        get_price_base_index()
+        self._app = app
+
+        # Keep what is loaded out of garbage collection, whose bookkeeping writes would
+        # copy the shared pages into every worker
+        gc.collect()
+        gc.freeze()
+        logger.info("Preloaded the app in %.2fs", time.perf_counter() - started)
+
+    def _fork(self, target) -> int:
+        """Run target in a child process, which exits when it returns"""
+        pid = os.fork()
+        if pid:
+            return pid
+
+        status = 1
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, signal.SIG_DFL)
+            target()
+            status = 0
+        except BaseException:
+            logger.exception("Process %s failed", os.getpid())
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Skip the launcher's exit handlers, which are not the child's to run
+            os._exit(status)
+
+    def _serve(self):
+        """Body of an API worker: serve the app on the shared socket until stopped or recycled"""
+        if self._app is None:
+            from .main import app
+            self._app = app
+
+        limit = None
+        if self.max_requests:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        config = uvicorn.Config(
+            self._app,
+            lifespan='on',
+            limit_max_requests=limit,
+            timeout_graceful_shutdown=self.graceful_timeout,
+        )
+        # uvicorn handles SIGTERM itself: stop accepting, finish in-flight requests, run shutdown
+        WorkerServer(config, self.max_memory_bytes).run(sockets=[self._socket])
+
+    def _run_jobs(self):
+        """Body of the job process: run the job worker pool until stopped"""
+        from .jobs import WorkerPool
+
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self._socket.close()
+
+        pool = WorkerPool(workers=self.job_workers)
+        pool.start()
+        while not stopping:
+            time.sleep(0.5)
+        # Jobs still running are queued again
+        pool.stop()
+
+    def _request_stop(self, signum, frame):
+        if self._stopping:
+            return
+        logger.info("Received %s, draining workers", signal.Signals(signum).name)
+        self._stopping = True
+
+    def _reap(self):
+        """Forget exited children; workers are replaced on the next round"""
+        while True:
+            try:
+                pid, wait_status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+
+            code = os.waitstatus_to_exitcode(wait_status)
+            if pid == self._jobs_pid:
+                logger.warning("Job process %s exited with status %s", pid, code)
+                self._jobs_pid = None
+                continue
+
+            started = self._started.pop(pid, None)
+            if started is None:
+                continue
+            if code and time.monotonic() - started < FAST_EXIT_SECONDS:
+                self._failed_starts += 1
+            else:
+                self._failed_starts = 0
+            if code:
+                logger.warning("Worker %s exited with status %s", pid, code)
+
+    def _drain(self):
+        """Stop the API workers, letting in-flight requests finish, then the job process"""
+        # New connections are refused once no process listens, so load balancers try elsewhere
+        self._socket.close()
+        self._signal_children(list(self._started), signal.SIGTERM)
+        self._wait(lambda: bool(self._started), self.graceful_timeout + 5)
+        self._signal_children(list(self._started), signal.SIGKILL)
+
+        if self._jobs_pid is not None:
+            self._signal_children([self._jobs_pid], signal.SIGTERM)
+            self._wait(lambda: self._jobs_pid is not None, 30)
+            if self._jobs_pid is not None:
+                self._signal_children([self._jobs_pid], signal.SIGKILL)
+        self._wait(lambda: bool(self._started) or self._jobs_pid is not None, 5)
+
+    def _signal_children(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _wait(self, waiting, timeout: float):
+        """Reap children while waiting() holds, for at most timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._reap()
+            if not waiting() or time.monotonic() >= deadline:
+                return
+            time.sleep(0.1)
+
+
+def private_memory_bytes() -> int:
+    """Memory of this process not shared with others, e.g. pages written since it was forked"""
+    try:
+        with open('/proc/self/smaps_rollup', encoding='ascii') as f:
+            return sum(
+                int(line.split()[1]) * 1024 for line in f
+                if line.startswith(('Private_Clean:', 'Private_Dirty:'))
+            )
+    except OSError:
+        # No per-page accounting here: fall back to the peak resident size
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def main() -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s")
+    return Launcher().run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
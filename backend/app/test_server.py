@@ -0,0 +1,91 @@
+"""
+Tests for the production server launcher
+"""
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from . import server
+from .server import Launcher, WorkerServer, private_memory_bytes
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_launcher_reads_its_settings_from_env(monkeypatch):
+    for name, value in {'SERVER_WORKERS': '3', 'SERVER_MAX_REQUESTS': '100', 'SERVER_MAX_REQUESTS_JITTER': '10',
+                        'SERVER_MAX_MEMORY_MB': '256', 'SERVER_PRELOAD': 'false', 'JOB_WORKERS': '2'}.items():
+        monkeypatch.setenv(name, value)
+
+    launcher = Launcher()
+
+    assert (launcher.workers, launcher.max_requests, launcher.max_requests_jitter) == (3, 100, 10)
+    assert (launcher.max_memory_bytes, launcher.preload, launcher.job_workers) == (256 * 2 ** 20, False, 2)
+
+
+def test_launcher_defaults_to_the_cpu_count(monkeypatch):
+    for name in ('SERVER_WORKERS', 'JOB_WORKERS', 'SERVER_PRELOAD'):
+        monkeypatch.delenv(name, raising=False)
+
+    launcher = Launcher()
+
+    assert launcher.workers == launcher.job_workers == (os.cpu_count() or 1)
+    assert launcher.preload
+    assert Launcher(job_workers=0).job_workers == 0
+
+
+def test_private_memory_is_measured():
+    assert private_memory_bytes() > 0
+
+
+def test_workers_over_their_memory_ceiling_leave(monkeypatch):
+    monkeypatch.setattr(server, 'private_memory_bytes', lambda: 2 * 2 ** 20)
+    config = uvicorn.Config(FastAPI())
+
+    below = WorkerServer(config, max_memory_bytes=4 * 2 ** 20)
+    above = WorkerServer(config, max_memory_bytes=2 ** 20)
+    unlimited = WorkerServer(config)
+    for worker in (below, above, unlimited):
+        asyncio.run(worker.on_tick(10))
+
+    assert (below.should_exit, above.should_exit, unlimited.should_exit) == (False, True, False)
+
+
+def test_server_serves_and_drains_on_sigterm(tmp_path):
+    port = free_port()
+    env = {key: value for key, value in os.environ.items() if key != 'ANTHROPIC_API_KEY'}
+    env.update({
+        'API_HOST': '127.0.0.1', 'API_PORT': str(port), 'SERVER_WORKERS': '1', 'JOB_WORKERS': '0',
+        'SERVER_PRELOAD': 'false', 'SERVER_GRACEFUL_TIMEOUT': '5', 'AI_STANDIN': 'synthesize',
+        'CACHE_DIR': str(tmp_path / 'cache'), 'SPOOL_DIR': str(tmp_path / 'spool'),
+    })
+    process = subprocess.Popen([sys.executable, '-m', 'app.server'], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+                break
+            except httpx.TransportError:
+                assert process.poll() is None and time.monotonic() < deadline
+                time.sleep(0.2)
+        assert response.status_code == 200
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
@@ -0,0 +1,25 @@
+"""Deterministic budget validation"""
+import importlib
+
+# The engine and the duplicate index load numpy, so they are imported when first accessed
+_EXPORTS = {
+    'Finding': '.engine', 'ValidationEngine': '.engine', 'ValidationReport': '.engine',
+    'DuplicateEntry': '.duplicates', 'DuplicateGroup': '.duplicates', 'DuplicateIndex': '.duplicates',
+    'DuplicateMatch': '.duplicates', 'HashedEntries': '.duplicates',
+    'IncrementalValidator': '.incremental',
+    'BudgetHashes': '.merkle', 'ChapterHashes': '.merkle', 'hash_budget': '.merkle',
+    'get_price_base_index': '.price_base',
+}
+
+__all__ = [
+    'Finding', 'ValidationEngine', 'ValidationReport',
+    'DuplicateEntry', 'DuplicateGroup', 'DuplicateIndex', 'DuplicateMatch', 'HashedEntries',
+    'IncrementalValidator', 'BudgetHashes', 'ChapterHashes', 'hash_budget',
+    'get_price_base_index',
+]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
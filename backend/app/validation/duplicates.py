@@ -0,0 +1,446 @@
+"""
+Duplicate Detection
+Near-duplicate budget items by MinHash/LSH over character n-grams
+"""
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from ..models.budget import Budget, BudgetChapter
+from .text import normalize_unit, shingle_text
+
+# Multipliers for rolling n-gram hashes and LSH band hashes (64-bit FNV prime)
+_FNV_PRIME = np.uint64(0x100000001B3)
+_SHIFT = np.uint64(32)
+
+# Candidate pairs whose signatures are compared at once
+_VERIFY_CHUNK = 1 << 16
+# N-grams whose hashes are gathered at once when building signatures
+_SIGNATURE_CHUNK = 1 << 12
+
+
+@dataclass
+class DuplicateEntry:
+    """An item as seen by the duplicate index"""
+    code: str
+    description: str
+    unit: str
+    price: float
+    chapter: Optional[str] = None
+
+
+@dataclass
+class HashedEntries:
+    """Entries with a description, with the hashes the index compares them by"""
+    entries: List[DuplicateEntry]
+    signatures: np.ndarray
+    units: np.ndarray
+    prices: np.ndarray
+
+    @classmethod
+    def concat(cls, parts: Sequence['HashedEntries'], num_perm: int) -> 'HashedEntries':
+        """Join hashed entries, e.g. those of each chapter of a budget"""
+        parts = [part for part in parts if part.entries]
+        if not parts:
+            return cls([], np.empty((0, num_perm), dtype=np.uint32),
+                       np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.float64))
+        return cls(
+            [entry for part in parts for entry in part.entries],
+            np.concatenate([part.signatures for part in parts]),
+            np.concatenate([part.units for part in parts]),
+            np.concatenate([part.prices for part in parts])
+        )
+
+
+@dataclass
+class DuplicateGroup:
+    """Items of a budget that look like the same work"""
+    entries: List[DuplicateEntry]
+    # Lowest similarity of a member to the first entry, which every member matches
+    similarity: float
+
+
+@dataclass
+class DuplicateMatch:
+    """Closest entry of an index for an item looked up in it"""
+    entry: DuplicateEntry
+    match: DuplicateEntry
+    similarity: float
+
+
+class DuplicateIndex:
+    """MinHash/LSH index of item descriptions, filtered by unit and price band"""
+
+    def __init__(self, threshold: Optional[float] = None, price_ratio: Optional[float] = None,
+                 ngram: int = 3, num_perm: int = 96, bands: int = 16, bucket_window: int = 8,
+                 seed: int = 1):
+        """
+        Initialize duplicate index
+
+        Args:
+            threshold: Estimated Jaccard similarity of description n-grams from
+                which two items are duplicates (if None, reads DUPLICATE_THRESHOLD from env)
+            price_ratio: Largest ratio between the unit prices of duplicates
+                (if None, reads DUPLICATE_PRICE_RATIO from env)
+            ngram: Characters per shingle
+            num_perm: MinHash signature length
+            bands: LSH bands; num_perm / bands rows each
+            bucket_window: Largest LSH bucket whose members are all compared
+                pairwise; in larger buckets each member is compared with
+                this many neighbours
+            seed: Seed of the hash functions (indexes compared must share it)
+        """
+        self.threshold = threshold or float(os.getenv('DUPLICATE_THRESHOLD', 0.8))
+        self.price_ratio = price_ratio or float(os.getenv('DUPLICATE_PRICE_RATIO', 1.5))
+        self.ngram = ngram
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.bucket_window = bucket_window
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+        self.entries: List[DuplicateEntry] = []
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._units = np.empty(0, dtype=np.uint64)
+        self._prices = np.empty(0, dtype=np.float64)
+        self._codes = np.empty(0, dtype=np.intp)
+        self._order = np.empty((bands, 0), dtype=np.intp)
+        self._sorted_keys = np.empty((bands, 0), dtype=np.uint64)
+
+    @classmethod
+    def from_budget(cls, budget: Budget, **kwargs) -> 'DuplicateIndex':
+        """Index every item of a budget, subchapters included"""
+        return cls(**kwargs).build(budget_entries(budget))
+
+    def build(self, entries: Sequence[DuplicateEntry]) -> 'DuplicateIndex':
+        """
+        Index entries, replacing any previous content
+
+        Entries without a description are left out.
+
+        Args:
+            entries: Items to index
+
+        Returns:
+            The index itself
+        """
+        return self.build_hashed(self.hash_entries(entries))
+
+    def build_hashed(self, hashed: HashedEntries) -> 'DuplicateIndex':
+        """
+        Index entries hashed before, replacing any previous content
+
+        Lets callers keep the hashes of entries that did not change between
+        builds; they must come from an index with the same seed and sizes.
+
+        Args:
+            hashed: Entries and their hashes, from hash_entries
+
+        Returns:
+            The index itself
+        """
+        self.entries = hashed.entries
+        self._signatures, self._units, self._prices = hashed.signatures, hashed.units, hashed.prices
+        code_ids: Dict[str, int] = {}
+        self._codes = np.array(
+            [code_ids.setdefault(entry.code, len(code_ids)) for entry in self.entries], dtype=np.intp
+        )
+
+        keys = self._band_keys(self._signatures, self._units)
+        self._order = np.argsort(keys, axis=1)
+        self._sorted_keys = np.take_along_axis(keys, self._order, axis=1)
+        return self
+
+    def hash_entries(self, entries: Sequence[DuplicateEntry]) -> HashedEntries:
+        """
+        Hash entries the way the index compares them
+
+        Args:
+            entries: Items to hash; those without a description are left out
+
+        Returns:
+            Entries kept with their signatures, unit hashes and prices
+        """
+        entries, texts = _with_text(entries)
+        return HashedEntries(entries, *self._hash_entries(entries, texts))
+
+    def find_duplicates(self) -> List[DuplicateGroup]:
+        """
+        Group near-duplicate entries within the index
+
+        Entries sharing a code are the same concept used twice, not duplicates.
+        Every member of a group matches its first entry, so chains of
+        near-duplicates where the ends differ do not collapse into one group.
+
+        Returns:
+            Groups of two or more entries, largest first
+        """
+        pairs = []
+        for band in range(self.bands):
+            keys, order = self._sorted_keys[band], self._order[band]
+            # Entries with equal band keys form a bucket. Pairing each entry with
+            # the next bucket_window - 1 entries in key order compares small
+            # buckets exhaustively and keeps the work linear in large ones, where
+            # candidates are still joined through chains of overlapping pairs.
+            for distance in range(1, min(self.bucket_window, keys.size)):
+                same = keys[:-distance] == keys[distance:]
+                if same.any():
+                    pairs.append(np.stack([order[:-distance][same], order[distance:][same]], axis=1))
+
+        if not pairs:
+            return []
+
+        hashes = (self._signatures, self._units, self._prices)
+        left, right, _ = self._verify(np.sort(np.concatenate(pairs), axis=1), hashes, hashes)
+        different = self._codes[left] != self._codes[right]
+        return self._group(left[different], right[different])
+
+    def query(self, entries: Sequence[DuplicateEntry]) -> List[DuplicateMatch]:
+        """
+        Find the closest indexed entry for each of some other entries
+
+        Args:
+            entries: Items to look up, e.g. those of a budget against a price base
+
+        Returns:
+            Best match of every entry that has one, in input order
+        """
+        if not self.entries:
+            return []
+        hashed = self.hash_entries(entries)
+        entries = hashed.entries
+        if not entries:
+            return []
+
+        hashes = (hashed.signatures, hashed.units, hashed.prices)
+        keys = self._band_keys(hashes[0], hashes[1])
+
+        pairs = []
+        for band in range(self.bands):
+            low = np.searchsorted(self._sorted_keys[band], keys[band], side='left')
+            high = np.searchsorted(self._sorted_keys[band], keys[band], side='right')
+            counts = high - low
+            if not counts.any():
+                continue
+            queried = np.repeat(np.arange(len(entries)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            indexed = self._order[band, np.repeat(low, counts) + offsets]
+            pairs.append(np.stack([queried, indexed], axis=1))
+
+        if not pairs:
+            return []
+
+        queried, indexed, similarity = self._verify(
+            np.concatenate(pairs), hashes, (self._signatures, self._units, self._prices)
+        )
+        if not queried.size:
+            return []
+
+        # Keep the most similar indexed entry per queried entry
+        order = np.lexsort((-similarity, queried))
+        queried, indexed, similarity = queried[order], indexed[order], similarity[order]
+        first = np.concatenate(([True], queried[1:] != queried[:-1]))
+        return [
+            DuplicateMatch(entries[q], self.entries[i], float(s))
+            for q, i, s in zip(queried[first], indexed[first], similarity[first])
+        ]
+
+    def _hash_entries(self, entries: Sequence[DuplicateEntry], texts: List[str]):
+        """MinHash signatures, unit hashes and absolute prices of entries"""
+        # Identical descriptions are hashed once
+        text_ids: Dict[str, int] = {}
+        ids = np.array([text_ids.setdefault(text, len(text_ids)) for text in texts], dtype=np.intp)
+        signatures = self._signatures_of(list(text_ids))[ids]
+
+        raw_units = [entry.unit for entry in entries]
+        unit_hashes = {
+            unit: zlib.crc32(normalize_unit(unit).encode('utf-8')) for unit in dict.fromkeys(raw_units)
+        }
+        units = np.array(list(map(unit_hashes.__getitem__, raw_units)), dtype=np.uint64)
+        prices = np.abs(np.array([entry.price for entry in entries], dtype=np.float64))
+        return signatures, units, prices
+
+    def _signatures_of(self, texts: List[str]) -> np.ndarray:
+        """MinHash signatures of texts, computed over all their n-grams at once"""
+        if not texts:
+            return np.empty((0, self.num_perm), dtype=np.uint32)
+
+        n = self.ngram
+        # Short texts are padded so that every text has at least one n-gram
+        texts = [text.ljust(n) for text in texts]
+        lengths = np.array([len(text) for text in texts], dtype=np.intp)
+        codes = np.frombuffer("".join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+        counts = lengths - n + 1
+        segment_starts = np.cumsum(counts) - counts
+        ends = segment_starts + counts
+        # Roll the hash over all texts joined, then keep the n-grams that lie within a text
+        rolled = codes[:codes.size - n + 1].copy()
+        for offset in range(1, n):
+            rolled = rolled * _FNV_PRIME + codes[offset:codes.size - n + 1 + offset]
+        text_starts = np.cumsum(lengths) - lengths
+        shingles = rolled[np.arange(ends[-1]) + np.repeat(text_starts - segment_starts, counts)]
+
+        # Texts share most of their n-grams: hash each distinct one once per permutation
+        distinct, inverse = np.unique(shingles, return_inverse=True)
+        hashed = ((self._a[:, None] * distinct[None, :] + self._b[:, None]) >> _SHIFT).astype(np.uint32)
+
+        # Reduce runs of texts whose n-gram hashes, gathered for all permutations, stay in cache
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        first = 0
+        while first < len(texts):
+            last = max(int(np.searchsorted(ends, segment_starts[first] + _SIGNATURE_CHUNK, side='right')),
+                       first + 1)
+            start, stop = segment_starts[first], ends[last - 1]
+            signatures[first:last] = np.minimum.reduceat(
+                hashed[:, inverse[start:stop]], segment_starts[first:last] - start, axis=1
+            ).T
+            first = last
+        return signatures
+
+    def _band_keys(self, signatures: np.ndarray, units: np.ndarray) -> np.ndarray:
+        """One hash per LSH band and entry; the unit is mixed in so only same-unit entries collide"""
+        keys = np.empty((self.bands, signatures.shape[0]), dtype=np.uint64)
+        for band in range(self.bands):
+            key = units.copy()
+            for row in range(band * self.rows, (band + 1) * self.rows):
+                key = (key ^ signatures[:, row]) * _FNV_PRIME
+            keys[band] = key
+        return keys
+
+    def _verify(self, pairs: np.ndarray, left_hashes, right_hashes):
+        """
+        Keep candidate pairs that are similar enough, share the unit and fall in the price band
+
+        Args:
+            pairs: Candidate (left, right) index pairs, possibly repeated across bands
+            left_hashes: Signatures, unit hashes and prices indexed by the left column
+            right_hashes: Same for the right column
+
+        Returns:
+            Tuple of (left indices, right indices, estimated similarity) of the kept pairs
+        """
+        width = len(right_hashes[0]) + 1
+        encoded = np.sort(pairs[:, 0] * width + pairs[:, 1])
+        unique = encoded[np.concatenate(([True], encoded[1:] != encoded[:-1]))]
+        left, right = unique // width, unique % width
+
+        left_signatures, left_units, left_prices = left_hashes
+        right_signatures, right_units, right_prices = right_hashes
+
+        # Cheap filters first, then signatures in chunks to bound memory
+        low = np.minimum(left_prices[left], right_prices[right])
+        high = np.maximum(left_prices[left], right_prices[right])
+        keep = (left_units[left] == right_units[right]) & (high <= self.price_ratio * low)
+        left, right = left[keep], right[keep]
+
+        similarity = np.empty(left.size, dtype=np.float64)
+        for start in range(0, left.size, _VERIFY_CHUNK):
+            chunk = slice(start, start + _VERIFY_CHUNK)
+            similarity[chunk] = (
+                left_signatures[left[chunk]] == right_signatures[right[chunk]]
+            ).mean(axis=1)
+
+        keep = similarity >= self.threshold
+        return left[keep], right[keep], similarity[keep]
+
+    def _group(self, left: np.ndarray, right: np.ndarray) -> List[DuplicateGroup]:
+        """
+        Group duplicate pairs around representatives
+
+        Pairs are first joined into connected components, which bounds the
+        entries compared. Within each, the lowest remaining index represents
+        a group of the entries that match it directly, and the rest are
+        grouped again in the same way.
+        """
+        if not left.size:
+            return []
+
+        # Label propagation with pointer jumping: every entry ends up labelled
+        # with the smallest index in its component
+        labels = np.arange(len(self.entries))
+        while True:
+            lowest = np.minimum(labels[left], labels[right])
+            updated = labels.copy()
+            np.minimum.at(updated, left, lowest)
+            np.minimum.at(updated, right, lowest)
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+
+        members = np.unique(np.concatenate([left, right]))
+        members = members[np.argsort(labels[members], kind='stable')]
+        boundaries = np.flatnonzero(np.diff(labels[members])) + 1
+
+        groups = []
+        for remaining in np.split(members, boundaries):
+            while remaining.size > 1:
+                representative, others = remaining[0], remaining[1:]
+                matched, member_similarity = self._match(representative, others)
+                if matched.any():
+                    groups.append(DuplicateGroup(
+                        [self.entries[index] for index in [representative, *others[matched].tolist()]],
+                        float(member_similarity[matched].min())
+                    ))
+                remaining = others[~matched]
+
+        groups.sort(key=lambda group: (-len(group.entries), -group.similarity))
+        return groups
+
+    def _match(self, representative: int, others: np.ndarray):
+        """
+        Entries of the index that are duplicates of a representative one
+
+        Returns:
+            Tuple of (mask over others, similarity of each of others)
+        """
+        similarity = (self._signatures[others] == self._signatures[representative]).mean(axis=1)
+        low = np.minimum(self._prices[others], self._prices[representative])
+        high = np.maximum(self._prices[others], self._prices[representative])
+        matched = (
+            (similarity >= self.threshold)
+            & (self._units[others] == self._units[representative])
+            & (high <= self.price_ratio * low)
+            & (self._codes[others] != self._codes[representative])
+        )
+        return matched, similarity
+
+def budget_entries(budget: Budget) -> List[DuplicateEntry]:
+    """Entries for every item of a budget, subchapters included"""
+    entries = []
+    stack: List[BudgetChapter] = list(reversed(budget.chapters))
+    while stack:
+        chapter = stack.pop()
+        entries.extend(chapter_entries(chapter))
+        stack.extend(reversed(chapter.subchapters))
+    return entries
+
+
+def chapter_entries(chapter: BudgetChapter) -> List[DuplicateEntry]:
+    """Entries for the items of a chapter, not those of its subchapters"""
+    return [
+        DuplicateEntry(
+            code=item.code,
+            description=item.description,
+            unit=item.unit,
+            price=float(item.price),
+            chapter=chapter.code
+        )
+        for item in chapter.items
+    ]
+
+
+def _with_text(entries: Sequence[DuplicateEntry]):
+    """Entries that have a description, with their n-gram text"""
+    kept, texts = [], []
+    for entry in entries:
+        text = shingle_text(entry.description)
+        if text:
+            kept.append(entry)
+            texts.append(text)
+    return kept, texts
@@ -0,0 +1,454 @@
+"""
+Validation Engine
+Deterministic, vectorized checks over every item of a budget
+"""
+import itertools
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from .duplicates import DuplicateEntry, DuplicateIndex, HashedEntries
+from .text import normalize_description, normalize_unit
+
+# Consistency constants turning the median (or mean) absolute deviation
+# into a standard-deviation scale for modified z-scores
+MAD_SCALE = 0.6745
+MEAN_AD_SCALE = 0.7979
+
+# Units counted in whole pieces, where fractional quantities are suspicious
+COUNT_UNITS = {'ud', 'u', 'un', 'uds', 'unidad', 'unidades'}
+
+SEVERITY_ORDER = {'error': 0, 'warning': 1}
+
+
+@dataclass
+class Finding:
+    """One issue found in a budget"""
+    check: str
+    severity: str
+    message: str
+    code: Optional[str] = None
+    chapter: Optional[str] = None
+    # Modified z-score or relative error; ranks findings worth a closer look
+    score: float = 0.0
+
+
+@dataclass
+class ValidationReport:
+    """Findings of a validation run"""
+    findings: List[Finding] = field(default_factory=list)
+    item_count: int = 0
+
+    @property
+    def errors(self) -> List[Finding]:
+        return [finding for finding in self.findings if finding.severity == 'error']
+
+    @property
+    def warnings(self) -> List[Finding]:
+        return [finding for finding in self.findings if finding.severity == 'warning']
+
+    def flagged(self, limit: int) -> List[Finding]:
+        """Item findings ordered by severity, then by how anomalous they are"""
+        ranked = sorted(
+            (finding for finding in self.findings if finding.code is not None),
+            key=lambda finding: (SEVERITY_ORDER[finding.severity], -abs(finding.score))
+        )
+        return ranked[:limit]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Validation result in the API response format"""
+        errors = [finding.message for finding in self.errors]
+        return {
+            "is_valid": len(errors) == 0,
+            "warnings": [finding.message for finding in self.warnings],
+            "errors": errors,
+            "suggestions": []
+        }
+
+
+class ValidationEngine:
+    """Statistical checks run over the whole budget in one vectorized pass"""
+
+    def __init__(self, price_threshold: Optional[float] = None,
+                 quantity_threshold: Optional[float] = None,
+                 min_group_size: Optional[int] = None, check_duplicates: Optional[bool] = None):
+        """
+        Initialize validation engine
+
+        Args:
+            price_threshold: Modified z-score above which a unit price is an
+                outlier among items of the same unit (if None, reads
+                VALIDATION_PRICE_THRESHOLD from env)
+            quantity_threshold: Same for quantities (if None, reads
+                VALIDATION_QUANTITY_THRESHOLD from env)
+            min_group_size: Items of a unit needed before outliers are judged
+                (if None, reads VALIDATION_MIN_GROUP_SIZE from env)
+            check_duplicates: Whether to look for near-duplicate items
+                (if None, reads VALIDATION_DUPLICATES from env)
+        """
+        self.price_threshold = price_threshold or float(os.getenv('VALIDATION_PRICE_THRESHOLD', 3.5))
+        self.quantity_threshold = quantity_threshold or float(os.getenv('VALIDATION_QUANTITY_THRESHOLD', 5.0))
+        self.min_group_size = min_group_size or int(os.getenv('VALIDATION_MIN_GROUP_SIZE', 5))
+        if check_duplicates is None:
+            check_duplicates = os.getenv('VALIDATION_DUPLICATES', 'true').lower() == 'true'
+        self.check_duplicates = check_duplicates
+
+    def validate(self, budget: Budget, duplicate_entries: Optional[HashedEntries] = None,
+                 check_duplicates: Optional[bool] = None,
+                 columns: Optional['BudgetColumns'] = None) -> ValidationReport:
+        """
+        Check every item and chapter of a budget, subchapters included
+
+        Args:
+            budget: Budget to validate
+            duplicate_entries: Items of the budget already hashed for the
+                duplicate check (if None, they are hashed here)
+            check_duplicates: Whether to look for near-duplicate items
+                (if None, the engine's check_duplicates applies)
+            columns: Columns of the budget, e.g. built from chapters read
+                before (if None, they are built here)
+
+        Returns:
+            Report with errors and warnings
+        """
+        columns = columns or BudgetColumns(budget)
+        report = ValidationReport(item_count=len(columns.codes))
+
+        if not budget.chapters:
+            report.findings.append(Finding('empty_budget', 'error', "El presupuesto no tiene capítulos"))
+            return report
+
+        for chapter in columns.chapters:
+            if not chapter.items and not chapter.subchapters:
+                report.findings.append(Finding(
+                    'empty_chapter', 'warning', f"Capítulo '{chapter.title}' está vacío",
+                    chapter=chapter.code
+                ))
+
+        if report.item_count:
+            report.findings.extend(self._check_values(columns))
+            report.findings.extend(self._check_price_outliers(columns))
+            report.findings.extend(self._check_quantity_outliers(columns))
+            report.findings.extend(self._check_units(columns))
+            if self.check_duplicates if check_duplicates is None else check_duplicates:
+                report.findings.extend(self._check_duplicates(columns, duplicate_entries))
+        report.findings.extend(self._check_chapter_totals(columns))
+
+        return report
+
+    def _check_values(self, columns: 'BudgetColumns') -> List[Finding]:
+        """Zero and negative amounts, and fractional counts of whole units"""
+        price, quantity = columns.price, columns.quantity
+        counted = np.isin(columns.unit_ids, [
+            unit_id for unit, unit_id in columns.unit_index.items() if unit in COUNT_UNITS
+        ])
+        checks = [
+            ('zero_price', price == 0, "tiene precio 0"),
+            ('negative_price', price < 0, "tiene precio negativo"),
+            ('zero_quantity', quantity == 0, "tiene cantidad 0"),
+            ('negative_quantity', quantity < 0, "tiene cantidad negativa"),
+            ('fractional_count', counted & (quantity != np.round(quantity)),
+             "tiene una cantidad no entera de unidades"),
+        ]
+
+        findings = []
+        for check, mask, text in checks:
+            for index in np.flatnonzero(mask):
+                findings.append(columns.item_finding(
+                    check, 'warning', f"Partida '{columns.codes[index]}' {text}", index
+                ))
+        return findings
+
+    def _check_price_outliers(self, columns: 'BudgetColumns') -> List[Finding]:
+        """Unit prices far from the median of items measured in the same unit"""
+        return self._check_outliers(
+            columns, columns.price, self.price_threshold, 'price_outlier', "un precio", ("alto", "bajo")
+        )
+
+    def _check_quantity_outliers(self, columns: 'BudgetColumns') -> List[Finding]:
+        """Quantities far from the median of items measured in the same unit"""
+        return self._check_outliers(
+            columns, columns.quantity, self.quantity_threshold, 'quantity_outlier', "una cantidad",
+            ("alta", "baja")
+        )
+
+    def _check_outliers(self, columns: 'BudgetColumns', values: np.ndarray, threshold: float,
+                        check: str, label: str, directions: Tuple[str, str]) -> List[Finding]:
+        """
+        Flag values whose modified z-score within their unit exceeds the threshold
+
+        Args:
+            label: What is measured, with its article, e.g. "una cantidad"
+            directions: Adjectives for high and low values, agreeing with the label
+        """
+        # Amounts spread multiplicatively, so they are compared on a log scale
+        positive = np.flatnonzero(values > 0)
+        if positive.size == 0:
+            return []
+
+        groups = columns.unit_ids[positive]
+        logs = np.log(values[positive])
+        scores, medians = _modified_z_scores(logs, groups, len(columns.unit_index), self.min_group_size)
+
+        findings = []
+        for position in np.flatnonzero(np.abs(scores) > threshold):
+            index = positive[position]
+            direction = directions[0] if scores[position] > 0 else directions[1]
+            findings.append(columns.item_finding(
+                check, 'warning',
+                f"Partida '{columns.codes[index]}' tiene {label} inusualmente {direction} "
+                f"para la unidad '{columns.units[index]}': {values[index]:.2f} "
+                f"(mediana {np.exp(medians[groups[position]]):.2f})",
+                index, float(scores[position])
+            ))
+        return findings
+
+    def _check_units(self, columns: 'BudgetColumns') -> List[Finding]:
+        """Identical descriptions measured in different units"""
+        unit_count = len(columns.unit_index)
+        pairs = np.unique(columns.description_ids * unit_count + columns.unit_ids)
+        units_per_description = np.bincount(pairs // unit_count, minlength=columns.description_count)
+        inconsistent = np.flatnonzero(units_per_description > 1)
+        # Items without description are not comparable
+        inconsistent = inconsistent[inconsistent != columns.empty_description_id]
+        if inconsistent.size == 0:
+            return []
+
+        members = np.flatnonzero(np.isin(columns.description_ids, inconsistent))
+        members = members[np.argsort(columns.description_ids[members], kind='stable')]
+        boundaries = np.flatnonzero(np.diff(columns.description_ids[members])) + 1
+
+        findings = []
+        for group in np.split(members, boundaries):
+            first = group[0]
+            units = sorted({columns.units[index] for index in group})
+            codes = [columns.codes[index] for index in group]
+            shown = ", ".join(codes[:5]) + (f" y {len(codes) - 5} más" if len(codes) > 5 else "")
+            findings.append(columns.item_finding(
+                'unit_inconsistency', 'warning',
+                f"La descripción '{columns.descriptions[first][:80]}' aparece con unidades "
+                f"distintas ({', '.join(units)}) en las partidas {shown}",
+                first, float(len(units))
+            ))
+        return findings
+
+    def _check_duplicates(self, columns: 'BudgetColumns',
+                          hashed: Optional[HashedEntries] = None) -> List[Finding]:
+        """Different items whose descriptions, unit and price say they are the same work"""
+        index = DuplicateIndex()
+        if hashed is None:
+            hashed = index.hash_entries([
+                DuplicateEntry(code, description, unit, price, chapter)
+                for code, description, unit, price, chapter in zip(
+                    columns.codes, columns.descriptions, columns.units, columns.price.tolist(),
+                    [columns.chapters[owner].code for owner in columns.owners.tolist()]
+                )
+            ])
+        groups = index.build_hashed(hashed).find_duplicates()
+
+        findings = []
+        for group in groups:
+            first = group.entries[0]
+            listed = ", ".join(f"'{entry.code}' ({entry.chapter})" for entry in group.entries[:5])
+            if len(group.entries) > 5:
+                listed += f" y {len(group.entries) - 5} más"
+            findings.append(Finding(
+                'duplicate', 'warning',
+                f"Partidas posiblemente duplicadas ({group.similarity:.0%} de similitud): {listed}",
+                code=first.code,
+                chapter=first.chapter,
+                score=group.similarity
+            ))
+        return findings
+
+    def _check_chapter_totals(self, columns: 'BudgetColumns') -> List[Finding]:
+        """Chapters whose stated total differs from the sum of their items"""
+        sums, counts = columns.chapter_totals()
+        declared = np.array([
+            np.nan if chapter.declared_total is None else float(chapter.declared_total)
+            for chapter in columns.chapters
+        ], dtype=np.float64)
+        # Each item total may be rounded to the cent before being added up
+        tolerance = 0.011 + 0.005 * counts
+        with np.errstate(invalid='ignore'):
+            mismatched = np.flatnonzero(np.abs(sums - declared) > tolerance)
+
+        findings = []
+        for index in mismatched:
+            chapter = columns.chapters[index]
+            findings.append(Finding(
+                'chapter_total', 'error',
+                f"El total declarado del capítulo '{chapter.code}' ({declared[index]:.2f}) "
+                f"no coincide con la suma de sus partidas ({sums[index]:.2f})",
+                chapter=chapter.code,
+                score=float(abs(sums[index] - declared[index]) / max(abs(declared[index]), 0.01))
+            ))
+        return findings
+
+
+class ChapterColumns:
+    """Column-wise view of the items of one chapter, not those of its subchapters"""
+
+    def __init__(self, chapter: BudgetChapter):
+        items = chapter.items
+        self.codes = [item.code for item in items]
+        self.descriptions = [item.description for item in items]
+        self.price = np.array([float(item.price) for item in items], dtype=np.float64)
+        self.quantity = np.array([float(item.quantity) for item in items], dtype=np.float64)
+        self.total = float(self.price @ self.quantity)
+
+        # Chapters repeat a few spellings many times: normalize each distinct one once
+        raw_units = [item.unit for item in items]
+        normalized_units = {raw: normalize_unit(raw) for raw in dict.fromkeys(raw_units)}
+        self.units = [normalized_units[raw] for raw in raw_units]
+        unit_ids: Dict[str, int] = {}
+        for unit in normalized_units.values():
+            unit_ids.setdefault(unit, len(unit_ids))
+        self.unit_names = list(unit_ids)
+        self.unit_ids = np.array(list(map(unit_ids.__getitem__, self.units)), dtype=np.intp)
+
+        # String hashes are stable within the process, which is as long as columns are kept
+        description_keys = {raw: hash(normalize_description(raw)) for raw in dict.fromkeys(self.descriptions)}
+        self.description_keys = np.array(
+            list(map(description_keys.__getitem__, self.descriptions)), dtype=np.int64
+        )
+
+    @property
+    def count(self) -> int:
+        """Number of items"""
+        return len(self.codes)
+
+
+class BudgetColumns:
+    """Column-wise view of every item in a budget, subchapters included"""
+
+    def __init__(self, budget: Budget, parts: Optional[Sequence[ChapterColumns]] = None):
+        """
+        Initialize budget columns
+
+        Args:
+            budget: Budget to view
+            parts: Columns of each chapter, depth first with subchapters after
+                their parent, e.g. kept from a previous run for chapters that
+                did not change (if None, they are built here)
+        """
+        self.chapters: List[BudgetChapter] = []
+        self.parents: List[int] = []
+
+        stack = [(chapter, -1) for chapter in reversed(budget.chapters)]
+        while stack:
+            chapter, parent = stack.pop()
+            owner = len(self.chapters)
+            self.chapters.append(chapter)
+            self.parents.append(parent)
+            stack.extend((sub, owner) for sub in reversed(chapter.subchapters))
+
+        if parts is None:
+            parts = [ChapterColumns(chapter) for chapter in self.chapters]
+        self.parts = parts
+
+        self.codes = list(itertools.chain.from_iterable(part.codes for part in parts))
+        self.descriptions = list(itertools.chain.from_iterable(part.descriptions for part in parts))
+        self.units = list(itertools.chain.from_iterable(part.units for part in parts))
+        self.price = _concat([part.price for part in parts], np.float64)
+        self.quantity = _concat([part.quantity for part in parts], np.float64)
+        self.owners = np.repeat(np.arange(len(self.chapters), dtype=np.intp), [part.count for part in parts])
+
+        # Each chapter's unit ids are mapped to ids over the whole budget
+        self.unit_index: Dict[str, int] = {}
+        unit_ids = []
+        for part in parts:
+            mapping = np.array(
+                [self.unit_index.setdefault(unit, len(self.unit_index)) for unit in part.unit_names],
+                dtype=np.intp
+            )
+            unit_ids.append(mapping[part.unit_ids])
+        self.unit_ids = _concat(unit_ids, np.intp)
+
+        keys, self.description_ids = np.unique(
+            _concat([part.description_keys for part in parts], np.int64), return_inverse=True
+        )
+        self.description_count = len(keys)
+        # Items without description, if any
+        empty = int(np.searchsorted(keys, hash('')))
+        self.empty_description_id = empty if empty < len(keys) and keys[empty] == hash('') else -1
+
+    def chapter_totals(self):
+        """
+        Computed total and item count of every chapter, subchapters included
+
+        Returns:
+            Tuple of (totals, item counts), indexed like chapters
+        """
+        sums = np.array([part.total for part in self.parts], dtype=np.float64)
+        counts = np.array([part.count for part in self.parts], dtype=np.intp)
+
+        # Chapters are numbered depth first, so children come after their parent
+        for index in range(len(self.chapters) - 1, -1, -1):
+            parent = self.parents[index]
+            if parent >= 0:
+                sums[parent] += sums[index]
+                counts[parent] += counts[index]
+
+        return sums, counts
+
+    def item_finding(self, check: str, severity: str, message: str, index: int,
+                     score: float = 0.0) -> Finding:
+        """Build a finding about the item at an index"""
+        return Finding(
+            check, severity, message,
+            code=self.codes[index],
+            chapter=self.chapters[self.owners[index]].code,
+            score=score
+        )
+
+
+def _concat(arrays: List[np.ndarray], dtype) -> np.ndarray:
+    """Join arrays, giving an empty one if there are none"""
+    return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+
+def _modified_z_scores(values: np.ndarray, groups: np.ndarray, group_count: int,
+                       min_group_size: int):
+    """
+    Modified z-scores of values relative to the median of their group
+
+    Returns:
+        Tuple of (score per value, median per group); scores are 0 in groups
+        smaller than min_group_size or without spread
+    """
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    medians = _grouped_median(values, groups, starts, counts)
+    deviations = values - medians[groups]
+    mad = _grouped_median(np.abs(deviations), groups, starts, counts)
+    # When most values are equal the MAD is 0; fall back to the mean deviation
+    mean_ad = np.bincount(groups, weights=np.abs(deviations), minlength=group_count) / np.maximum(counts, 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(
+            mad[groups] > 0,
+            MAD_SCALE * deviations / mad[groups],
+            np.where(mean_ad[groups] > 0, MEAN_AD_SCALE * deviations / mean_ad[groups], 0.0)
+        )
+    scores[counts[groups] < min_group_size] = 0.0
+    return scores, medians
+
+
+def _grouped_median(values: np.ndarray, groups: np.ndarray, starts: np.ndarray,
+                    counts: np.ndarray) -> np.ndarray:
+    """Median of values within each group (NaN for empty groups)"""
+    if values.size == 0:
+        return np.full(len(counts), np.nan)
+
+    # Sort by group, then value, with one float key (cheaper than a lexsort)
+    low_value = values.min()
+    span = values.max() - low_value + 1.0
+    ordered = values[np.argsort(groups * span + (values - low_value))]
+    populated = counts > 0
+    low = np.where(populated, starts + (counts - 1) // 2, 0)
+    high = np.where(populated, starts + counts // 2, 0)
+    return np.where(populated, (ordered[low] + ordered[high]) / 2, np.nan)
+
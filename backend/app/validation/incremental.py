@@ -0,0 +1,87 @@
+"""
+Incremental Validation
+Reuses validation work for the parts of a budget that did not change
+"""
+import os
+from typing import Optional
+from ..cache.lru import LRUCache
+from ..models.budget import Budget
+from .duplicates import DuplicateIndex, HashedEntries, chapter_entries
+from .engine import BudgetColumns, ChapterColumns, ValidationEngine, ValidationReport
+from .merkle import BudgetHashes, hash_budget
+
+
+class IncrementalValidator:
+    """Validation engine that remembers results by content hash between runs"""
+
+    def __init__(self, engine: Optional[ValidationEngine] = None, max_reports: Optional[int] = None,
+                 max_items: Optional[int] = None):
+        """
+        Initialize incremental validator
+
+        Args:
+            engine: Validation engine (if None, a default one is created)
+            max_reports: Reports of whole budgets remembered
+                (if None, reads VALIDATION_CACHE_REPORTS from env)
+            max_items: Items whose columns and duplicate-check signatures are
+                remembered (if None, reads VALIDATION_CACHE_ITEMS from env)
+        """
+        self.engine = engine or ValidationEngine()
+        max_items = max_items or int(os.getenv('VALIDATION_CACHE_ITEMS', 200000))
+        self._reports = LRUCache(max_reports or int(os.getenv('VALIDATION_CACHE_REPORTS', 64)))
+        self._columns = LRUCache(max_items)
+        self._chapters = LRUCache(max_items)
+        self._hasher = DuplicateIndex()
+
+    def validate(self, budget: Budget, hashes: Optional[BudgetHashes] = None,
+                 check_duplicates: Optional[bool] = None) -> ValidationReport:
+        """
+        Validate a budget, reusing what is known about its unchanged chapters
+
+        A budget seen before returns its previous report. Otherwise the items
+        of chapters whose content did not change are not read again: their
+        columns, chapter sums and duplicate-check signatures are reused, and
+        only edited chapters are converted, normalized and hashed. The checks
+        comparing items across chapters (outliers against per-unit medians,
+        units of equal descriptions, duplicate groups) then run vectorized
+        over the whole budget, since an edit anywhere can change them.
+
+        Args:
+            budget: Budget to validate
+            hashes: Hashes of the budget (if None, they are computed here)
+            check_duplicates: Whether to look for near-duplicate items
+                (if None, the engine's check_duplicates applies)
+
+        Returns:
+            Report with errors and warnings
+        """
+        hashes = hashes or hash_budget(budget)
+        if check_duplicates is None:
+            check_duplicates = self.engine.check_duplicates
+        report = self._reports.get((hashes.root, check_duplicates))
+        if report is not None:
+            return report
+
+        parts = []
+        for chapter in hashes.chapters:
+            part = self._columns.get(chapter.own)
+            if part is None:
+                part = ChapterColumns(chapter.chapter)
+                self._columns.set(chapter.own, part, max(part.count, 1))
+            parts.append(part)
+        columns = BudgetColumns(budget, parts)
+
+        duplicate_entries = None
+        if check_duplicates:
+            parts = []
+            for chapter in hashes.chapters:
+                part = self._chapters.get(chapter.own)
+                if part is None:
+                    part = self._hasher.hash_entries(chapter_entries(chapter.chapter))
+                    self._chapters.set(chapter.own, part, len(part.entries))
+                parts.append(part)
+            duplicate_entries = HashedEntries.concat(parts, self._hasher.num_perm)
+
+        report = self.engine.validate(budget, duplicate_entries, check_duplicates, columns)
+        self._reports.set((hashes.root, check_duplicates), report)
+        return report
@@ -0,0 +1,81 @@
+"""
+Budget Hashes
+Merkle content hashes of budget items and chapter subtrees
+"""
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+
+DIGEST_SIZE = 16
+
+
+@dataclass
+class ChapterHashes:
+    """Hashes of one chapter"""
+    chapter: BudgetChapter
+    # Chapter fields and its own items
+    own: bytes
+    # Own hash and the subtree hashes of its subchapters
+    subtree: bytes
+    # One per item, in item order
+    items: List[bytes]
+
+
+@dataclass
+class BudgetHashes:
+    """Hashes of every item and chapter of a budget"""
+    # Changes whenever any item or chapter changes
+    root: bytes
+    # Depth first, subchapters after their parent
+    chapters: List[ChapterHashes]
+
+    def item_hashes(self) -> Dict[Tuple[str, str], bytes]:
+        """Map (chapter code, item code) to the hash of the item"""
+        return {
+            (hashes.chapter.code, item.code): digest
+            for hashes in self.chapters
+            for item, digest in zip(hashes.chapter.items, hashes.items)
+        }
+
+
+def hash_budget(budget: Budget) -> BudgetHashes:
+    """
+    Hash every item and chapter subtree of a budget
+
+    A chapter's subtree hash covers its items and all its subchapters, so
+    an unchanged hash means nothing below that chapter changed.
+
+    Args:
+        budget: Budget to hash
+
+    Returns:
+        Hashes of the budget
+    """
+    chapters: List[ChapterHashes] = []
+
+    def visit(chapter: BudgetChapter) -> bytes:
+        position = len(chapters)
+        chapters.append(None)
+        items = [item_hash(item) for item in chapter.items]
+        own = _digest(
+            f"{chapter.code}\x1f{chapter.title}\x1f{chapter.declared_total}".encode('utf-8'), *items
+        )
+        subtree = _digest(own, *[visit(sub) for sub in chapter.subchapters])
+        chapters[position] = ChapterHashes(chapter, own, subtree, items)
+        return subtree
+
+    root = _digest(*[visit(chapter) for chapter in budget.chapters])
+    return BudgetHashes(root, chapters)
+
+
+def item_hash(item: BudgetItem) -> bytes:
+    """Hash of the fields of an item"""
+    return _digest(
+        f"{item.code}\x1f{item.description}\x1f{item.unit}\x1f{item.price}\x1f{item.quantity}".encode('utf-8')
+    )
+
+
+def _digest(*parts: bytes) -> bytes:
+    """Hash of some byte strings; child hashes have a fixed size, so plain concatenation is unambiguous"""
+    return hashlib.blake2b(b"".join(parts), digest_size=DIGEST_SIZE).digest()
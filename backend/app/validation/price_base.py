@@ -0,0 +1,50 @@
+"""
+Price Base
+Reference price database indexed for duplicate lookups
+"""
+import os
+import threading
+from typing import Optional
+from ..models.budget import Budget
+from ..parsers.bc3_parser import BC3Parser
+from .duplicates import DuplicateIndex
+
+_index: Optional[DuplicateIndex] = None
+_lock = threading.Lock()
+
+
+def load_price_base(path: str) -> Budget:
+    """
+    Read a price base from a BC3 or budget JSON file
+
+    Args:
+        path: Path to the price base
+
+    Returns:
+        The price base as a budget
+    """
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return Budget.model_validate_json(f.read())
+
+    return BC3Parser().parse_file(path)
+
+
+def get_price_base_index() -> Optional[DuplicateIndex]:
+    """
+    Return the duplicate index of the price base set in PRICE_BASE_PATH
+
+    The index is built on first use and kept for the life of the process.
+
+    Returns:
+        The index, or None if no price base is configured
+    """
+    global _index
+    path = os.getenv('PRICE_BASE_PATH')
+    if not path:
+        return None
+
+    with _lock:
+        if _index is None:
+            _index = DuplicateIndex.from_budget(load_price_base(path))
+    return _index
@@ -0,0 +1,96 @@
+"""
+Tests for near-duplicate detection
+"""
+from decimal import Decimal
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from .duplicates import DuplicateEntry, DuplicateIndex, HashedEntries, chapter_entries
+from .engine import ValidationEngine
+
+BASE = "hormigon armado ha-25 en zapatas de cimentacion vertido con bomba y vibrado"
+
+
+def entry(code, description, unit='m3', price=100.0, chapter='01'):
+    return DuplicateEntry(code, description, unit, price, chapter)
+
+
+def groups(entries, **kwargs):
+    index = DuplicateIndex(threshold=0.8, **kwargs).build(entries)
+    return [[member.code for member in group.entries] for group in index.find_duplicates()]
+
+
+def test_reworded_items_are_grouped():
+    assert groups([
+        entry("A", BASE), entry("B", "Hormigón armado HA-25 en zapatas de cimentación, vertido con bomba y vibrado"),
+        entry("C", "Tabique de ladrillo cerámico hueco doble"),
+    ]) == [["A", "B"]]
+
+
+def test_unit_price_and_code_keep_items_apart():
+    assert groups([entry("A", BASE), entry("B", BASE, unit='m2')]) == []
+    assert groups([entry("A", BASE, price=100), entry("B", BASE, price=200)]) == []
+    assert groups([entry("A", BASE), entry("A", BASE, chapter='02')]) == []
+    assert groups([entry("A", BASE, price=100), entry("B", BASE, price=-120)]) == [["A", "B"]]
+
+
+def test_chains_of_near_duplicates_do_not_collapse_into_one_group():
+    # A~B and B~C, but A and C are too different
+    chain = [entry("A", BASE + " incl. encofrado"), entry("B", BASE), entry("C", "suministro " + BASE)]
+    index = DuplicateIndex(threshold=0.8).build(chain)
+    signatures = index._signatures
+
+    assert (signatures[0] == signatures[1]).mean() >= 0.8
+    assert (signatures[1] == signatures[2]).mean() >= 0.8
+    assert (signatures[0] == signatures[2]).mean() < 0.8
+    [group] = index.find_duplicates()
+    assert [member.code for member in group.entries] == ["A", "B"]
+    assert group.similarity >= 0.8
+
+
+def test_large_groups_of_copies_stay_whole():
+    copies = [entry(f"I{n:03d}", BASE) for n in range(40)]
+
+    assert groups(copies) == [[member.code for member in copies]]
+
+
+def test_items_without_description_are_left_out():
+    hashed = DuplicateIndex().hash_entries([entry("A", ""), entry("B", " .. "), entry("C", BASE)])
+
+    assert [e.code for e in hashed.entries] == ["C"]
+
+
+def test_hashes_of_chapters_join_into_those_of_the_budget():
+    chapters = [
+        BudgetChapter(code=f"0{n}", title="A", items=[
+            BudgetItem(code=f"{n}.1", unit="m3", description=BASE, price=Decimal("100"))
+        ])
+        for n in range(1, 3)
+    ]
+    index = DuplicateIndex()
+    parts = [index.hash_entries(chapter_entries(chapter)) for chapter in chapters]
+    joined = HashedEntries.concat(parts, index.num_perm)
+
+    assert (joined.signatures[0] == joined.signatures[1]).all()
+    [group] = index.build_hashed(joined).find_duplicates()
+    assert [e.chapter for e in group.entries] == ["01", "02"]
+
+
+def test_lookups_return_the_closest_indexed_entry():
+    index = DuplicateIndex(threshold=0.8).build([
+        entry("P1", BASE), entry("P2", "Tabique de ladrillo cerámico hueco doble", unit='m2', price=20),
+    ])
+
+    [match] = index.query([entry("X", BASE.upper(), price=110), entry("Y", "Pintura", unit='m2', price=20)])
+
+    assert (match.entry.code, match.match.code, match.similarity) == ("X", "P1", 1.0)
+
+
+def test_engine_reports_duplicate_groups():
+    budget = Budget(chapters=[BudgetChapter(code="01", title="A", items=[
+        BudgetItem(code="A", unit="m3", description=BASE, price=Decimal("100")),
+        BudgetItem(code="B", unit="m3", description=BASE + ".", price=Decimal("101")),
+    ])])
+
+    [finding] = ValidationEngine(check_duplicates=True).validate(budget).findings
+
+    assert finding.check == 'duplicate'
+    assert finding.message == "Partidas posiblemente duplicadas (100% de similitud): 'A' (01), 'B' (01)"
@@ -0,0 +1,88 @@
+"""
+Tests for the statistical validation engine
+"""
+from decimal import Decimal
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from .engine import ValidationEngine
+
+
+def item(code, price, quantity=1, unit='m2', description=None):
+    return BudgetItem(code=code, unit=unit, description=description or f"Partida {code}",
+                      price=Decimal(str(price)), quantity=Decimal(str(quantity)))
+
+
+def validate(*chapters, **kwargs):
+    engine = ValidationEngine(check_duplicates=False, **kwargs)
+    return engine.validate(Budget(chapters=list(chapters)))
+
+
+def checks(report):
+    return sorted((finding.check, finding.code) for finding in report.findings)
+
+
+def test_budgets_without_chapters_are_invalid():
+    report = validate()
+
+    assert report.to_dict()['is_valid'] is False
+    assert report.to_dict()['errors'] == ["El presupuesto no tiene capítulos"]
+
+
+def test_zero_negative_and_fractional_values_are_flagged():
+    report = validate(BudgetChapter(code="01", title="A", items=[
+        item("A", 0), item("B", -3), item("C", 5, quantity=0), item("D", 5, quantity=-1),
+        item("E", 5, quantity=1.5, unit='ud'), item("F", 5, quantity=1.5),
+    ]), BudgetChapter(code="02", title="Vacío"))
+
+    assert checks(report) == [
+        ('empty_chapter', None), ('fractional_count', 'E'), ('negative_price', 'B'),
+        ('negative_quantity', 'D'), ('zero_price', 'A'), ('zero_quantity', 'C'),
+    ]
+    assert report.to_dict()['is_valid'] is True
+
+
+def test_outliers_are_judged_within_their_unit_with_agreeing_adjectives():
+    items = [item(f"M{n}", 10 + n, quantity=100 + n) for n in range(8)]
+    items += [item("CARO", 900, quantity=104), item("POCO", 13, quantity=0.01)]
+    # Too few items in kg to judge them, however spread
+    items += [item("K1", 1, unit='kg'), item("K2", 1000, unit='kg')]
+
+    report = validate(BudgetChapter(code="01", title="A", items=items))
+
+    messages = {finding.code: finding.message for finding in report.findings}
+    assert set(messages) == {"CARO", "POCO"}
+    assert "tiene un precio inusualmente alto para la unidad 'm2'" in messages["CARO"]
+    assert "tiene una cantidad inusualmente baja para la unidad 'm2'" in messages["POCO"]
+    assert report.flagged(1)[0].code == "POCO"
+
+
+def test_same_description_in_different_units_is_flagged_once():
+    report = validate(BudgetChapter(code="01", title="A", items=[
+        item("A", 10, unit='m2', description="Pintura plástica"),
+        item("B", 10, unit='M2', description="pintura   plástica"),
+        item("C", 10, unit='m3', description="Pintura plástica"),
+    ]))
+
+    [finding] = report.findings
+    assert finding.check == 'unit_inconsistency'
+    assert "(m2, m3) en las partidas A, B, C" in finding.message
+
+
+def test_declared_chapter_totals_include_subchapters():
+    sub = BudgetChapter(code="01.1", title="Sub", items=[item("B", 5, quantity=4)], declared_total=Decimal("20"))
+    chapter = BudgetChapter(code="01", title="A", items=[item("A", 10, quantity=3)], subchapters=[sub],
+                            declared_total=Decimal("50"))
+    wrong = BudgetChapter(code="02", title="B", items=[item("C", 10)], declared_total=Decimal("11"))
+
+    report = validate(chapter, wrong)
+
+    [finding] = report.errors
+    assert (finding.check, finding.chapter) == ('chapter_total', "02")
+    assert "(11.00) no coincide con la suma de sus partidas (10.00)" in finding.message
+
+
+def test_chapter_totals_allow_for_rounding_of_each_item():
+    items = [item(f"R{n}", 0.333, quantity=1) for n in range(3)]
+
+    report = validate(BudgetChapter(code="01", title="A", items=items, declared_total=Decimal("1.00")))
+
+    assert report.errors == []
@@ -0,0 +1,92 @@
+"""
+Tests for Merkle hashes and incremental validation
+"""
+from decimal import Decimal
+import pytest
+from ..models.budget import Budget, BudgetChapter, BudgetItem
+from . import engine
+from .engine import ValidationEngine
+from .incremental import IncrementalValidator
+from .merkle import hash_budget
+
+
+def make_budget():
+    def items(prefix, count):
+        return [
+            BudgetItem(code=f"{prefix}.{n}", unit="m2", description=f"Solado de gres tipo {prefix}{n}",
+                       price=Decimal(10 + n), quantity=Decimal(3))
+            for n in range(count)
+        ]
+
+    sub = BudgetChapter(code="01.1", title="Sub", items=items("S", 3), declared_total=Decimal("99"))
+    return Budget(chapters=[
+        BudgetChapter(code="01", title="A", items=items("A", 4), subchapters=[sub], declared_total=Decimal("237")),
+        BudgetChapter(code="02", title="B", items=items("B", 6)),
+    ])
+
+
+def test_only_edited_subtrees_change_their_hash():
+    budget = make_budget()
+    before = hash_budget(budget)
+
+    budget.chapters[0].subchapters[0].items[1].quantity = Decimal(4)
+    after = hash_budget(budget)
+
+    assert after.root != before.root
+    assert [(b.own == a.own, b.subtree == a.subtree) for b, a in zip(before.chapters, after.chapters)] == [
+        (True, False), (False, False), (True, True)
+    ]
+    assert [b.items == a.items for b, a in zip(before.chapters, after.chapters)] == [True, False, True]
+    assert hash_budget(make_budget()).root == before.root
+
+
+@pytest.fixture
+def built_chapters(monkeypatch):
+    """Codes of the chapters whose columns are built"""
+    built = []
+    build = engine.ChapterColumns.__init__
+
+    def counting(self, chapter):
+        built.append(chapter.code)
+        build(self, chapter)
+
+    monkeypatch.setattr(engine.ChapterColumns, '__init__', counting)
+    return built
+
+
+def test_revalidation_reads_only_edited_chapters(built_chapters):
+    validator = IncrementalValidator(ValidationEngine(check_duplicates=False))
+    budget = make_budget()
+    validator.validate(budget)
+    assert built_chapters == ["01", "01.1", "02"]
+
+    built_chapters.clear()
+    budget.chapters[0].subchapters[0].items[1].price = Decimal(20)
+    report = validator.validate(budget)
+
+    assert built_chapters == ["01.1"]
+    fresh = ValidationEngine(check_duplicates=False).validate(budget)
+    assert report.findings == fresh.findings
+    assert [finding.chapter for finding in report.errors] == ["01", "01.1"]
+
+
+def test_unchanged_budgets_reuse_their_report():
+    validator = IncrementalValidator(ValidationEngine(check_duplicates=False))
+
+    first = validator.validate(make_budget())
+
+    assert validator.validate(make_budget()) is first
+    assert validator.validate(make_budget(), check_duplicates=True) is not first
+
+
+def test_incremental_duplicate_check_matches_a_full_one():
+    validator = IncrementalValidator(ValidationEngine(check_duplicates=True))
+    budget = make_budget()
+    validator.validate(budget)
+
+    budget.chapters[1].items[0].description = budget.chapters[0].items[0].description
+    budget.chapters[1].items[0].price = budget.chapters[0].items[0].price
+    report = validator.validate(budget)
+
+    assert [f.check for f in report.findings] == ['duplicate']
+    assert report.findings == ValidationEngine(check_duplicates=True).validate(budget).findings
@@ -0,0 +1,30 @@
+"""
+Text Normalization
+Canonical forms of units and descriptions used to compare budget items
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+_NON_WORD = re.compile(r'[\W_]+')
+_COMBINING_MARKS = re.compile(r'[\u0300-\u036f]')
+
+
+def normalize_unit(unit: str) -> str:
+    """Canonical unit spelling, e.g. 'M²' and 'm2.' both become 'm2'"""
+    unit = unit.strip().lower().rstrip('.').replace('²', '2').replace('³', '3')
+    return unit or 'ud'
+
+
+# Edited budgets are validated again and again: keep recent descriptions' canonical form
+@lru_cache(maxsize=1 << 18)
+def normalize_description(description: str) -> str:
+    """Canonical description for equality comparisons"""
+    # str.split() splits on the same whitespace as \s and drops it at both ends, at a third of the cost
+    return ' '.join(unicodedata.normalize('NFC', description).split()).casefold()
+
+
+def shingle_text(description: str) -> str:
+    """Lowercase description without accents or punctuation, for n-gram comparison"""
+    decomposed = unicodedata.normalize('NFKD', description.casefold())
+    return _NON_WORD.sub(' ', _COMBINING_MARKS.sub('', decomposed)).strip()
@@ -30,4 +30,9 @@ echo "✅ Iniciando servidor en http://localhost:8000"
 echo "📚 Documentación disponible en http://localhost:8000/docs"
 echo ""
 
-python -m app.main
+# --reload: un solo proceso que se reinicia al cambiar el código (desarrollo)
+if [ "$1" = "--reload" ]; then
+    python -m app.main
+else
+    exec python -m app.server
+fi
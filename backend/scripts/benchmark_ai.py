@@ -0,0 +1,103 @@
+"""
+AI Path Benchmark
+Times description enhancement and validation against the local AI stand-in
+
+Usage (from backend/):
+    python -m scripts.benchmark_ai --chapters 20 --items 50 --latency 0.2 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+WORDS = (
+    "hormigón armado muro forjado losa zapata viga pilar acero corrugado encofrado madera "
+    "ladrillo cerámico hueco doble tabique yeso enlucido pintura plástica suelo gres "
+    "porcelánico rodapié carpintería aluminio ventana puerta corredera tubería pvc "
+    "saneamiento colector arqueta excavación zanja relleno compactado grava"
+).split()
+
+
+def build_budget(chapters: int, items: int, seed: int):
+    """Synthetic budget with varied descriptions, units and amounts"""
+    from app.models.budget import Budget, BudgetChapter, BudgetItem
+
+    rng = random.Random(seed)
+    budget = Budget()
+    for c in range(chapters):
+        chapter = BudgetChapter(code=f"{c + 1:02d}", title=f"Capítulo {c + 1}")
+        for i in range(items):
+            chapter.items.append(BudgetItem(
+                code=f"{c + 1:02d}.{i + 1:03d}",
+                unit=rng.choice(["m2", "m3", "ud", "kg", "ml"]),
+                description=" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 14))),
+                price=Decimal(str(round(rng.lognormvariate(3, 0.6), 2))),
+                quantity=Decimal(rng.randint(1, 300))
+            ))
+        # A few outliers so validation has something to review
+        chapter.items[0].price *= 100
+        budget.chapters.append(chapter)
+    return budget
+
+
+async def run_scenarios(args):
+    from app.ai.budget_enhancer import BudgetEnhancer
+    from app.ai.usage import track_usage
+
+    enhancer = BudgetEnhancer()
+    budget = build_budget(args.chapters, args.items, args.seed)
+
+    async def timed(name, work):
+        with track_usage(lambda: name) as usage:
+            started = time.monotonic()
+            await work
+            elapsed = time.monotonic() - started
+        print(f"{name:<22} {elapsed:8.2f}s  calls={usage.calls:<4} retries={usage.retries:<3} "
+              f"failed={usage.failed_calls:<3} in={usage.input_tokens:<7} out={usage.output_tokens:<7} "
+              f"wait={usage.queue_wait:.2f}s  cache={usage.cache_hits}")
+
+    print(f"{args.chapters * args.items} items, latency {args.latency}s "
+          f"+ {args.token_latency}s/token, error rate {args.error_rate}")
+    await timed("enhance (cold memo)", enhancer.enhance_descriptions(budget.model_copy(deep=True)))
+    await timed("enhance (warm memo)", enhancer.enhance_descriptions(budget.model_copy(deep=True)))
+    await timed("validate", enhancer.validate_budget(budget))
+    budget.chapters[0].items[1].price *= 50
+    await timed("validate (one edit)", enhancer.validate_budget(budget))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=20)
+    parser.add_argument('--items', type=int, default=50, help="Items per chapter")
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds before every reply")
+    parser.add_argument('--token-latency', type=float, default=0.002, help="Seconds per completion token")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls failing with --error-status")
+    parser.add_argument('--error-status', type=int, default=429)
+    parser.add_argument('--replay', metavar='DIR', help="Replay replies recorded in DIR (AI_STANDIN=record)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Settings are read when services are created, so they go in before importing the app
+    os.environ.update({
+        'AI_STANDIN': 'replay' if args.replay else 'synthesize',
+        'AI_STANDIN_LATENCY': str(args.latency),
+        'AI_STANDIN_TOKEN_LATENCY': str(args.token_latency),
+        'AI_STANDIN_ERROR_RATE': str(args.error_rate),
+        'AI_STANDIN_ERROR_STATUS': str(args.error_status),
+        'AI_STANDIN_SEED': str(args.seed),
+        # Fresh caches so that every run starts cold
+        'CACHE_DIR': tempfile.mkdtemp(prefix='benchmark-ai-'),
+    })
+    if args.replay:
+        os.environ['AI_STANDIN_DIR'] = args.replay
+    os.environ.pop('ANTHROPIC_API_KEY', None)
+
+    asyncio.run(run_scenarios(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Startup Benchmark
+Times importing the API app and warming its services, each run in a fresh interpreter
+
+Usage (from backend/):
+    python -m scripts.benchmark_startup --runs 5 --record startup.jsonl --max-import-seconds 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+# Libraries that should only load when a service is first used
+HEAVY_MODULES = ('reportlab', 'pdfplumber', 'PyPDF2', 'anthropic', 'httpx', 'numpy')
+
+# Run by each child interpreter; prints one JSON line
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter() - started
+loaded = [name for name in {heavy!r} if name in sys.modules]
+from app.jobs import warm_services
+warmup = warm_services()
+print(json.dumps({{'import_seconds': imported, 'warmup_seconds': warmup, 'heavy_loaded': loaded}}))
+"""
+
+
+def run_once(top: int) -> dict:
+    """Import the app in a new interpreter, with -X importtime for the slowest modules"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD.format(heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['slowest'] = slowest_imports(completed.stderr, top)
+    return result
+
+
+def slowest_imports(importtime: str, top: int) -> list:
+    """Modules app.main imports, and what they import, by cumulative import time, from -X importtime output"""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        if name.strip() == 'app.main':
+            # Imports after this one were made by warming up
+            break
+        # Nesting shows as indentation, two spaces per level below app.main
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth in (1, 2):
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    rows.sort(reverse=True)
+    return [{'module': name, 'seconds': round(seconds, 4)} for seconds, name in rows[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="Slowest imports listed")
+    parser.add_argument('--record', metavar='FILE', help="Append the results as a JSON line, to track them over time")
+    parser.add_argument('--max-import-seconds', type=float,
+                        help="Fail if the median import time is above this")
+    args = parser.parse_args()
+
+    # Children get fresh caches and no API key, so nothing is read from earlier runs or sent out
+    env = os.environ
+    env['CACHE_DIR'] = tempfile.mkdtemp(prefix='benchmark-startup-')
+    env.pop('ANTHROPIC_API_KEY', None)
+    env.setdefault('AI_STANDIN', 'synthesize')
+
+    runs = [run_once(args.top) for _ in range(args.runs)]
+    imports = [run['import_seconds'] for run in runs]
+    warmups = [run['warmup_seconds'] for run in runs]
+    heavy = sorted({name for run in runs for name in run['heavy_loaded']})
+
+    print(f"{args.runs} runs, Python {sys.version.split()[0]}")
+    print(f"import app.main   median {statistics.median(imports):.3f}s  min {min(imports):.3f}s  "
+          f"max {max(imports):.3f}s")
+    print(f"warm services     median {statistics.median(warmups):.3f}s")
+    print(f"heavy modules loaded at import: {', '.join(heavy) or 'none'}")
+    print("slowest imports (last run):")
+    for row in runs[-1]['slowest']:
+        print(f"  {row['seconds']:8.3f}s  {row['module']}")
+
+    if args.record:
+        with open(args.record, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'recorded_at': datetime.now(timezone.utc).isoformat(),
+                'python': sys.version.split()[0],
+                'runs': args.runs,
+                'import_seconds': round(statistics.median(imports), 4),
+                'warmup_seconds': round(statistics.median(warmups), 4),
+                'heavy_loaded': heavy,
+            }) + "\n")
+
+    if args.max_import_seconds is not None and statistics.median(imports) > args.max_import_seconds:
+        print(f"Median import time above {args.max_import_seconds}s")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,7 @@
 import React, { useState } from 'react'
 import axios from 'axios'
+import { postEventStream } from '../utils/eventStream'
+import { downloadJSON } from '../utils/download'
 
 const API_BASE_URL = '/api'
 
@@ -8,6 +10,8 @@ function BudgetValidator() {
   const [loading, setLoading] = useState(false)
   const [validationResult, setValidationResult] = useState(null)
   const [error, setError] = useState(null)
+  const [progress, setProgress] = useState(null)
+  const [enhancedItems, setEnhancedItems] = useState([])
 
   const handleFileChange = (e) => {
     const selectedFile = e.target.files[0]
@@ -66,35 +70,27 @@ function BudgetValidator() {
 
     setLoading(true)
     setError(null)
+    setProgress(null)
+    setEnhancedItems([])
 
     try {
       const formData = new FormData()
       formData.append('file', file)
 
-      const response = await axios.post(
-        `${API_BASE_URL}/ai/enhance-bc3`,
-        formData,
-        {
-          headers: {
-            'Content-Type': 'multipart/form-data',
-          },
+      // Enhanced descriptions are shown as each AI request completes
+      await postEventStream(`${API_BASE_URL}/ai/enhance-bc3/stream`, formData, (event, data) => {
+        if (event === 'items') {
+          setEnhancedItems(items => [...items, ...data.items])
+        } else if (event === 'progress') {
+          setProgress(data)
+        } else if (event === 'result') {
+          // Download enhanced budget as JSON
+          downloadJSON(data, 'presupuesto_mejorado.json')
         }
-      )
-
-      // Download enhanced budget as JSON
-      const jsonStr = JSON.stringify(response.data, null, 2)
-      const blob = new Blob([jsonStr], { type: 'application/json' })
-      const url = window.URL.createObjectURL(blob)
-      const a = document.createElement('a')
-      a.href = url
-      a.download = `presupuesto_mejorado.json`
-      a.click()
-      window.URL.revokeObjectURL(url)
-
-      alert('Presupuesto mejorado descargado como JSON')
+      })
     } catch (err) {
       console.error('Enhancement error:', err)
-      setError(err.response?.data?.detail || 'Error al mejorar el presupuesto')
+      setError(err.message || 'Error al mejorar el presupuesto')
     } finally {
       setLoading(false)
     }
@@ -189,6 +185,36 @@ function BudgetValidator() {
           </button>
         </div>
 
+        {/* Enhancement Progress */}
+        {(progress || enhancedItems.length > 0) && (
+          <div className="mb-6 bg-green-50 border border-green-200 rounded-lg p-4">
+            {progress && (
+              <div className="mb-3">
+                <div className="flex justify-between text-sm text-green-900 mb-1">
+                  <span>Mejorando descripciones...</span>
+                  <span>{progress.percent}%</span>
+                </div>
+                <div className="w-full bg-green-100 rounded-full h-2">
+                  <div
+                    className="bg-green-600 h-2 rounded-full transition-all"
+                    style={{ width: `${progress.percent}%` }}
+                  />
+                </div>
+              </div>
+            )}
+            <h4 className="text-sm font-medium text-green-900 mb-2">
+              ✨ {enhancedItems.length} partidas mejoradas
+            </h4>
+            <ul className="max-h-64 overflow-y-auto space-y-1 text-sm text-green-800">
+              {enhancedItems.map((item, index) => (
+                <li key={index}>
+                  <span className="font-mono">{item.code}</span>: {item.description}
+                </li>
+              ))}
+            </ul>
+          </div>
+        )}
+
         {/* Validation Results */}
         {validationResult && (
           <div className="space-y-4">
@@ -1,5 +1,7 @@
 import React, { useState } from 'react'
 import axios from 'axios'
+import { postEventStream } from '../utils/eventStream'
+import { downloadJSON } from '../utils/download'
 
 const API_BASE_URL = '/api'
 
@@ -10,6 +12,8 @@ function FileConverter() {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState(null)
   const [success, setSuccess] = useState(null)
+  const [progress, setProgress] = useState(null)
+  const [extractedChapters, setExtractedChapters] = useState([])
 
   const conversionOptions = [
     { value: 'bc3-to-pdf', label: 'BC3 → PDF', accept: '.bc3' },
@@ -36,11 +40,30 @@ function FileConverter() {
     setLoading(true)
     setError(null)
     setSuccess(null)
+    setProgress(null)
+    setExtractedChapters([])
 
     try {
       const formData = new FormData()
       formData.append('file', file)
 
+      if (conversionType === 'pdf-to-json') {
+        // Chapters are shown as pages are read
+        await postEventStream(`${API_BASE_URL}/convert/pdf-to-json/stream`, formData, (event, data) => {
+          if (event === 'pages') {
+            setExtractedChapters(chapters => [...chapters, ...data.chapters])
+          } else if (event === 'progress') {
+            setProgress(data)
+          } else if (event === 'result') {
+            downloadJSON(data.budget, 'presupuesto.json')
+          }
+        })
+
+        setSuccess('Conversión completada con éxito')
+        setFile(null)
+        return
+      }
+
       let endpoint = ''
       let responseType = 'blob'
 
@@ -55,10 +78,6 @@ function FileConverter() {
           endpoint = `${API_BASE_URL}/convert/bc3-to-json`
           responseType = 'json'
           break
-        case 'pdf-to-json':
-          endpoint = `${API_BASE_URL}/convert/pdf-to-json`
-          responseType = 'json'
-          break
         default:
           throw new Error('Tipo de conversión no válido')
       }
@@ -96,7 +115,7 @@ function FileConverter() {
       setFile(null)
     } catch (err) {
       console.error('Conversion error:', err)
-      setError(err.response?.data?.detail || 'Error al convertir el archivo')
+      setError(err.response?.data?.detail || err.message || 'Error al convertir el archivo')
     } finally {
       setLoading(false)
     }
@@ -201,6 +220,33 @@ function FileConverter() {
           )}
         </div>
 
+        {/* Extraction Progress */}
+        {loading && (progress || extractedChapters.length > 0) && (
+          <div className="mb-4 bg-blue-50 border border-blue-200 rounded-lg p-4">
+            {progress && (
+              <div className="mb-3">
+                <div className="flex justify-between text-sm text-blue-900 mb-1">
+                  <span>Página {progress.done} de {progress.total}</span>
+                  <span>{progress.percent}%</span>
+                </div>
+                <div className="w-full bg-blue-100 rounded-full h-2">
+                  <div
+                    className="bg-primary-600 h-2 rounded-full transition-all"
+                    style={{ width: `${progress.percent}%` }}
+                  />
+                </div>
+              </div>
+            )}
+            <ul className="max-h-48 overflow-y-auto space-y-1 text-sm text-blue-800">
+              {extractedChapters.map((chapter, index) => (
+                <li key={index}>
+                  <span className="font-mono">{chapter.code}</span> {chapter.title} ({chapter.items.length} partidas)
+                </li>
+              ))}
+            </ul>
+          </div>
+        )}
+
         {/* Error Message */}
         {error && (
           <div className="mb-6 bg-red-50 border border-red-200 rounded-lg p-4">
@@ -0,0 +1,41 @@
+// POST a request and read its server-sent events as they arrive.
+// EventSource only supports GET, so the stream is parsed from fetch.
+export async function postEventStream(url, body, onEvent, { signal } = {}) {
+  const response = await fetch(url, {
+    method: 'POST',
+    body: body instanceof FormData ? body : JSON.stringify(body),
+    headers: body instanceof FormData ? {} : { 'Content-Type': 'application/json' },
+    signal,
+  })
+
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}))
+    throw new Error(data.detail || `Error ${response.status}`)
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+  let buffer = ''
+
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+
+    buffer += value
+    const frames = buffer.split('\n\n')
+    buffer = frames.pop()
+
+    for (const frame of frames) {
+      let event = 'message'
+      let data = ''
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (!data) continue
+
+      const payload = JSON.parse(data)
+      if (event === 'error') throw new Error(payload.detail)
+      onEvent(event, payload)
+    }
+  }
+}